@@ -1,16 +1,28 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
 import uuid
 import json
-
-from ingestion.pdf_loader import extract_text_from_pdf
-from ingestion.image_ocr import extract_text_from_image
-from ingestion.youtube_transcriber import extract_transcript
-from ingestion.social_scraper import extract_text_from_link
-from preprocessing.cleaner import clean_text
-from chunking.labeler import label_chunk
-from utils.graph import update_graph
+import threading
+import time
+import base64
+import gzip
+import hashlib
+import sys
+
+# Only modules that import quickly are loaded here. PDF/OCR/scraping libraries, FAISS and
+# the models are imported by the code paths that need them, so "/" answers within a second.
+from ingestion.youtube_transcriber import is_youtube_link
+from preprocessing.cleaner import clean_pages
+from chunking.embedder import get_embedding_service
+from chunking.backends import get_backend
+from chunking.labeler import DEFAULT_BACKEND, generation_stats, label_chunk, label_cache_stats
+from chunking.dedup import dedup_stats
+from utils.graph import get_graph_store, update_graph
+from jobs.job_queue import JobQueue, QueueFullError
+from memory.topic_index import TopicIndex
+from memory.chunk_store import labeled_path as document_labeled_path, write_records
+from graph.subgraph import CHILDREN_LIMIT, Hierarchy
 
 app = Flask(__name__)
 CORS(app)
@@ -19,6 +31,27 @@ RAW_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data/raw")
 PROCESSED_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data/processed"))
 LABELED_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data/labeled"))
 GRAPH_PATH = os.path.join(PROCESSED_DIR, "mindmap_graph.json")
+JOBS_DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data/jobs.sqlite"))
+
+# Ingestion runs in a background worker pool; only MODEL_CONCURRENCY jobs may label at once
+JOB_WORKERS = 2
+# Worker processes per PDF for page extraction; 0 extracts pages serially
+PDF_WORKERS = 0
+MAX_PENDING_JOBS = 16
+MODEL_CONCURRENCY = 1
+model_slots = threading.BoundedSemaphore(MODEL_CONCURRENCY)
+job_queue = None
+topic_index = None
+
+# JSON responses at least this large are gzipped for clients that accept it
+GZIP_MIN_BYTES = 1024
+
+# Optional warm-up in a background thread after the first request: "0" (the default) loads
+# everything on demand, "1" loads the vector index, the embedder and a centroid labeler,
+# "llm" also loads the LLM labeler (gigabytes of weights)
+WARMUP = os.environ.get("MINDMAP_WARMUP", "0")
+warmup_thread = None
+warmup_error = None
 
 os.makedirs(RAW_DIR, exist_ok=True)
 os.makedirs(PROCESSED_DIR, exist_ok=True)
@@ -30,11 +63,166 @@ def home():
     return "🧠 MindMap Backend Running"
 
 
+def summarize_pages(pages, length=500):
+    """Returns the first `length` characters of the cleaned text."""
+    summary = ""
+    for _, text in pages:
+        summary += (" " if summary else "") + text
+        if len(summary) > length:
+            return summary[:length] + "..."
+    return summary
+
+
+def save_clean_pages(pages, processed_path):
+    """Cleans (page_number, text) pairs, writes them to processed_path and returns the non-empty ones."""
+    cleaned_pages = []
+    with open(processed_path, "w", encoding="utf-8") as f:
+        for page_number, cleaned in clean_pages(page for page in pages if page[1]):
+            if cleaned_pages:
+                f.write(" ")
+            f.write(cleaned)
+            cleaned_pages.append((page_number, cleaned))
+    return cleaned_pages
+
+
+def run_ingest_job(payload, report):
+    """Runs extraction, cleaning, labeling and the graph update for one queued upload."""
+    from ingestion.pdf_loader import iter_pdf_pages
+    from ingestion.image_ocr import extract_text_from_image, iter_ocr_pdf_pages
+    from ingestion.youtube_transcriber import extract_transcript
+    from ingestion.social_scraper import extract_text_from_link, extract_texts_from_links
+    from memory.embedding_store import build_index_from_chunks
+
+    filename = payload["filename"]
+
+    report(stage="extracting")
+    if payload["type"] == "file":
+        raw_path = payload["raw_path"]
+        ext = filename.lower().split(".")[-1]
+        if ext == "pdf":
+            pages = iter_pdf_pages(raw_path, workers=PDF_WORKERS)
+        else:
+            pages = [(1, extract_text_from_image(raw_path))]
+    elif payload["type"] == "youtube":
+        pages = [(None, extract_transcript(payload["link"]))]
+    elif payload["type"] == "links":
+        # Fetched concurrently; each link becomes one page of the document
+        pages = list(enumerate(extract_texts_from_links(payload["links"]), start=1))
+    else:
+        pages = [(None, extract_text_from_link(payload["link"]))]
+
+    # Cleaning + Saving, page by page
+    report(stage="cleaning")
+    processed_path = os.path.join(PROCESSED_DIR, filename)
+    cleaned_pages = save_clean_pages(pages, processed_path)
+    if not cleaned_pages and payload["type"] == "file" and ext == "pdf":
+        # No text layer: a scanned PDF, so OCR the rendered pages
+        report(stage="ocr")
+        cleaned_pages = save_clean_pages(iter_ocr_pdf_pages(raw_path), processed_path)
+    if not cleaned_pages:
+        raise ValueError("No text extracted")
+    print(f"[✓] Cleaned text saved to {processed_path}")
+
+    # LLM labeling is limited to MODEL_CONCURRENCY jobs at a time so the model is not oversubscribed
+    backend = payload.get("labeler") or DEFAULT_BACKEND
+    document = os.path.splitext(filename)[0]
+    progress = lambda done, total: report(progress=done, total=total)
+    if backend == "llm":
+        report(stage="waiting for model")
+        with model_slots:
+            report(stage="labeling")
+            chunks = label_chunk(cleaned_pages, progress_callback=progress, backend=backend, document=document)
+    else:
+        report(stage="labeling")
+        chunks = label_chunk(cleaned_pages, progress_callback=progress, backend=backend, document=document)
+    print(f"[✓] label_chunk() returned {len(chunks)} chunks")
+
+    labeled_path = write_records(document_labeled_path(document, LABELED_DIR), chunks)
+    get_topic_index().index_file(labeled_path)
+
+    # Semantic index, held warm by this process for /api/search
+    report(stage="indexing")
+    build_index_from_chunks(labeled_path)
+
+    # Update graph
+    report(stage="updating graph")
+    update_graph(labeled_path, GRAPH_PATH)
+    print(f"[✓] Graph updated: {GRAPH_PATH}")
+
+    return {
+        "filename": filename,
+        "chunks": len(chunks),
+        "summary": summarize_pages(cleaned_pages)
+    }
+
+
+def get_topic_index():
+    global topic_index
+    if topic_index is None:
+        topic_index = TopicIndex()
+        # Pick up labeled files written while the server was down
+        topic_index.sync(LABELED_DIR)
+    return topic_index
+
+
+def get_job_queue():
+    global job_queue
+    if job_queue is None:
+        job_queue = JobQueue(JOBS_DB_PATH, run_ingest_job, max_workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS)
+        job_queue.start()
+    return job_queue
+
+
+def warm_up():
+    global warmup_error
+    started = time.perf_counter()
+    try:
+        from memory.embedding_store import get_store
+
+        get_store()
+        get_embedding_service().model
+        backend = get_backend(DEFAULT_BACKEND)
+        if backend.name != "llm" or WARMUP == "llm":
+            backend.load()
+        print(f"[✓] Warm-up finished in {time.perf_counter() - started:.1f}s.")
+    except Exception as e:
+        warmup_error = str(e)
+        print(f"[✗] Warm-up failed: {e}")
+
+
+def model_status():
+    embedding_store = sys.modules.get("memory.embedding_store")
+    return {
+        "labeler": get_backend(DEFAULT_BACKEND).loaded,
+        "embedder": get_embedding_service().loaded,
+        "vector_index": embedding_store is not None and embedding_store.store is not None,
+    }
+
+
+@app.before_request
+def start_background_services():
+    # Started on the first request rather than at import so the debug reloader's parent process stays idle
+    global warmup_thread
+    get_job_queue()
+    if WARMUP != "0" and warmup_thread is None:
+        warmup_thread = threading.Thread(target=warm_up, name="warmup", daemon=True)
+        warmup_thread.start()
+
+
+@app.route("/api/ready", methods=["GET"])
+def ready():
+    models = model_status()
+    # Without warm-up, models load on demand and the server is ready as soon as it answers
+    is_ready = WARMUP == "0" or (warmup_thread is not None and not warmup_thread.is_alive())
+    body = {"ready": is_ready and warmup_error is None, "models": models}
+    if warmup_error:
+        body["error"] = warmup_error
+    return jsonify(body), 200 if body["ready"] else 503
+
+
 @app.route("/api/ingest", methods=["POST"])
 def ingest():
     source_type = request.form.get("type")
-    text = None
-    filename = None
 
     try:
         # FILE
@@ -45,109 +233,166 @@ def ingest():
 
             filename = uploaded_file.filename
             ext = filename.lower().split(".")[-1]
+            if ext not in ["pdf", "jpg", "jpeg", "png"]:
+                return jsonify({"status": "error", "message": "Unsupported file type"}), 400
+
             raw_path = os.path.join(RAW_DIR, filename)
             uploaded_file.save(raw_path)
             print(f"[✓] File saved to {raw_path}")
-
-            if ext == "pdf":
-                text = extract_text_from_pdf(raw_path)
-            elif ext in ["jpg", "jpeg", "png"]:
-                text = extract_text_from_image(raw_path)
-            else:
-                return jsonify({"status": "error", "message": "Unsupported file type"}), 400
+            payload = {"type": "file", "filename": filename, "raw_path": raw_path}
 
         # LINK
         elif source_type == "link":
             link = request.form.get("link")
-            if "youtube.com" in link or "youtu.be" in link:
-                text = extract_transcript(link)
-                filename = f"youtube_{uuid.uuid4().hex[:8]}.txt"
+            if not link:
+                return jsonify({"status": "error", "message": "No link given"}), 400
+            if is_youtube_link(link):
+                payload = {"type": "youtube", "filename": f"youtube_{uuid.uuid4().hex[:8]}.txt", "link": link}
             else:
-                text = extract_text_from_link(link)
-                filename = f"link_{uuid.uuid4().hex[:8]}.txt"
+                payload = {"type": "link", "filename": f"link_{uuid.uuid4().hex[:8]}.txt", "link": link}
+
+        # LINKS, one per line, fetched concurrently into a single document
+        elif source_type == "links":
+            links = [link.strip() for link in request.form.get("links", "").splitlines() if link.strip()]
+            if not links:
+                return jsonify({"status": "error", "message": "No links given"}), 400
+            payload = {"type": "links", "filename": f"links_{uuid.uuid4().hex[:8]}.txt", "links": links}
         else:
             return jsonify({"status": "error", "message": "Invalid type"}), 400
 
-        # Cleaning + Saving
-        if not text:
-            return jsonify({"status": "error", "message": "No text extracted"}), 500
-
-        cleaned = clean_text(text)
-        processed_path = os.path.join(PROCESSED_DIR, filename)
-        with open(processed_path, "w", encoding="utf-8") as f:
-            f.write(cleaned)
-        print(f"[✓] Cleaned text saved to {processed_path}")
-
-        # Labeling
-        print("[DEBUG] calling label_chunk()")
-        chunks = label_chunk(cleaned)
-        print(f"[DEBUG] label_chunk() returned {len(chunks)} chunks")
-
-        labeled_path = os.path.join(LABELED_DIR, filename.replace(".txt", "_labeled.jsonl"))
-        with open(labeled_path, "w", encoding="utf-8") as f:
-            for chunk in chunks:
-                json.dump(chunk, f)
-                f.write("\n")
-        # Update graph
-        update_graph(labeled_path, GRAPH_PATH)
-        print(f"[✓] Graph updated: {GRAPH_PATH}")
+        # Optional per-job labeler backend, e.g. "centroid" for the fast path
+        backend = request.form.get("labeler")
+        if backend:
+            get_backend(backend)
+            payload["labeler"] = backend
 
+        job_id = get_job_queue().submit(payload)
+        print(f"[✓] Queued job {job_id} for {payload['filename']}")
         return jsonify({
-            "status": "success",
-            "filename": filename,
-            "summary": cleaned[:500] + "..." if len(cleaned) > 500 else cleaned
-        })
-
+            "status": "queued",
+            "job_id": job_id,
+            "filename": payload["filename"]
+        }), 202
+
+    except QueueFullError as e:
+        return jsonify({"status": "error", "message": str(e)}), 429
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         print(f"[✗] Error: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@app.route("/api/jobs", methods=["GET"])
+def list_jobs():
+    limit = request.args.get("limit", 50, type=int)
+    return jsonify(get_job_queue().list(limit))
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(job)
+
+
+def cached_json_response(etag, build):
+    """
+    JSON response with a weak ETag: answers 304 without calling build() when
+    the client already has this version, and gzips larger bodies.
+    build() returns the payload, or bytes that are already JSON.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        body = build()
+        if not isinstance(body, bytes):
+            body = json.dumps(body, separators=(",", ":")).encode("utf-8")
+        response = Response(body, mimetype="application/json")
+        if len(body) >= GZIP_MIN_BYTES and "gzip" in request.accept_encodings:
+            response.set_data(gzip.compress(body, 6))
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag, weak=True)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def hierarchy_etag():
+    # The topic index version changes with every indexed file, so it covers every hierarchy query
+    key = f"{get_topic_index().version()}:{request.full_path}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
 @app.route("/api/graph", methods=["GET"])
 def get_graph():
     try:
-        return send_file(GRAPH_PATH)
+        body = get_graph_store(GRAPH_PATH).to_json_bytes()
+        return cached_json_response(hashlib.sha1(body).hexdigest(), lambda: body)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def hierarchy_query(query):
+    """Runs a Hierarchy query for the ?id= node, with 404/400 handling and caching."""
+    node = request.args.get("id", "")
+
+    def build():
+        payload = query(Hierarchy(get_topic_index()), node)
+        if payload is None:
+            raise LookupError("Node not found")
+        return payload
+
+    try:
+        return cached_json_response(hierarchy_etag(), build)
+    except LookupError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
-    
+
+
+# One level of the subject -> topic -> subtopic -> chunk hierarchy at a time; see graph/subgraph.py for node ids
+@app.route("/api/graph/node", methods=["GET"])
+def get_graph_node():
+    fields = [field for field in request.args.get("fields", "").split(",") if field]
+    return hierarchy_query(lambda hierarchy, node: hierarchy.node(node, fields))
+
+
+@app.route("/api/graph/children", methods=["GET"])
+def get_graph_children():
+    limit = request.args.get("limit", CHILDREN_LIMIT, type=int)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    return hierarchy_query(lambda hierarchy, node: hierarchy.children(node, max(limit, 1), offset))
+
+
+@app.route("/api/graph/subtree", methods=["GET"])
+def get_graph_subtree():
+    depth = request.args.get("depth", 1, type=int)
+    return hierarchy_query(lambda hierarchy, node: hierarchy.subtree(node, max(depth, 0)))
+
+
+@app.route("/api/graph/neighbors", methods=["GET"])
+def get_graph_neighbors():
+    return hierarchy_query(lambda hierarchy, node: hierarchy.neighbors(node))
+
+
 @app.route("/api/topics", methods=["GET"])
 def get_topics():
-    labeled_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data/labeled"))
-    topics = set()
-
     try:
-        for filename in os.listdir(labeled_dir):
-            if filename.endswith(".jsonl"):
-                with open(os.path.join(labeled_dir, filename), "r", encoding="utf-8") as f:
-                    for line in f:
-                        try:
-                            obj = json.loads(line)
-                            if "label" in obj:
-                                topics.add(obj["label"])
-                        except:
-                            continue
-        return jsonify(sorted(list(topics)))
+        return jsonify(get_topic_index().topics())
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
 @app.route("/api/topic/<label>", methods=["GET"])
 def get_topic(label):
-    labeled_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data/labeled"))
     label = label.strip()
-    summaries = []
 
     try:
-        for filename in os.listdir(labeled_dir):
-            if filename.endswith(".jsonl"):
-                with open(os.path.join(labeled_dir, filename), "r", encoding="utf-8") as f:
-                    for line in f:
-                        try:
-                            obj = json.loads(line)
-                            if obj.get("label") == label and obj.get("summary"):
-                                summaries.append(obj["summary"])
-                        except:
-                            continue
+        summaries = [r["summary"] for r in get_topic_index().records(label) if r["summary"]]
 
         if not summaries:
             return jsonify({"status": "error", "message": "Topic not found"}), 404
@@ -166,6 +411,72 @@ def get_topic(label):
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+
+def decode_cursor(cursor):
+    return int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"])
+
+
+@app.route("/api/search", methods=["GET"])
+def search():
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"status": "error", "message": "Missing query"}), 400
+
+    try:
+        limit = min(max(request.args.get("limit", 10, type=int), 1), 100)
+        cursor = request.args.get("cursor")
+        offset = decode_cursor(cursor) if cursor else 0
+    except (ValueError, KeyError, TypeError):
+        return jsonify({"status": "error", "message": "Invalid limit or cursor"}), 400
+
+    try:
+        from memory.embedding_store import SEARCH_MODE, SEARCH_MODES, search_chunks
+
+        mode = request.args.get("mode", SEARCH_MODE)
+        if mode not in SEARCH_MODES:
+            return jsonify({"status": "error", "message": f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+        min_score = request.args.get("min_score", type=float)
+        if min_score is not None and mode == "keyword":
+            return jsonify({"status": "error", "message": "min_score only applies to vector and hybrid search"}), 400
+
+        started = time.perf_counter()
+        results, has_more = search_chunks(
+            query,
+            limit=limit,
+            offset=offset,
+            subject=request.args.get("subject"),
+            topic=request.args.get("topic"),
+            doc_id=request.args.get("source"),
+            min_score=min_score,
+            mode=mode,
+        )
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        if request.args.get("include_text") != "1":
+            results = [{k: v for k, v in r.items() if k != "text"} for r in results]
+
+        return jsonify({
+            "query": query,
+            "mode": mode,
+            "results": results,
+            "next_cursor": encode_cursor(offset + limit) if has_more else None,
+            "latency_ms": round(latency_ms, 2)
+        })
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route("/api/cache", methods=["GET"])
+def get_cache_stats():
+    try:
+        return jsonify({"labels": label_cache_stats(), "generation": generation_stats(), "dedup": dedup_stats()})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
 @app.route("/api/resources", methods=["GET"])
 def find_resources():
     query = request.args.get("q", "").lower()
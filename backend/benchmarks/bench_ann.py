@@ -0,0 +1,71 @@
+"""
+Recall@k vs. QPS of the approximate index types against the exact flat index
+on a synthetic clustered corpus of MiniLM-sized vectors.
+
+    python -m benchmarks.bench_ann --vectors 200000 --queries 1000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from memory.embedding_store import EMBEDDING_DIM, make_index, set_search_params
+
+
+def synthetic_corpus(n, dim, clusters=256, seed=0):
+    """Gaussian clusters on the unit sphere, roughly how sentence embeddings are distributed."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    vectors = centers[rng.integers(0, clusters, n)] + 0.35 * rng.standard_normal((n, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def recall_at_k(found, truth, k):
+    hits = sum(len(set(f[:k]) & set(t[:k])) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def timed_search(index, queries, k):
+    started = time.perf_counter()
+    _, found = index.search(queries, k)
+    return found, len(queries) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.vectors + args.queries, EMBEDDING_DIM)
+    vectors, queries = corpus[:args.vectors], corpus[args.vectors:]
+    ids = np.arange(len(vectors), dtype="int64")
+
+    flat = make_index("flat", EMBEDDING_DIM)
+    flat.add_with_ids(vectors, ids)
+    truth, flat_qps = timed_search(flat, queries, args.k)
+
+    print(f"{'index':<10} {'knob':<16} {'build s':>8} {'recall@' + str(args.k):>10} {'QPS':>10}")
+    print(f"{'flat':<10} {'-':<16} {'-':>8} {1.0:>10.3f} {flat_qps:>10.0f}")
+
+    sweeps = {
+        "hnsw": ("ef_search", [16, 32, 64, 128, 256]),
+        "ivf_flat": ("nprobe", [1, 4, 16, 64]),
+        "ivf_pq": ("nprobe", [1, 4, 16, 64]),
+    }
+    for index_type, (knob, values) in sweeps.items():
+        started = time.perf_counter()
+        index = make_index(index_type, EMBEDDING_DIM, vectors)
+        index.add_with_ids(vectors, ids)
+        build_seconds = time.perf_counter() - started
+        for value in values:
+            set_search_params(index, **{knob: value})
+            found, qps = timed_search(index, queries, args.k)
+            recall = recall_at_k(found, truth, args.k)
+            print(f"{index_type:<10} {f'{knob}={value}':<16} {build_seconds:>8.1f} {recall:>10.3f} {qps:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
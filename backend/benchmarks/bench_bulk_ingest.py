@@ -0,0 +1,114 @@
+"""
+Smoke check of the bulk ingestion pipeline (bulk_ingest.run) on a few
+generated PDFs, labeled with the centroid backend and a small taxonomy
+learned from seed labels, so no LLM is needed. Everything it writes
+(labeled files, topic index, vector index, graph, dedup index,
+checkpoint) goes to a temporary directory.
+
+It checks that every document goes through extraction, labeling and
+output, that labels keep their page numbers, and that a second run
+resumes from the checkpoint without ingesting anything again. Exits with
+status 1 if a check fails.
+
+    python -m benchmarks.bench_bulk_ingest --documents 4
+"""
+import argparse
+import functools
+import os
+import shutil
+import sys
+import tempfile
+
+import fitz
+
+import bulk_ingest
+import main as pipeline
+from chunking import dedup
+from chunking.backends import CentroidLabeler, Taxonomy, register_backend
+from memory import embedding_store
+from memory.chunk_store import read_records
+from memory.topic_index import TopicIndex
+
+# (subject, topic, subtopic, sentence) the seed taxonomy is learned from and the PDFs are written with
+SEED_LABELS = [
+    ("Biology", "Genetics", "Inheritance", "Genes are passed from parents to offspring through inheritance."),
+    ("Biology", "Ecology", "Food Webs", "Food webs describe which organisms eat which in an ecosystem."),
+    ("History", "World War II", "D-Day", "Allied troops landed on the beaches of Normandy on D-Day in 1944."),
+    ("Physics", "Optics", "Refraction", "Light bends when it passes from air into water, which is refraction."),
+]
+
+
+def seed_taxonomy():
+    return Taxonomy.learn([{"subject": subject, "topic": topic, "subtopic": subtopic, "text": text}
+                           for subject, topic, subtopic, text in SEED_LABELS])
+
+
+def write_pdfs(directory, count):
+    """PDFs of two pages each, every page a few sentences on one seed topic."""
+    paths = []
+    for n in range(count):
+        path = os.path.join(directory, f"document_{n}.pdf")
+        with fitz.open() as document:
+            for page in range(2):
+                sentence = SEED_LABELS[(n + page) % len(SEED_LABELS)][3]
+                document.new_page().insert_textbox(fitz.Rect(72, 72, 540, 720), " ".join([sentence] * 6), fontsize=11)
+            document.save(path)
+        paths.append(path)
+    return paths
+
+
+failures = []
+
+
+def check(name, ok, detail=""):
+    print(f"[✓] {name}" if ok else f"[ERROR] {name} {detail}")
+    if not ok:
+        failures.append(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--extract-workers", type=int, default=2)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    saved = (pipeline.LABELED_DIR, bulk_ingest.GRAPH_PATH, bulk_ingest.TopicIndex,
+             embedding_store.store, dedup.dedup_index)
+    try:
+        pipeline.LABELED_DIR = os.path.join(directory, "labeled")
+        bulk_ingest.GRAPH_PATH = os.path.join(directory, "mindmap_graph.json")
+        bulk_ingest.TopicIndex = functools.partial(TopicIndex, os.path.join(directory, "topic_index.sqlite"))
+        embedding_store.store = embedding_store.VectorStore(os.path.join(directory, "index"))
+        dedup.dedup_index = dedup.DedupIndex(os.path.join(directory, "dedup.sqlite"))
+        register_backend(CentroidLabeler(taxonomy=seed_taxonomy()))
+
+        os.makedirs(os.path.join(directory, "raw"))
+        sources = [("pdf", path) for path in write_pdfs(os.path.join(directory, "raw"), args.documents)]
+        checkpoint = os.path.join(directory, "checkpoint.jsonl")
+
+        stats = bulk_ingest.run(sources, args.extract_workers, checkpoint, labeler="centroid")
+        for stage in ("extract", "label", "output"):
+            check(f"{stage}: every document, none failed",
+                  stats[stage].documents == len(sources) and not stats[stage].failures,
+                  f"({stats[stage].documents} docs, {stats[stage].failures} failed)")
+
+        labeled = [os.path.join(pipeline.LABELED_DIR, name) for name in sorted(os.listdir(pipeline.LABELED_DIR))]
+        records = [record for path in labeled for record in read_records(path)]
+        check("labels keep their page numbers", records and all(record.get("page_start") for record in records))
+
+        again = bulk_ingest.run(sources, args.extract_workers, checkpoint, labeler="centroid")
+        check("a second run resumes from the checkpoint", again["extract"].documents == 0)
+    finally:
+        (pipeline.LABELED_DIR, bulk_ingest.GRAPH_PATH, bulk_ingest.TopicIndex,
+         embedding_store.store, dedup.dedup_index) = saved
+        register_backend(CentroidLabeler())
+        shutil.rmtree(directory)
+
+    if failures:
+        print(f"[ERROR] {len(failures)} checks failed.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Labeled-chunk storage: per-document JSONL against the Arrow stream files of
+memory.chunk_store, on synthetic documents with chunk-sized text.
+
+- size: bytes on disk for every document
+- full read: every field of every record, as the embedding index reads them
+- label scan: subject/topic/subtopic/title/label only, as the topic index,
+  taxonomy and graph read them; JSONL has to parse whole lines for it
+- random row: one record by row number, as chunk detail requests read them
+- append: adding one batch of chunks to an existing document
+
+    python -m benchmarks.bench_chunk_store --documents 200 --chunks 200
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from memory.chunk_store import LABEL_COLUMNS, append_records, labeled_path, pa, read_record, read_records, write_records
+
+WORDS = ("model image feature layer training network pixel filter gradient loss edge vector camera "
+         "depth scene object detection segmentation kernel convolution").split()
+
+
+def synthetic_document(doc, chunks, text_words):
+    rng = random.Random(doc)
+    return [{
+        "subject": f"Subject {rng.randrange(20)}",
+        "topic": f"Topic {rng.randrange(50)}",
+        "subtopic": f"Subtopic {rng.randrange(10)}",
+        "title": f"Chunk {i} of document {doc}",
+        "summary": " ".join(rng.choice(WORDS) for _ in range(40)),
+        "text": " ".join(rng.choice(WORDS) for _ in range(text_words)),
+        "page_start": i, "page_end": i + 1,
+    } for i in range(chunks)]
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=200, help="chunks per document")
+    parser.add_argument("--text-words", type=int, default=350, help="words of text per chunk")
+    args = parser.parse_args()
+    if pa is None:
+        parser.error("pyarrow is not installed")
+
+    directory = tempfile.mkdtemp()
+    try:
+        paths = {"jsonl": [], "arrows": []}
+        for doc in range(args.documents):
+            records = synthetic_document(doc, args.chunks, args.text_words)
+            for fmt in paths:
+                paths[fmt].append(write_records(labeled_path(f"doc{doc}", directory, fmt), records))
+        total = args.documents * args.chunks
+        print(f"{args.documents} documents, {total} chunks")
+
+        rng = random.Random(0)
+        rows = [(rng.randrange(args.documents), rng.randrange(args.chunks)) for _ in range(200)]
+        extra = synthetic_document(args.documents, 20, args.text_words)
+        results = {}
+        for fmt, files in paths.items():
+            results[fmt] = {
+                "size (MB)": sum(os.path.getsize(path) for path in files) / 1024 ** 2,
+                "full read (s)": timed(lambda: [read_records(path) for path in files]),
+                "label scan (s)": timed(lambda: [read_records(path, LABEL_COLUMNS) for path in files]),
+                "random row (ms)": 1000 * timed(lambda: [read_record(files[d], i) for d, i in rows]) / len(rows),
+            }
+            target = files[0]
+            started = time.perf_counter()
+            for _ in range(10):
+                append_records(target, extra)
+            results[fmt]["append 20 (ms)"] = 100 * (time.perf_counter() - started)
+            assert len(read_records(target)) == args.chunks + 200
+
+        print(f"{'':<18}{'jsonl':>12}{'arrow':>12}{'speedup':>10}")
+        for metric in results["jsonl"]:
+            before, after = results["jsonl"][metric], results["arrows"][metric]
+            print(f"{metric:<18}{before:>12.3f}{after:>12.3f}{before / after:>9.1f}x")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
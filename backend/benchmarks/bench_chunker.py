@@ -0,0 +1,57 @@
+"""
+Chunk count, token fill and speed of the token-aware chunker against the
+previous fixed 500-word windows, on the texts in data/processed. Fewer
+chunks means fewer LLM calls per document; "over budget" counts chunks
+that would not fit the model's context window next to the prompt.
+
+    python -m benchmarks.bench_chunker --repeat 20
+"""
+import argparse
+import os
+import time
+
+from chunking.labeler import chunk_pages, chunk_token_budget, get_tokenizer
+
+PROCESSED_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/processed"))
+
+
+def word_windows(text, size=500):
+    # The chunker label_chunk used before, including its 150-character tail filter
+    words = text.split()
+    chunks = [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+    return [chunk for chunk in chunks if len(chunk) > 150]
+
+
+def report(name, chunks, seconds, budget):
+    counts = [len(ids) for ids in get_tokenizer()(chunks)["input_ids"]] if chunks else [0]
+    over = sum(1 for count in counts if count > budget)
+    print(f"{name:<14} {len(chunks):>7} chunks {sum(counts) / len(counts):>8.0f} avg tokens "
+          f"{100 * sum(counts) / (len(counts) * budget):>6.0f}% fill {over:>5} over budget {seconds:>8.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10, help="concatenate the corpus this many times")
+    args = parser.parse_args()
+
+    texts = []
+    for filename in sorted(os.listdir(PROCESSED_DIR)):
+        path = os.path.join(PROCESSED_DIR, filename)
+        if os.path.isfile(path) and not filename.endswith(".json"):
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                texts.append(f.read())
+    text = " ".join(texts * args.repeat)
+    budget = chunk_token_budget()
+    print(f"{len(text.split())} words, chunk budget {budget} tokens")
+
+    started = time.perf_counter()
+    chunks = word_windows(text)
+    report("500 words", chunks, time.perf_counter() - started, budget)
+
+    started = time.perf_counter()
+    chunks = [chunk for chunk, _, _ in chunk_pages([(1, text)], budget)]
+    report("token packed", chunks, time.perf_counter() - started, budget)
+
+
+if __name__ == "__main__":
+    main()
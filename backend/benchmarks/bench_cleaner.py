@@ -0,0 +1,89 @@
+"""
+Throughput and peak memory of the translate-table cleaner against the
+previous two-pass regex clean_text, on the texts in data/processed cut into
+pages and repeated up to the requested size. The streaming run writes the
+corpus to a temporary file and cleans it block by block with clean_segments.
+
+    python -m benchmarks.bench_cleaner --mb 200
+"""
+import argparse
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+
+from preprocessing.cleaner import clean_segments, clean_text, iter_file_segments
+
+PROCESSED_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/processed"))
+
+
+def regex_clean(text):
+    # clean_text before the translate table
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'[^a-zA-Z0-9.,;!?()\[\]\-\'\"\n ]', '', text)
+    return text.strip()
+
+
+PAGE_CHARS = 3000
+
+
+def sample_pages(mb):
+    texts = []
+    for filename in sorted(os.listdir(PROCESSED_DIR)):
+        path = os.path.join(PROCESSED_DIR, filename)
+        if os.path.isfile(path) and not filename.endswith(".json"):
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                texts.append(f.read())
+    # Some non-ASCII text, which the regex cleaner deletes
+    texts.append("Café, naïve façade. Überblick über die Straße. Обработка текста. 東京の画像認識。 ﬁnal ½ — ✓")
+    text = " ".join(texts)
+    pages = [text[i:i + PAGE_CHARS] for i in range(0, len(text), PAGE_CHARS)]
+    return pages * max(1, int(mb * 1024 * 1024 / len(text)))
+
+
+def clean_all(clean, pages):
+    return [clean(page) for page in pages]
+
+
+def timed(label, clean, text, size_mb):
+    started = time.perf_counter()
+    result = clean(text)
+    elapsed = time.perf_counter() - started
+    # Memory in a second run: tracing allocations slows the cleaners down
+    tracemalloc.start()
+    clean(text)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<22} {size_mb / elapsed:>8.1f} MB/s {peak / 1024 ** 2:>10.1f} MB peak")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=50, help="approximate corpus size")
+    args = parser.parse_args()
+
+    pages = sample_pages(args.mb)
+    size_mb = sum(len(page.encode("utf-8")) for page in pages) / 1024 ** 2
+    print(f"{size_mb:.1f} MB of text in {len(pages)} pages")
+
+    before = timed("regex (previous)", lambda p: clean_all(regex_clean, p), pages, size_mb)
+    ascii_pages = timed("table, ascii", lambda p: clean_all(lambda t: clean_text(t, keep="ascii", normalize=None), p),
+                        pages, size_mb)
+    timed("table, letters+NFKC", lambda p: clean_all(clean_text, p), pages, size_mb)
+    same = all(" ".join(a.split()) == b for a, b in zip(before, ascii_pages))
+    print(f"ascii output matches the previous one up to whitespace runs: {same}")
+
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".txt", delete=False) as f:
+        f.write("".join(pages))
+    del pages, before, ascii_pages
+    try:
+        timed("streamed, letters+NFKC", lambda path: sum(len(s) for s in clean_segments(iter_file_segments(path))),
+              f.name, size_mb)
+    finally:
+        os.remove(f.name)
+
+
+if __name__ == "__main__":
+    main()
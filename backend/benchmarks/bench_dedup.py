@@ -0,0 +1,107 @@
+"""
+Near-duplicate detection on a synthetic stream of ingests with the overlap
+users produce: lectures ingested twice with light edits (transcript vs.
+slides), exact re-uploads under another name, and a boilerplate chunk shared
+by every scraped page.
+
+For each threshold it reports how many chunks were found to be duplicates
+and how many of those were true near-duplicates, i.e. had exact shingle
+Jaccard similarity of at least the threshold with the chunk they were
+mapped to. It also reports the true near-duplicates that were missed and
+the lookup cost per chunk. Every duplicate is one labeling call (an LLM
+call with the llm labeler) and one vector saved.
+
+    python -m benchmarks.bench_dedup --documents 200 --thresholds 0.5 0.8 0.9
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from chunking.dedup import DedupIndex, DocumentDedup, shingles
+
+CHUNKS_PER_DOCUMENT = 20
+CHUNK_WORDS = 300
+VOCABULARY = [f"w{i}" for i in range(20000)]
+
+
+def edited(text, rng, rate):
+    """The text with a fraction of its words replaced, as a re-typed or re-transcribed copy."""
+    return " ".join(rng.choice(VOCABULARY) if rng.random() < rate else word for word in text.split())
+
+
+def synthetic_ingests(documents, seed=0):
+    """Yields (document name, chunks, the chunk each one copies or None) in ingest order."""
+    rng = random.Random(seed)
+    boilerplate = " ".join(rng.choice(VOCABULARY) for _ in range(CHUNK_WORDS))
+    originals, boilerplate_seen = [], False
+    for doc in range(documents):
+        kind = rng.random()
+        if originals and kind < 0.35:
+            source = rng.choice(originals)
+            # Re-uploads are exact copies, re-transcriptions have some words changed
+            rate = 0.0 if kind < 0.1 else rng.choice([0.01, 0.03, 0.1, 0.3])
+            yield f"doc{doc}", [edited(chunk, rng, rate) for chunk in source], list(source)
+            continue
+        chunks = [" ".join(rng.choice(VOCABULARY) for _ in range(CHUNK_WORDS)) for _ in range(CHUNKS_PER_DOCUMENT)]
+        sources = [None] * len(chunks)
+        if rng.random() < 0.3:
+            chunks[-1] = boilerplate
+            sources[-1] = boilerplate if boilerplate_seen else None
+            boilerplate_seen = True
+        originals.append(chunks)
+        yield f"doc{doc}", chunks, sources
+
+
+def jaccard(a, b):
+    a, b = set(shingles(a).tolist()), set(shingles(b).tolist())
+    return len(a & b) / len(a | b)
+
+
+def run(threshold, documents, directory):
+    index = DedupIndex(os.path.join(directory, f"dedup-{threshold}.sqlite"), threshold=threshold)
+    texts = {}
+    chunks_seen = found = correct = missed = 0
+    elapsed = 0.0
+    for document, chunks, sources in synthetic_ingests(documents):
+        started = time.perf_counter()
+        dedup = DocumentDedup(document, "llm", index)
+        pending = dedup.plan(chunks)
+        results = [[{"subject": "s", "title": chunk[:12]}] if i in pending else [] for i, chunk in enumerate(chunks)]
+        dedup.finish(results)
+        elapsed += time.perf_counter() - started
+        chunks_seen += len(chunks)
+
+        for i, chunk_id in dedup.new_ids.items():
+            texts[chunk_id] = chunks[i]
+        for i in list(dedup.matches) + list(dedup.copies):
+            target = dedup.duplicate_of(i)
+            if target is not None:
+                found += 1
+                correct += jaccard(chunks[i], texts[target]) >= threshold
+        missed += sum(1 for i in pending if sources[i] is not None and jaccard(chunks[i], sources[i]) >= threshold)
+    return chunks_seen, found, correct, missed, 1000 * elapsed / chunks_seen, index.stats()["llm_calls_saved"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.8, 0.9])
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        print(f"{'threshold':>10}{'chunks':>8}{'dups':>7}{'precision':>11}{'missed':>8}{'ms/chunk':>10}{'LLM calls saved':>17}")
+        for threshold in args.thresholds:
+            chunks, found, correct, missed, ms, saved = run(threshold, args.documents, directory)
+            precision = correct / found if found else 1.0
+            print(f"{threshold:>10.2f}{chunks:>8}{found:>7}{precision:>11.3f}{missed:>8}{ms:>10.2f}"
+                  f"{saved:>11} ({saved / chunks:.0%})")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
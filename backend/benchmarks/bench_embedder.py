@@ -0,0 +1,83 @@
+"""
+Embedding throughput of the previous path (one default model.encode call)
+against the embedding service's batched, multi-process, int8 and ONNX modes,
+on sentences taken from data/processed. Quantized runtimes also report their
+mean cosine similarity to the fp32 embeddings.
+
+    python -m benchmarks.bench_embedder --texts 5000 --processes 4
+"""
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from chunking.embedder import MODEL_NAME, EmbeddingService
+
+PROCESSED_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/processed"))
+
+
+def sample_texts(n):
+    sentences = []
+    for filename in sorted(os.listdir(PROCESSED_DIR)):
+        if filename.endswith(".txt"):
+            with open(os.path.join(PROCESSED_DIR, filename), "r", encoding="utf-8") as f:
+                sentences += [s.strip() for s in re.split(r"(?<=[.!?])\s+", f.read()) if len(s.strip()) > 20]
+    if not sentences:
+        sentences = [f"sample sentence number {i} about deep learning" for i in range(100)]
+    # Make every text unique so nothing is served from a cache
+    return [f"{sentences[i % len(sentences)]} ({i})" for i in range(n)]
+
+
+def timed(label, encode, texts, reference=None):
+    started = time.perf_counter()
+    vectors = np.asarray(encode(texts), dtype="float32")
+    elapsed = time.perf_counter() - started
+    line = f"{label:<28} {len(texts) / elapsed:>10.1f} texts/s"
+    if reference is not None:
+        normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        line += f"   cosine vs fp32 {np.mean(np.sum(normed * reference, axis=1)):.4f}"
+    print(line)
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    texts = sample_texts(args.texts)
+
+    baseline = SentenceTransformer(MODEL_NAME)
+    reference = timed("model.encode (previous)", baseline.encode, texts)
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+
+    for batch_size in (32, 128):
+        service = EmbeddingService(batch_size=batch_size, cache_path=None)
+        timed(f"service batch={batch_size}", service.encode_documents, texts)
+
+    service = EmbeddingService(processes=args.processes, cache_path=None)
+    timed(f"service processes={args.processes}", service.encode_documents, texts)
+    service.close()
+
+    for runtime in ("int8", "onnx"):
+        try:
+            service = EmbeddingService(runtime=runtime, cache_path=None)
+            timed(f"service runtime={runtime}", service.encode_documents, texts, reference)
+        except Exception as e:
+            print(f"service runtime={runtime:<12} unavailable: {e}")
+
+    # A second pass over the same texts is served entirely from the disk cache
+    cache_dir = tempfile.mkdtemp()
+    service = EmbeddingService(cache_path=os.path.join(cache_dir, "embeddings.sqlite"))
+    service.encode_documents(texts)
+    timed("service disk cache (warm)", service.encode_documents, texts)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
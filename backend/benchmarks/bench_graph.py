@@ -0,0 +1,90 @@
+"""
+Load, merge and serialization costs of the mind-map graph at ~100k nodes,
+on synthetic labeled documents.
+
+- merge: time to merge one more document into the large graph with
+  GraphEngine, against rebuilding a networkx graph of everything (what
+  per-file build_graph + export amounted to once the global graph is kept)
+- load: time to read the compacted snapshot back into a fresh store
+- serialize: size and time of the compact snapshot against indent=4 JSON
+
+    python -m benchmarks.bench_graph --nodes 100000
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from graph.mindmap_builder import GraphEngine, document_graph
+from utils.graph import GraphStore, orjson
+
+CHUNKS_PER_DOCUMENT = 100
+
+
+def synthetic_document(doc, subjects=20, topics=50, subtopics=10):
+    return [{
+        "subject": f"Subject {(doc + i) % subjects}",
+        "topic": f"Topic {(doc * 7 + i) % topics}",
+        "subtopic": f"Subtopic {i % subtopics}",
+        "title": f"Chunk {i} of document {doc}",
+        "summary": "A short summary of the chunk, about as long as the ones the labeler writes. " * 2,
+    } for i in range(CHUNKS_PER_DOCUMENT)]
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    result = fn()
+    print(f"{label:<36} {1000 * (time.perf_counter() - started):>10.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=100000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        graph_path = os.path.join(directory, "graph.json")
+        engine = GraphEngine(graph_path)
+        documents = max(1, args.nodes // CHUNKS_PER_DOCUMENT)
+        started = time.perf_counter()
+        for doc in range(documents):
+            nodes, links = document_graph(synthetic_document(doc), f"doc{doc}")
+            engine.store.append(nodes, links, document=f"doc{doc}")
+        print(f"built {engine.store.node_count()} nodes from {documents} documents in "
+              f"{time.perf_counter() - started:.1f}s (orjson: {orjson is not None})")
+        engine.store.compact()
+
+        extra = synthetic_document(documents)
+        timed("merge 1 document (GraphEngine)", lambda: engine.merge(extra, f"doc{documents}"))
+        timed("re-merge the same document", lambda: engine.merge(extra, f"doc{documents}"))
+        try:
+            import networkx as nx
+
+            def rebuild():
+                G = nx.DiGraph()
+                for doc in range(documents + 1):
+                    nodes, links = document_graph(synthetic_document(doc), f"doc{doc}")
+                    G.add_nodes_from((node["id"], node) for node in nodes)
+                    G.add_edges_from((link["source"], link["target"]) for link in links)
+                return G
+
+            timed("rebuild everything (networkx)", rebuild)
+        except ImportError:
+            print("networkx not installed; skipping the rebuild comparison")
+
+        engine.store.compact()
+        timed("load snapshot", lambda: GraphStore(graph_path).node_count())
+        body = timed("serialize compact", engine.to_json_bytes)
+        graph = json.loads(body)
+        indented = timed("serialize json indent=4", lambda: json.dumps(graph, indent=4).encode("utf-8"))
+        print(f"snapshot size: compact {len(body) / 1024 ** 2:.1f} MB, indent=4 {len(indented) / 1024 ** 2:.1f} MB")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
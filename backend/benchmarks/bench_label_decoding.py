@@ -0,0 +1,281 @@
+"""
+Parity and prefill cost of the labeler's cached structured decoding
+(chunking.labeler.DecodingSession) against a reference that re-tokenizes
+the whole answer so far for every field and runs model.generate on each
+chunk on its own, with no prompt prefix cache and no batching.
+
+It checks that both give the same greedy field values and the same
+decisions to continue the array with another topic, with and without the
+prompt prefix cache, and that the free-form path generates the same
+tokens. Exits with status 1 on a mismatch.
+
+--tiny trains a small GPT-NeoX with a byte-level BPE tokenizer on label
+JSON for about a minute on CPU instead of loading MODEL_NAME, so the check
+runs offline; its labels are poor, but its values close and its arrays
+continue like the real model's.
+
+    python -m benchmarks.bench_label_decoding --tiny
+    python -m benchmarks.bench_label_decoding --chunks 8
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from chunking import labeler
+
+PROCESSED_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/processed"))
+
+# Label tree the tiny model's training chunks are written from
+TINY_TAXONOMY = {
+    "Biology": {"Genetics": ["Inheritance", "Mutation"], "Ecology": ["Food Webs", "Succession"]},
+    "History": {"World War II": ["D-Day", "The Blitz"], "Ancient Rome": ["The Republic", "The Empire"]},
+    "Computer Science": {"Machine Learning": ["Deep Learning", "Decision Trees"], "Databases": ["Indexes", "Transactions"]},
+    "Physics": {"Mechanics": ["Momentum", "Friction"], "Optics": ["Refraction", "Lenses"]},
+}
+TINY_FILLER = ("it is studied with careful experiments and the results are compared with earlier work so that "
+               "students can see how the ideas developed over many years of research").split()
+
+
+def tiny_example(rng):
+    """
+    A chunk and the label JSON for it. Physics chunks cover one topic and
+    the others two, which even a tiny model picks up, so arrays continue.
+    """
+    subject = rng.choice(sorted(TINY_TAXONOMY))
+    topics = rng.sample(sorted(TINY_TAXONOMY[subject]), 1 if subject == "Physics" else 2)
+    chunk, items = [], []
+    for topic in topics:
+        subtopic = rng.choice(TINY_TAXONOMY[subject][topic])
+        sentence = f"{subtopic} is part of {topic} in {subject}, and " + " ".join(rng.sample(TINY_FILLER, 8)) + "."
+        chunk.append(sentence)
+        items.append({"subject": subject, "topic": topic, "subtopic": subtopic,
+                      "title": f"{subtopic} in {topic}", "summary": sentence})
+    return " ".join(chunk), json.dumps(items, indent=2)
+
+
+def tiny_generator(steps, seed=0):
+    """A small GPT-NeoX and byte-level BPE tokenizer trained on label prompts and answers."""
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import GPTNeoXConfig, GPTNeoXForCausalLM, PreTrainedTokenizerFast
+
+    rng = random.Random(seed)
+    torch.manual_seed(seed)
+    examples = [labeler.build_prompt(chunk) + answer for chunk, answer in (tiny_example(rng) for _ in range(512))]
+
+    bpe = Tokenizer(models.BPE())
+    # "}" on its own, or "}," merges and the array would never be seen continuing after "\n  }"
+    bpe.pre_tokenizer = pre_tokenizers.Sequence([pre_tokenizers.Split("}", behavior="isolated"),
+                                                 pre_tokenizers.ByteLevel(add_prefix_space=False)])
+    bpe.decoder = decoders.ByteLevel()
+    bpe.train_from_iterator(examples, trainers.BpeTrainer(vocab_size=1024, special_tokens=["<|endoftext|>"],
+                                                          initial_alphabet=pre_tokenizers.ByteLevel.alphabet()))
+    tok = PreTrainedTokenizerFast(tokenizer_object=bpe, eos_token="<|endoftext|>", pad_token="<|endoftext|>")
+    tok.padding_side = "left"
+
+    config = GPTNeoXConfig(vocab_size=len(tok), hidden_size=64, num_hidden_layers=2, num_attention_heads=4,
+                           intermediate_size=256, max_position_embeddings=labeler.MODEL_CONTEXT_TOKENS,
+                           bos_token_id=tok.eos_token_id, eos_token_id=tok.eos_token_id)
+    model = GPTNeoXForCausalLM(config)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=3e-3)
+    encoded = [tok(text + tok.eos_token)["input_ids"] for text in examples]
+    started = time.perf_counter()
+    model.train()
+    for _ in range(steps):
+        batch = rng.sample(encoded, 8)
+        width = max(len(ids) for ids in batch)
+        input_ids = torch.tensor([ids + [tok.pad_token_id] * (width - len(ids)) for ids in batch])
+        labels = torch.tensor([ids + [-100] * (width - len(ids)) for ids in batch])
+        loss = model(input_ids=input_ids, labels=labels).loss
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+    print(f"[INFO] Trained the tiny model for {steps} steps in {time.perf_counter() - started:.1f}s (loss {loss.item():.3f}).")
+    return SimpleNamespace(model=model.eval(), tokenizer=tok), [tiny_example(rng)[0] for _ in range(16)]
+
+
+def sample_chunks(count):
+    chunks = []
+    if os.path.isdir(PROCESSED_DIR):
+        for filename in sorted(os.listdir(PROCESSED_DIR)):
+            path = os.path.join(PROCESSED_DIR, filename)
+            if os.path.isfile(path) and not filename.endswith(".json"):
+                with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                    chunks += [chunk for chunk, _, _ in labeler.chunk_pages([(None, f.read())])]
+            if len(chunks) >= count:
+                break
+    return chunks[:count] or ["Computer vision is concerned with the automatic extraction of information from images."]
+
+
+class Reference:
+    """The uncached path: every call tokenizes its whole text and runs the model on one chunk."""
+
+    def __init__(self):
+        self.tok, self.model = labeler.generator.tokenizer, labeler.generator.model
+        self.prefilled = 0
+        self.decisions = {}
+
+    def generate(self, text, max_new_tokens, stop_at_quote=True):
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList
+
+        tok = self.tok
+        input_ids = tok([text], return_tensors="pt")["input_ids"]
+        self.prefilled += input_ids.shape[1]
+
+        class ValueClosed(StoppingCriteria):
+            def __call__(self, ids, scores, **kwargs):
+                closed = labeler.find_value_end(tok.decode(ids[0, input_ids.shape[1]:], skip_special_tokens=True)) != -1
+                return torch.full((ids.shape[0],), closed, dtype=torch.bool, device=ids.device)
+
+        output = self.model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                                     max_new_tokens=max_new_tokens, do_sample=False, eos_token_id=tok.eos_token_id,
+                                     pad_token_id=tok.pad_token_id,
+                                     stopping_criteria=StoppingCriteriaList([ValueClosed()] if stop_at_quote else []))
+        return output[0, input_ids.shape[1]:].tolist()
+
+    def value(self, text, max_new_tokens):
+        new_ids = self.generate(text, max_new_tokens)
+        decoded = self.tok.decode(new_ids, skip_special_tokens=True)
+        end = labeler.find_value_end(decoded)
+        raw = decoded if end == -1 else decoded[:end]
+        try:
+            value = json.loads('"' + raw + '"')
+        except ValueError:
+            value = raw
+        return value.strip(), end != -1
+
+    def continues(self, text):
+        import torch
+
+        input_ids = self.tok([text], return_tensors="pt")["input_ids"]
+        self.prefilled += input_ids.shape[1]
+        with torch.no_grad():
+            logits = self.model(input_ids=input_ids).logits[0, -1]
+        more_id = self.tok(",", add_special_tokens=False)["input_ids"][0]
+        close_id = self.tok("\n", add_special_tokens=False)["input_ids"][0]
+        more = bool(logits[more_id] > logits[close_id])
+        self.decisions[text] = more
+        return more
+
+    def labels(self, chunk):
+        """label_batch_structured for one chunk, written out on strings."""
+        text = labeler.build_prompt(chunk) + "[\n  {\n"
+        object_tokens = sum(labeler.FIELD_MAX_TOKENS.values()) + 16 * len(labeler.LABEL_FIELDS)
+        labels = []
+        for n in range(labeler.MAX_TOPICS_PER_CHUNK):
+            current = {}
+            for field in labeler.LABEL_FIELDS:
+                text += f'    "{field}": "'
+                value, closed = self.value(text, labeler.FIELD_MAX_TOKENS[field])
+                if not value or not closed:
+                    prompt = labeler.FIELD_RETRY_TEMPLATE.replace("{text}", chunk).replace(
+                        "{question}", labeler.FIELD_QUESTIONS[field])
+                    retried, _ = self.value(prompt, labeler.FIELD_MAX_TOKENS[field])
+                    value = retried or value
+                current[field] = value
+                text += json.dumps(value)[1:] + ("\n  }" if field == labeler.LABEL_FIELDS[-1] else ",\n")
+            if all(current.values()):
+                labels.append(dict(current, text=chunk))
+            if n + 1 == labeler.MAX_TOPICS_PER_CHUNK:
+                break
+            more = self.continues(text)
+            if not more or len(self.tok(text)["input_ids"]) + object_tokens > labeler.MODEL_CONTEXT_TOKENS:
+                break
+            text += ",\n  {\n"
+        return labels
+
+
+def run_sessions(chunks, batch_size):
+    """Labels chunks with label_batch_structured, recording the continue decisions and the tokens fed."""
+    Session = labeler.DecodingSession
+    recorded = {"decisions": {}, "fed": 0}
+    feed, prefers = Session.feed, Session.prefers
+
+    def counting_feed(session, tokens):
+        recorded["fed"] += sum(len(row) for row in tokens)
+        return feed(session, tokens)
+
+    def recording_prefers(session, token, other):
+        result = prefers(session, token, other)
+        recorded["decisions"].update(zip(session.texts, result))
+        return result
+
+    Session.feed, Session.prefers = counting_feed, recording_prefers
+    try:
+        labels = []
+        started = time.perf_counter()
+        # Batched by length like the labeler, so rows of different lengths share a batch
+        for batch in labeler.bucket_by_length(chunks, batch_size):
+            batch_labels, _, _ = labeler.label_batch_structured([chunks[i] for i in batch])
+            labels += list(zip(batch, batch_labels))
+        seconds = time.perf_counter() - started
+    finally:
+        Session.feed, Session.prefers = feed, prefers
+    return [items for _, items in sorted(labels, key=lambda pair: pair[0])], recorded, seconds
+
+
+failures = []
+
+
+def check(name, ok, detail=""):
+    print(f"[✓] {name}" if ok else f"[ERROR] {name} {detail}")
+    if not ok:
+        failures.append(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiny", action="store_true", help="train a small offline model instead of loading MODEL_NAME")
+    parser.add_argument("--steps", type=int, default=300, help="training steps of the tiny model")
+    parser.add_argument("--chunks", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=labeler.BATCH_SIZE)
+    parser.add_argument("--free-tokens", type=int, default=64, help="tokens generated in the free-form check")
+    args = parser.parse_args()
+
+    if args.tiny:
+        labeler.generator, chunks = tiny_generator(args.steps)
+        labeler.generator_runtime, labeler.prefix_cache = "torch", None
+        chunks = chunks[:args.chunks]
+    else:
+        labeler.initialize_generator()
+        chunks = sample_chunks(args.chunks)
+
+    reference = Reference()
+    started = time.perf_counter()
+    expected = [reference.labels(chunk) for chunk in chunks]
+    reference_seconds = time.perf_counter() - started
+    print(f"[INFO] Reference: {sum(map(len, expected))} labels for {len(chunks)} chunks, "
+          f"{reference.prefilled} tokens prefilled, {reference_seconds:.2f}s.")
+
+    for prefix_cache in (False, True):
+        labeler.PREFIX_CACHE, labeler.prefix_cache = prefix_cache, None
+        name = "with" if prefix_cache else "without"
+        labels, recorded, seconds = run_sessions(chunks, args.batch_size)
+        mismatched = [i for i, (got, want) in enumerate(zip(labels, expected)) if got != want]
+        check(f"session {name} prefix cache: same field values", not mismatched, f"(chunks {mismatched})")
+        check(f"session {name} prefix cache: same continue decisions", recorded["decisions"] == reference.decisions,
+              f"({len(set(recorded['decisions'].items()) ^ set(reference.decisions.items()))} differ)")
+        continued = sum(recorded["decisions"].values())
+        print(f"[INFO] Session {name} prefix cache: {continued} of {len(recorded['decisions'])} arrays continued, "
+              f"{recorded['fed']} tokens fed, {seconds:.2f}s "
+              f"({reference_seconds / seconds:.1f}x the reference).")
+
+    prompts = [labeler.build_prompt(chunk) for chunk in chunks[:args.batch_size]]
+    generated = labeler.DecodingSession(prompts).generate(args.free_tokens, stop_at_quote=False)
+    # The session stops feeding a row at the end-of-text token; generate() pads after it
+    wanted = [reference.generate(prompt, args.free_tokens, stop_at_quote=False) for prompt in prompts]
+    wanted = [ids[:ids.index(reference.tok.eos_token_id) + 1] if reference.tok.eos_token_id in ids else ids for ids in wanted]
+    check("free-form generation: same tokens", generated == wanted)
+
+    if failures:
+        print(f"[ERROR] {len(failures)} checks failed.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
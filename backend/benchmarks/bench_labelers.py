@@ -0,0 +1,85 @@
+"""
+Throughput and label agreement of the centroid labeler against the LLM
+labeler, on chunks of the texts in data/processed.
+
+Every sample chunk is labeled by the LLM, which is the reference. The
+chunks are then split into folds. For each fold, a taxonomy is learned
+from the LLM labels of the other folds and the fold is labeled with the
+centroid backend. Agreement is the share of chunks whose subject,
+subject+topic and subject+topic+subtopic match the LLM's first label
+(case-insensitive).
+
+    python -m benchmarks.bench_labelers --limit 32 --folds 4
+"""
+import argparse
+import os
+import time
+
+from chunking.backends import CentroidLabeler, Taxonomy, get_backend
+from chunking.labeler import chunk_pages
+
+PROCESSED_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/processed"))
+
+
+def sample_chunks(limit):
+    chunks = []
+    for filename in sorted(os.listdir(PROCESSED_DIR)):
+        path = os.path.join(PROCESSED_DIR, filename)
+        if os.path.isfile(path) and not filename.endswith(".json"):
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                chunks.extend(chunk for chunk, _, _ in chunk_pages([(None, f.read())]))
+    return chunks[:limit]
+
+
+def label_all(backend, chunks):
+    labels = []
+    started = time.perf_counter()
+    for batch in backend.batches(chunks):
+        for i, items in zip(batch, backend.label_batch([chunks[i] for i in batch])):
+            labels.append((i, items[0] if items else None))
+    return [label for _, label in sorted(labels, key=lambda pair: pair[0])], time.perf_counter() - started
+
+
+def key(label, depth):
+    return tuple(str(label.get(level, "")).strip().lower() for level in ("subject", "topic", "subtopic")[:depth])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=16, help="number of sample chunks")
+    parser.add_argument("--folds", type=int, default=4)
+    args = parser.parse_args()
+
+    chunks = sample_chunks(args.limit)
+    if len(chunks) < args.folds:
+        raise SystemExit(f"Only {len(chunks)} sample chunks; add texts to {PROCESSED_DIR} or lower --folds.")
+    print(f"{len(chunks)} sample chunks, {args.folds} folds")
+
+    reference, llm_seconds = label_all(get_backend("llm"), chunks)
+    print(f"{'llm':<10} {len(chunks) / llm_seconds:>10.2f} chunks/s")
+
+    centroid_seconds = 0.0
+    matches, compared = [0, 0, 0], 0
+    for fold in range(args.folds):
+        test = [i for i in range(len(chunks)) if i % args.folds == fold and reference[i]]
+        train = [dict(reference[i], text=chunks[i]) for i in range(len(chunks)) if i % args.folds != fold and reference[i]]
+        if not test or not train:
+            continue
+        backend = CentroidLabeler(taxonomy=Taxonomy.learn(train))
+        predicted, seconds = label_all(backend, [chunks[i] for i in test])
+        centroid_seconds += seconds
+        for i, label in zip(test, predicted):
+            compared += 1
+            for depth in range(3):
+                matches[depth] += key(label, depth + 1) == key(reference[i], depth + 1)
+
+    if not compared:
+        raise SystemExit("The LLM produced no labels to compare against.")
+    print(f"{'centroid':<10} {compared / centroid_seconds:>10.2f} chunks/s "
+          f"({llm_seconds / len(chunks) / (centroid_seconds / compared):.0f}x)")
+    print(f"agreement on {compared} chunks: subject {100 * matches[0] / compared:.0f}%, "
+          f"topic {100 * matches[1] / compared:.0f}%, subtopic {100 * matches[2] / compared:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Load time, memory footprint and decoding speed of the labeling model under
+each runtime (fp32 torch, int8, int4, ONNX), on a sample chunk from
+data/processed. Each runtime runs in its own process so its peak RSS is
+measured on its own.
+
+    python -m benchmarks.bench_llm_runtime --runtimes torch int8 onnx --threads 4
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+PROCESSED_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/processed"))
+
+
+def peak_rss_gb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 ** 3 if sys.platform == "darwin" else 1024 ** 2)
+
+
+def sample_chunk():
+    from chunking.labeler import chunk_pages
+
+    for filename in sorted(os.listdir(PROCESSED_DIR)):
+        path = os.path.join(PROCESSED_DIR, filename)
+        if os.path.isfile(path) and not filename.endswith(".json"):
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                for chunk, _, _ in chunk_pages([(None, f.read())]):
+                    return chunk
+    return "Computer vision is concerned with the automatic extraction of information from images."
+
+
+def measure(runtime, threads, new_tokens):
+    from chunking import labeler
+
+    chunk = sample_chunk()
+    started = time.perf_counter()
+    labeler.initialize_generator(runtime, threads)
+    load_seconds = time.perf_counter() - started
+
+    tok, model = labeler.generator.tokenizer, labeler.generator.model
+    encoded = tok([labeler.build_prompt(chunk) + '[\n  {\n    "summary": "'], return_tensors="pt")
+    started = time.perf_counter()
+    output = model.generate(**encoded, max_new_tokens=new_tokens, min_new_tokens=new_tokens, do_sample=False,
+                            pad_token_id=tok.pad_token_id)
+    seconds = time.perf_counter() - started
+    generated = output.shape[1] - encoded["input_ids"].shape[1]
+    return {"runtime": runtime, "load_s": load_seconds, "rss_gb": peak_rss_gb(),
+            "prompt_tokens": encoded["input_ids"].shape[1], "tokens_per_s": generated / seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runtimes", nargs="+", default=["torch", "int8", "onnx"])
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads per worker (0: library default)")
+    parser.add_argument("--new-tokens", type=int, default=64)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.threads, args.new_tokens)))
+        return
+
+    print(f"{'runtime':<8} {'load':>8} {'peak RSS':>10} {'tokens/s':>10}")
+    for runtime in args.runtimes:
+        command = [sys.executable, "-m", "benchmarks.bench_llm_runtime", "--child", runtime,
+                   "--threads", str(args.threads), "--new-tokens", str(args.new_tokens)]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        lines = [line for line in completed.stdout.splitlines() if line.startswith("{")]
+        if completed.returncode != 0 or not lines:
+            error = (completed.stderr.strip().splitlines() or ["no output"])[-1]
+            print(f"{runtime:<8} failed: {error}")
+            continue
+        result = json.loads(lines[-1])
+        print(f"{runtime:<8} {result['load_s']:>7.1f}s {result['rss_gb']:>8.2f}GB {result['tokens_per_s']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Checks and timings of the link fetcher (ingestion.social_scraper) against a
+local http.server stand-in, so no network is needed. The stand-in serves
+pages with an ETag and an optional delay, plus a 404 and a 500, on two
+host names (127.0.0.1 and localhost) that the rate limiter treats as
+different hosts.
+
+It checks that:
+  - a cached page is revalidated with If-None-Match and served from the
+    cache on a 304,
+  - requests to one host are spaced by the rate limiter's interval while
+    another host is fetched alongside,
+  - results keep the order of the links when later links finish first,
+  - failed links come back empty without affecting the others,
+and reports the concurrent speedup over fetching one link at a time.
+Exits with status 1 if a check fails.
+
+    python -m benchmarks.bench_scraper --pages 32 --delay-ms 100
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ingestion import social_scraper
+from utils.cache import SQLiteCache
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """GET /page/<n>?delay=<ms> serves "<p>page n</p>" with an ETag; /missing is a 404 and /error a 500."""
+
+    requests_log = []  # (host, path, If-None-Match, status, time.monotonic())
+    log_lock = threading.Lock()
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        status, body = 200, b""
+        match = re.fullmatch(r"/page/(\d+)", path)
+        etag = f'"v1-{match.group(1)}"' if match else None
+        if path == "/missing":
+            status = 404
+        elif path == "/error":
+            status = 500
+        elif match is None:
+            status = 404
+        elif self.headers.get("If-None-Match") == etag:
+            status = 304
+        else:
+            body = f"<html><body><p>page {match.group(1)}</p></body></html>".encode("utf-8")
+        delay = re.search(r"delay=(\d+)", query)
+        if delay:
+            time.sleep(int(delay.group(1)) / 1000)
+        with self.log_lock:
+            self.requests_log.append((self.headers.get("Host", "").split(":")[0], path,
+                                      self.headers.get("If-None-Match"), status, time.monotonic()))
+        self.send_response(status)
+        if etag and status in (200, 304):
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+failures = []
+
+
+def check(name, ok, detail=""):
+    print(f"[✓] {name}" if ok else f"[ERROR] {name} {detail}")
+    if not ok:
+        failures.append(name)
+
+
+def log_since(start):
+    with StandIn.log_lock:
+        return StandIn.requests_log[start:]
+
+
+def check_revalidation(base):
+    url = f"{base}/page/1"
+    start = len(StandIn.requests_log)
+    first = social_scraper.fetch_url(url)
+    second = social_scraper.fetch_url(url)
+    log = log_since(start)
+    check("revalidation: second fetch is conditional and gets a 304",
+          [entry[2:4] for entry in log] == [(None, 200), ('"v1-1"', 304)], log)
+    check("revalidation: the 304 serves the cached page", first == second and "page 1" in second)
+
+
+def check_rate_limit(hosts, interval):
+    social_scraper.rate_limiter = social_scraper.HostRateLimiter(interval)
+    start = len(StandIn.requests_log)
+    urls = [f"{host}/page/{100 + i}" for i in range(4) for host in hosts]
+    social_scraper.extract_texts_from_links(urls, workers=len(urls))
+    log = log_since(start)
+    by_host = {}
+    for host, _, _, _, at in log:
+        by_host.setdefault(host, []).append(at)
+    gaps = [later - earlier for times in by_host.values() for earlier, later in zip(sorted(times), sorted(times)[1:])]
+    # Slots are taken before the request is sent, so allow a little jitter
+    check(f"rate limit: requests to one host at least {interval}s apart", gaps and min(gaps) >= interval * 0.9,
+          f"(smallest gap {min(gaps, default=0):.3f}s)")
+    firsts = sorted(min(times) for times in by_host.values())
+    check("rate limit: hosts are not held back by each other",
+          len(firsts) == len(hosts) and firsts[-1] - firsts[0] < interval * 0.5)
+
+
+def check_order_and_errors(base, count):
+    social_scraper.rate_limiter = social_scraper.HostRateLimiter(0.0)
+    # Later links answer sooner, so they finish first
+    urls = [f"{base}/page/{200 + i}?delay={(count - i) * 10}" for i in range(count)]
+    urls.insert(count // 3, f"{base}/missing")
+    urls.insert(2 * count // 3, f"{base}/error")
+    texts = social_scraper.extract_texts_from_links(urls, workers=8)
+    expected = [re.search(r"/page/(\d+)", url) for url in urls]
+    check("order: texts come back in link order",
+          all(text == f"page {m.group(1)}" for text, m in zip(texts, expected) if m))
+    check("errors: the 404 and the 500 come back empty",
+          [text for text, m in zip(texts, expected) if m is None] == ["", ""])
+
+
+def time_fetches(base, pages, delay_ms):
+    social_scraper.rate_limiter = social_scraper.HostRateLimiter(0.0)
+    timings = {}
+    for workers in (1, social_scraper.FETCH_WORKERS):
+        # Fresh pages each run, so nothing is revalidated
+        first = 1000 + workers * pages
+        urls = [f"{base}/page/{first + i}?delay={delay_ms}" for i in range(pages)]
+        started = time.perf_counter()
+        social_scraper.extract_texts_from_links(urls, workers=workers)
+        timings[workers] = time.perf_counter() - started
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=32)
+    parser.add_argument("--delay-ms", type=int, default=100, help="server latency of each timed page")
+    parser.add_argument("--interval", type=float, default=0.2, help="per-host interval for the rate limit check")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    limiter = social_scraper.rate_limiter
+    try:
+        social_scraper._http_cache = SQLiteCache(os.path.join(directory, "http.sqlite"))
+        port = server.server_address[1]
+        hosts = [f"http://127.0.0.1:{port}", f"http://localhost:{port}"]
+
+        check_revalidation(hosts[0])
+        check_rate_limit(hosts, args.interval)
+        check_order_and_errors(hosts[0], 12)
+        timings = time_fetches(hosts[0], args.pages, args.delay_ms)
+        sequential, concurrent = timings[1], timings[social_scraper.FETCH_WORKERS]
+        print(f"\n{args.pages} pages at {args.delay_ms} ms: one at a time {sequential:.2f}s, "
+              f"{social_scraper.FETCH_WORKERS} workers {concurrent:.2f}s ({sequential / concurrent:.1f}x)")
+    finally:
+        server.shutdown()
+        server.server_close()
+        social_scraper.rate_limiter = limiter
+        social_scraper._http_cache = None
+        shutil.rmtree(directory)
+
+    if failures:
+        print(f"[ERROR] {len(failures)} checks failed.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Query latency of keyword (BM25), vector and hybrid search on a synthetic
+store of ~1M chunks, one query at a time, as /api/search runs them.
+
+Chunks are made of Zipf-distributed words with a course code in some titles.
+Vectors are clustered random MiniLM-sized vectors, and query vectors are
+drawn the same way, so query encoding (a few ms of MiniLM) is not included.
+The queries mix exact course codes, two or three topical words, and both
+together. The store is bulk-loaded straight into its files
+(add_document would rewrite the FAISS index once per document) and then
+rebuilt as --index-type.
+
+    python -m benchmarks.bench_search --chunks 1000000 --queries 500
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_ann import synthetic_corpus
+from memory import embedding_store, lexical_index
+from memory.embedding_store import EMBEDDING_DIM, SEARCH_BUDGET_MS, VectorStore, search_chunks
+
+CHUNKS_PER_DOCUMENT = 1000
+VOCABULARY = 50000
+
+
+def word(rank):
+    return f"w{rank:x}"
+
+
+def synthetic_document(doc, rng, text_words):
+    ranks = np.minimum(rng.zipf(1.3, (CHUNKS_PER_DOCUMENT, text_words + 30)), VOCABULARY) - 1
+    records = []
+    for i, row in enumerate(ranks):
+        words = [word(rank) for rank in row]
+        title = " ".join(words[:5]) + (f" CS{doc:04d}{i % 10}" if i % 10 == 0 else "")
+        records.append({"title": title, "summary": " ".join(words[5:30]), "text": " ".join(words[30:]),
+                        "subject": f"Subject {doc % 20}"})
+    return records
+
+
+def bulk_load(store, documents, text_words, seed=0):
+    rng = np.random.default_rng(seed)
+    next_id = 0
+    for doc in range(documents):
+        records = synthetic_document(doc, rng, text_words)
+        vectors = synthetic_corpus(len(records), EMBEDDING_DIM, seed=seed + doc)
+        with open(store.vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        store._conn.executemany(
+            "INSERT INTO metadata (id, doc_id, record) VALUES (?, ?, ?)",
+            [(next_id + i, f"doc{doc}", json.dumps(record)) for i, record in enumerate(records)],
+        )
+        lexical_index.index_document(store._conn, f"doc{doc}")
+        store._conn.commit()
+        next_id += len(records)
+        if (doc + 1) % 100 == 0:
+            print(f"  loaded {next_id} chunks")
+
+
+def make_queries(count, documents, seed=1):
+    rng = np.random.default_rng(seed)
+    queries = []
+    for i in range(count):
+        # Topical words from the middle of the distribution, and codes that exist
+        words = " ".join(word(int(rank)) for rank in rng.integers(20, 2000, rng.integers(2, 4)))
+        code = f"CS{int(rng.integers(documents)):04d}{int(rng.integers(10))}"
+        queries.append([code, words, f"{code} {words}"][i % 3])
+    return queries
+
+
+def percentiles(samples):
+    samples = np.array(samples) * 1000
+    return np.percentile(samples, 50), np.percentile(samples, 99), samples.max()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--text-words", type=int, default=60, help="words of chunk text besides title and summary")
+    parser.add_argument("--index-type", default="ivf_flat", choices=embedding_store.INDEX_TYPES)
+    parser.add_argument("--budget-ms", type=float, default=SEARCH_BUDGET_MS)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        store = VectorStore(directory)
+        documents = max(1, args.chunks // CHUNKS_PER_DOCUMENT)
+        started = time.perf_counter()
+        bulk_load(store, documents, args.text_words)
+        print(f"loaded {documents * CHUNKS_PER_DOCUMENT} chunks in {time.perf_counter() - started:.0f}s")
+        store.rebuild_index(args.index_type, **embedding_store.INDEX_PARAMS)
+        embedding_store.store = store
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print(f"store size {size / 1024 ** 3:.2f} GB")
+
+        queries = make_queries(args.queries, documents)
+        vectors = synthetic_corpus(len(queries), EMBEDDING_DIM, seed=documents + 1)
+        # Without common-term pruning, keyword queries run unbudgeted to show their real cost
+        runs = [("vector", "vector", 0.1, args.budget_ms), ("keyword", "keyword", 0.1, args.budget_ms),
+                ("keyword, no pruning", "keyword", 1.0, 60000), ("hybrid", "hybrid", 0.1, args.budget_ms)]
+        print(f"\n{'mode':<22}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'over budget':>13}")
+        for label, mode, max_term_fraction, budget_ms in runs:
+            lexical_index.MAX_TERM_FRACTION = max_term_fraction
+            latencies = []
+            for query, vector in zip(queries, vectors):
+                started = time.perf_counter()
+                search_chunks(query, limit=10, mode=mode, budget_ms=budget_ms, vector=vector)
+                latencies.append(time.perf_counter() - started)
+            over = sum(latency * 1000 > args.budget_ms for latency in latencies)
+            p50, p99, worst = percentiles(latencies)
+            print(f"{label:<22}{p50:>10.1f}{p99:>10.1f}{worst:>10.1f}{over:>13}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
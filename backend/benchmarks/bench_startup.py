@@ -0,0 +1,71 @@
+"""
+Cold-start time of the Flask backend: how long `import app` takes and how
+long until "/" answers, each measured in a fresh interpreter, plus the
+slowest imports from `python -X importtime`. With --budget the script exits
+non-zero when the median time to first response exceeds it, so it can run
+in CI to catch regressions.
+
+    python -m benchmarks.bench_startup --runs 5 --budget 2.0
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Warm-up is disabled so the measurement covers only what blocks the first response
+PROBE = """
+import time
+started = time.perf_counter()
+import app
+imported = time.perf_counter() - started
+response = app.app.test_client().get("/")
+assert response.status_code == 200
+print(imported, time.perf_counter() - started)
+"""
+
+
+def measure():
+    env = dict(os.environ, MINDMAP_WARMUP="0")
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    imported, first_response = output.strip().splitlines()[-1].split()
+    return float(imported), float(first_response)
+
+
+def slowest_imports(limit):
+    env = dict(os.environ, MINDMAP_WARMUP="0")
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, help="fail if the median time to first response exceeds this")
+    args = parser.parse_args()
+
+    results = [measure() for _ in range(args.runs)]
+    import_median = statistics.median(r[0] for r in results)
+    response_median = statistics.median(r[1] for r in results)
+    print(f"import app:          median {import_median:.3f}s over {args.runs} runs")
+    print(f"first '/' response:  median {response_median:.3f}s")
+    print("slowest imports (cumulative):")
+    for microseconds, name in slowest_imports(10):
+        print(f"  {microseconds / 1e6:>7.3f}s  {name}")
+
+    if args.budget is not None and response_median > args.budget:
+        print(f"[✗] Startup {response_median:.3f}s exceeds the {args.budget:.3f}s budget.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Bulk ingestion of a directory of files or a JSONL manifest.
+
+    python bulk_ingest.py data/raw/backfill
+    python bulk_ingest.py manifest.jsonl --extract-workers 8
+    python bulk_ingest.py data/raw/backfill --labeler centroid
+
+Manifest lines look like {"type": "pdf", "path": "docs/a.pdf"} or
+{"type": "youtube", "path": "https://www.youtube.com/watch?v=..."}.
+
+Extraction, labeling and output (topic index, semantic index, graph) run as
+overlapping stages connected by bounded queues, with the models loaded once
+for the whole run. Finished sources are appended to a checkpoint file, so a
+crashed run picks up where it stopped when started again.
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+from main import ingest_pages, save_labeled_data
+from chunking.labeler import label_chunk
+from memory.embedding_store import build_index_from_chunks
+from memory.topic_index import TopicIndex
+from utils.graph import update_graph
+
+GRAPH_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data/processed/mindmap_graph.json"))
+CHECKPOINT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data/bulk_checkpoint.jsonl"))
+
+# Documents waiting between two stages; keeps memory bounded when labeling is the bottleneck
+QUEUE_SIZE = 8
+EXTENSION_TYPES = {".pdf": "pdf", ".png": "image", ".jpg": "image", ".jpeg": "image"}
+
+_DONE = object()
+
+
+def iter_sources(path):
+    """Yields (source_type, path_or_url) from a directory tree or a JSONL manifest."""
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                source_type = EXTENSION_TYPES.get(os.path.splitext(name)[1].lower())
+                if source_type:
+                    yield source_type, os.path.join(root, name)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    yield entry["type"], entry["path"]
+
+
+def source_key(source_type, path_or_url):
+    return f"{source_type}:{path_or_url}"
+
+
+def document_name(source_type, path_or_url):
+    """A stable name, so re-ingesting a source replaces its earlier output."""
+    digest = hashlib.sha256(path_or_url.encode("utf-8")).hexdigest()[:8]
+    base = os.path.splitext(os.path.basename(path_or_url.rstrip("/")))[0] or source_type
+    return f"{source_type}_{base[:40]}_{digest}"
+
+
+def load_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        return {json.loads(line)["key"] for line in f if line.strip()}
+
+
+class StageStats:
+    """Counts documents, items and busy time for one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.documents = 0
+        self.items = 0
+        self.failures = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, items=0, failed=False):
+        with self._lock:
+            self.busy += seconds
+            self.items += items
+            if failed:
+                self.failures += 1
+            else:
+                self.documents += 1
+
+    def line(self, wall):
+        rate = self.documents / self.busy if self.busy else 0.0
+        return (f"  {self.name:<10} {self.documents:>6} docs {self.items:>8} items {self.failures:>4} failed "
+                f"{self.busy:>9.1f}s busy {rate:>8.2f} docs/s busy {100 * self.busy / wall:>6.0f}% of wall")
+
+
+def run(sources, extract_workers=2, checkpoint_path=CHECKPOINT_PATH, labeler=None):
+    done = load_checkpoint(checkpoint_path)
+    sources = [s for s in sources if source_key(*s) not in done]
+    print(f"[INFO] {len(sources)} sources to ingest ({len(done)} already done).")
+
+    source_queue = queue.Queue()
+    for source in sources:
+        source_queue.put(source)
+    label_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    output_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    stats = {name: StageStats(name) for name in ("extract", "label", "output")}
+    topic_index = TopicIndex()
+
+    def extract_worker():
+        while True:
+            try:
+                source = source_queue.get_nowait()
+            except queue.Empty:
+                return
+            started = time.perf_counter()
+            try:
+                pages = ingest_pages(*source)
+                stats["extract"].record(time.perf_counter() - started, items=len(pages))
+                if pages:
+                    label_queue.put((source, pages))
+            except Exception as e:
+                stats["extract"].record(time.perf_counter() - started, failed=True)
+                print(f"[ERROR] Extraction failed for {source[1]}: {e}")
+
+    def label_worker():
+        while True:
+            item = label_queue.get()
+            if item is _DONE:
+                output_queue.put(_DONE)
+                return
+            source, pages = item
+            started = time.perf_counter()
+            try:
+                labeled = label_chunk(pages, backend=labeler, document=document_name(*source))
+                stats["label"].record(time.perf_counter() - started, items=len(labeled))
+                if labeled:
+                    output_queue.put((source, labeled))
+            except Exception as e:
+                stats["label"].record(time.perf_counter() - started, failed=True)
+                print(f"[ERROR] Labeling failed for {source[1]}: {e}")
+
+    def output_worker():
+        with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+            while True:
+                item = output_queue.get()
+                if item is _DONE:
+                    return
+                source, labeled = item
+                started = time.perf_counter()
+                try:
+                    jsonl_path = save_labeled_data(labeled, document_name(*source))
+                    topic_index.index_file(jsonl_path)
+                    build_index_from_chunks(jsonl_path)
+                    update_graph(jsonl_path, GRAPH_PATH)
+                    checkpoint.write(json.dumps({"key": source_key(*source), "labeled": jsonl_path}) + "\n")
+                    checkpoint.flush()
+                    os.fsync(checkpoint.fileno())
+                    stats["output"].record(time.perf_counter() - started, items=len(labeled))
+                except Exception as e:
+                    stats["output"].record(time.perf_counter() - started, failed=True)
+                    print(f"[ERROR] Saving failed for {source[1]}: {e}")
+
+    started = time.perf_counter()
+    extractors = [threading.Thread(target=extract_worker, name=f"extract-{i}") for i in range(extract_workers)]
+    label_thread = threading.Thread(target=label_worker, name="label")
+    writer = threading.Thread(target=output_worker, name="output")
+    for thread in extractors + [label_thread, writer]:
+        thread.start()
+    for thread in extractors:
+        thread.join()
+    label_queue.put(_DONE)
+    label_thread.join()
+    writer.join()
+
+    wall = time.perf_counter() - started
+    print(f"\n[✓] Bulk ingestion finished in {wall:.1f}s.")
+    for stage in stats.values():
+        print(stage.line(wall))
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="directory of files or JSONL manifest")
+    parser.add_argument("--extract-workers", type=int, default=2)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--labeler", choices=["llm", "centroid"], help="labeler backend (default: MINDMAP_LABELER or llm)")
+    args = parser.parse_args()
+
+    run(list(iter_sources(args.input)), args.extract_workers, args.checkpoint, args.labeler)
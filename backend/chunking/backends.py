@@ -0,0 +1,358 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from chunking.embedder import EMBEDDING_DIM, get_embedding_service
+from chunking.splitter import split_sentences
+from graph.mindmap_builder import normalize_name
+from memory.chunk_store import list_labeled, read_records
+from preprocessing.structure_detector import find_headers
+
+LABELED_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/labeled"))
+TAXONOMY_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/index/taxonomy.npz"))
+
+LEVELS = ["subject", "topic", "subtopic"]
+# Labels from the centroid labeler carry {LABELER_FIELD: "centroid"} and are never learned from
+LABELER_FIELD = "labeler"
+# Fields of labeled chunks a taxonomy is learned from
+LABEL_ITEM_FIELDS = LEVELS + ["text", LABELER_FIELD, "duplicate_of"]
+SUMMARY_SENTENCES = 3
+TITLE_MAX_WORDS = 10
+
+
+class LabelerBackend:
+    """
+    Labels chunks with subject/topic/subtopic/title/summary. label_chunk
+    handles chunking, caching, batching and progress; a backend only turns a
+    batch of chunk texts into one list of label dicts per chunk.
+    """
+
+    name = None
+    batch_size = 4
+    # Whether labels can be reused for identical chunk text across runs
+    cacheable = False
+
+    @property
+    def labeler_id(self):
+        """What produces this backend's labels; labels are only reused between identical labelers."""
+        return self.name
+
+    def load(self):
+        """Loads whatever the backend needs, so the first request does not pay for it."""
+
+    @property
+    def loaded(self):
+        return True
+
+    def batches(self, chunks, batch_size=None):
+        """Groups chunk indices into batches; backends may reorder to batch similar chunks together."""
+        batch_size = batch_size or self.batch_size
+        return [list(range(i, min(i + batch_size, len(chunks)))) for i in range(0, len(chunks), batch_size)]
+
+    def label_batch(self, chunks):
+        raise NotImplementedError
+
+
+class Taxonomy:
+    """
+    Centroids of chunk embeddings for every subject, (subject, topic) and
+    (subject, topic, subtopic) seen in LLM-labeled data. Chunks are assigned
+    top down: nearest subject, then the nearest topic of that subject, then
+    the nearest subtopic of that topic.
+
+    The sum and count of the vectors behind each centroid are kept, so new
+    labeled documents are folded in without embedding the earlier ones
+    again. documents maps the labeled files learned from to their
+    [mtime, size, chunks learned].
+
+    Names are keyed like the graph's nodes (normalize_name), so case and
+    Unicode variants of a label share one centroid, shown under the first
+    name seen.
+    """
+
+    def __init__(self, names, sums, counts, documents=None):
+        self.names, self.keys, self.rows, self.sums, self.counts = [], [], [], [], []
+        for level_names, level_sums, level_counts in zip(names, sums, counts):
+            # Variants saved by an older taxonomy are merged into one row
+            rows, merged_names, merged_sums, merged_counts = {}, [], [], []
+            for name, vector_sum, count in zip(level_names, level_sums, level_counts):
+                key = name_key(name)
+                if key in rows:
+                    merged_sums[rows[key]] = merged_sums[rows[key]] + vector_sum
+                    merged_counts[rows[key]] += count
+                else:
+                    rows[key] = len(merged_names)
+                    merged_names.append(tuple(name))
+                    merged_sums.append(vector_sum)
+                    merged_counts.append(count)
+            self.names.append(merged_names)  # one list of label tuples (display names) per level
+            self.keys.append(list(rows))  # their normalized tuples
+            self.rows.append(rows)
+            self.sums.append(np.array(merged_sums, dtype="float32").reshape(-1, level_sums.shape[1]))
+            self.counts.append(np.array(merged_counts, dtype="int64"))
+        self.documents = documents if documents is not None else {}
+        self._update_centroids()
+
+    @classmethod
+    def empty(cls, dim):
+        return cls([[] for _ in LEVELS], [np.zeros((0, dim), dtype="float32") for _ in LEVELS],
+                   [np.zeros(0, dtype="int64") for _ in LEVELS])
+
+    @classmethod
+    def learn(cls, items, documents=None):
+        """Builds a taxonomy from labeled items, i.e. dicts with the label fields and the chunk "text"."""
+        taxonomy = cls.empty(EMBEDDING_DIM)
+        taxonomy.add(items)
+        taxonomy.documents.update(documents or {})
+        return taxonomy.learned()
+
+    def learned(self):
+        """Returns the taxonomy once it has learned something; raises ValueError otherwise."""
+        if not self.counts[0].sum():
+            raise ValueError("No labeled chunks to learn a taxonomy from; label some documents with the llm backend first.")
+        print(f"[INFO] Learned a taxonomy of {len(self.names[0])} subjects, {len(self.names[1])} topics and "
+              f"{len(self.names[2])} subtopics from {int(self.counts[0].sum())} labeled chunks.")
+        return self
+
+    def add(self, items):
+        """Folds labeled items into the centroids. Returns the number of items used."""
+        items = [item for item in items if item.get("text") and all(item.get(level) for level in LEVELS)]
+        if not items:
+            return 0
+        vectors = get_embedding_service().encode_documents([item["text"] for item in items])
+        for depth in range(len(LEVELS)):
+            rows = self.rows[depth]
+            sums, counts = list(self.sums[depth]), list(self.counts[depth])
+            for item, vector in zip(items, vectors):
+                name = tuple(item[level].strip() for level in LEVELS[:depth + 1])
+                key = name_key(name)
+                if key not in rows:
+                    if depth:  # shown under the parent's display name
+                        parent = self.names[depth - 1][self.rows[depth - 1][key[:-1]]]
+                        name = parent + name[-1:]
+                    rows[key] = len(self.names[depth])
+                    self.names[depth].append(name)
+                    self.keys[depth].append(key)
+                    sums.append(np.zeros_like(vector))
+                    counts.append(0)
+                sums[rows[key]] = sums[rows[key]] + vector
+                counts[rows[key]] += 1
+            self.sums[depth] = np.stack(sums).astype("float32")
+            self.counts[depth] = np.array(counts, dtype="int64")
+        self._update_centroids()
+        return len(items)
+
+    def _update_centroids(self):
+        self.centroids = [sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+                          for sums in self.sums]
+
+    def save(self, path=TAXONOMY_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {}
+        for depth in range(len(LEVELS)):
+            arrays[f"sums_{depth}"] = self.sums[depth]
+            arrays[f"counts_{depth}"] = self.counts[depth]
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, names=np.array(json.dumps(self.names)), documents=np.array(json.dumps(self.documents)), **arrays)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path=TAXONOMY_PATH):
+        """The saved taxonomy, or None if it was saved in the older centroid-only format."""
+        with np.load(path) as data:
+            if "sums_0" not in data:
+                return None
+            names = [[tuple(name) for name in level] for level in json.loads(str(data["names"]))]
+            sums = [data[f"sums_{depth}"] for depth in range(len(LEVELS))]
+            counts = [data[f"counts_{depth}"] for depth in range(len(LEVELS))]
+            return cls(names, sums, counts, json.loads(str(data["documents"])))
+
+    def assign(self, vectors):
+        """Returns (label tuple, similarity) for every row of vectors."""
+        results = []
+        for vector in vectors:
+            prefix, label, score = (), (), 0.0
+            for depth, (keys, centroids) in enumerate(zip(self.keys, self.centroids)):
+                candidates = [i for i, key in enumerate(keys) if key[:-1] == prefix]
+                scores = centroids[candidates] @ vector
+                best = int(np.argmax(scores))
+                prefix, score = keys[candidates[best]], float(scores[best])
+                label += (self.names[depth][candidates[best]][-1],)
+            results.append((label, score))
+        return results
+
+
+def name_key(name):
+    return tuple(normalize_name(part) for part in name)
+
+
+def llm_labeled(record):
+    """Whether a labeled record has labels of its own from the LLM: not centroid output, not a duplicate."""
+    return record.get(LABELER_FIELD) != CentroidLabeler.name and not record.get("duplicate_of")
+
+
+def labeled_items(paths):
+    """Yields the LLM-labeled chunks of the given labeled files."""
+    for path in paths:
+        for record in read_records(path, LABEL_ITEM_FIELDS):
+            if llm_labeled(record):
+                yield record
+
+
+def file_signature(path):
+    return [os.path.getmtime(path), os.path.getsize(path)]
+
+
+class CentroidLabeler(LabelerBackend):
+    """
+    Fast non-generative labeler. Subject, topic and subtopic come from the
+    nearest centroids of the learned taxonomy (MiniLM embeddings of chunks
+    the LLM labeled earlier; its own output is never learned from). The
+    summary is the chunk's most central sentences in their original order,
+    and the title is the section heading the chunk opens with or else the
+    start of its most central sentence.
+
+    New labeled documents are folded into the taxonomy as they appear.
+    Documents it learned from that have since changed or been removed are
+    only accounted for by relearning it, with
+    `python -m chunking.backends --relearn`.
+    """
+
+    name = "centroid"
+    batch_size = 64
+
+    def __init__(self, labeled_dir=LABELED_DIR, taxonomy_path=TAXONOMY_PATH, taxonomy=None):
+        self.labeled_dir = labeled_dir
+        self.taxonomy_path = taxonomy_path
+        self.taxonomy = taxonomy
+        self.fixed = taxonomy is not None
+        self._stale_warned = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        self.get_taxonomy()
+        get_embedding_service().model
+
+    @property
+    def loaded(self):
+        return self.taxonomy is not None and get_embedding_service().loaded
+
+    def relearn(self):
+        """Learns the taxonomy again from every labeled document."""
+        with self._lock:
+            files = {os.path.basename(path): path for path in list_labeled(self.labeled_dir)}
+            self.taxonomy = self._learn(files)
+            self._stale_warned = False
+            return self.taxonomy
+
+    def _learn(self, files):
+        taxonomy = Taxonomy.empty(EMBEDDING_DIM)
+        self._fold_in(taxonomy, files)
+        taxonomy.learned().save(self.taxonomy_path)
+        return taxonomy
+
+    @staticmethod
+    def _fold_in(taxonomy, files):
+        for name, path in files.items():
+            signature = file_signature(path)
+            taxonomy.documents[name] = signature + [taxonomy.add(labeled_items([path]))]
+
+    def get_taxonomy(self):
+        with self._lock:
+            if self.fixed:
+                return self.taxonomy
+            files = {os.path.basename(path): path for path in list_labeled(self.labeled_dir)}
+            if self.taxonomy is None and os.path.exists(self.taxonomy_path):
+                self.taxonomy = Taxonomy.load(self.taxonomy_path)
+            if self.taxonomy is None:
+                self.taxonomy = self._learn(files)
+                return self.taxonomy
+
+            learned = self.taxonomy.documents
+            new, stale = {}, []
+            for name, path in files.items():
+                if name not in learned:
+                    new[name] = path
+                elif learned[name][:2] != file_signature(path):
+                    # A changed document that taught nothing (e.g. centroid output) can simply be read again
+                    if learned[name][2]:
+                        stale.append(name)
+                    else:
+                        new[name] = path
+            stale += [name for name in learned if name not in files and learned[name][2]]
+            if new:
+                before = int(self.taxonomy.counts[0].sum())
+                self._fold_in(self.taxonomy, new)
+                self.taxonomy.save(self.taxonomy_path)
+                print(f"[INFO] Folded {int(self.taxonomy.counts[0].sum()) - before} labeled chunks from "
+                      f"{len(new)} new documents into the taxonomy.")
+            if stale and not self._stale_warned:
+                print(f"[WARNING] {len(stale)} documents changed or were removed since the taxonomy learned from them; "
+                      f"run `python -m chunking.backends --relearn` to relearn it.")
+                self._stale_warned = True
+            return self.taxonomy
+
+    def label_batch(self, chunks):
+        taxonomy = self.get_taxonomy()
+        service = get_embedding_service()
+        chunk_vectors = service.encode_documents(chunks)
+        sentences = [split_sentences(chunk) or [chunk] for chunk in chunks]
+        sentence_vectors = service.encode_documents([s for chunk_sentences in sentences for s in chunk_sentences])
+
+        results, offset = [], 0
+        for chunk, chunk_sentences, vector, ((subject, topic, subtopic), score) in zip(
+                chunks, sentences, chunk_vectors, taxonomy.assign(chunk_vectors)):
+            scores = sentence_vectors[offset:offset + len(chunk_sentences)] @ vector
+            offset += len(chunk_sentences)
+            ranked = np.argsort(-scores)
+            summary = " ".join(chunk_sentences[i] for i in sorted(ranked[:SUMMARY_SENTENCES]))
+            results.append([{
+                "subject": subject,
+                "topic": topic,
+                "subtopic": subtopic,
+                "title": self.title(chunk, chunk_sentences[ranked[0]]),
+                "summary": summary,
+                "score": round(score, 4),
+                LABELER_FIELD: self.name,
+                "text": chunk,
+            }])
+        return results
+
+    def title(self, chunk, central_sentence):
+        headers = find_headers(chunk[:200], strict=True)
+        if headers and headers[0][1] == 0:
+            return headers[0][0].title()
+        words = central_sentence.split()
+        title = " ".join(words[:TITLE_MAX_WORDS]).rstrip(".,;:!?")
+        return title + ("..." if len(words) > TITLE_MAX_WORDS else "")
+
+
+backends = {}
+
+
+def register_backend(backend):
+    backends[backend.name] = backend
+    return backend
+
+
+def get_backend(name):
+    if name not in backends:
+        raise ValueError(f"Unknown labeler backend {name!r}; choose from {', '.join(sorted(backends))}.")
+    return backends[name]
+
+
+register_backend(CentroidLabeler())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the centroid labeler's taxonomy.")
+    parser.add_argument("--relearn", action="store_true", help="relearn it from every LLM-labeled document")
+    args = parser.parse_args()
+    if args.relearn:
+        get_backend("centroid").relearn()
+    else:
+        parser.print_help()
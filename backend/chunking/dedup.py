@@ -0,0 +1,342 @@
+"""
+Near-duplicate chunk detection across ingests.
+
+Every labeled chunk gets a MinHash signature over its word shingles, stored
+with its labels in an SQLite LSH index (data/index/dedup.sqlite). Before
+labeling, each new chunk is looked up there. A near-duplicate of a chunk
+from another document takes that chunk's labels and is marked with
+"duplicate_of", so it is not labeled again, gets no vector in the search
+index and no node in the graph. Its record still goes into the document's
+labeled file. Near-duplicates within one document are resolved the same
+way against the document's first copy. Labels are only reused from chunks
+labeled by the same labeler (backend, and model and runtime for the LLM).
+
+    python -m chunking.dedup --report
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+
+DEDUP_INDEX_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/index/dedup.sqlite"))
+
+# Set MINDMAP_DEDUP=0 to label every chunk
+DEDUP = os.environ.get("MINDMAP_DEDUP", "1") != "0"
+# Estimated Jaccard similarity of word shingles above which two chunks are duplicates
+DEDUP_THRESHOLD = float(os.environ.get("MINDMAP_DEDUP_THRESHOLD", "0.8"))
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+SEED = 1
+MERSENNE_PRIME = (1 << 61) - 1
+COUNTERS = ["chunks_checked", "duplicates", "llm_calls_saved", "vectors_saved", "graph_nodes_saved"]
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    """The distinct word n-grams of a text, as 32-bit hashes."""
+    words = re.findall(r"\w+", text.casefold())
+    if len(words) <= size:
+        return np.array([zlib.crc32(" ".join(words).encode("utf-8"))], dtype="uint64")
+    grams = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype="uint64", count=len(grams))
+
+
+permutations = {}
+
+
+def get_permutations(num_perm=NUM_PERM):
+    if num_perm not in permutations:
+        rng = np.random.default_rng(SEED)
+        permutations[num_perm] = (rng.integers(1, MERSENNE_PRIME, num_perm, dtype="uint64"),
+                                  rng.integers(0, MERSENNE_PRIME, num_perm, dtype="uint64"))
+    return permutations[num_perm]
+
+
+def minhash(text, num_perm=NUM_PERM):
+    """MinHash signature of a text's shingles: num_perm 32-bit values."""
+    a, b = get_permutations(num_perm)
+    hashed = (shingles(text)[:, None] * a + b) % MERSENNE_PRIME & 0xFFFFFFFF
+    return hashed.min(axis=0).astype("uint32")
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    return float(np.mean(signature == other))
+
+
+def lsh_params(threshold, num_perm=NUM_PERM):
+    """
+    Bands and rows per band for the LSH index, chosen so that pairs below the
+    threshold rarely share a bucket and pairs above it rarely miss one
+    (equal weight on both kinds of error).
+    """
+    xs = np.linspace(0.0, 1.0, 201)
+    below, above = xs < threshold, xs >= threshold
+    best, best_error = None, None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            hit = 1.0 - (1.0 - xs ** rows) ** bands
+            # Areas under the false positive and false negative curves (the grid step is constant)
+            error = hit[below].sum() + (1.0 - hit[above]).sum()
+            if best_error is None or error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+class DedupIndex:
+    """
+    MinHash signatures of labeled chunks in banded LSH buckets, persisted in
+    SQLite. Chunks are added as soon as they are sent for labeling; their
+    labels are filled in once labeled.
+    """
+
+    def __init__(self, path=DEDUP_INDEX_PATH, threshold=DEDUP_THRESHOLD, num_perm=NUM_PERM):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY, doc_id TEXT NOT NULL, signature BLOB NOT NULL, labels TEXT, labeler TEXT);
+            CREATE TABLE IF NOT EXISTS buckets (band INTEGER NOT NULL, hash INTEGER NOT NULL, chunk_id INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS chunks_doc ON chunks(doc_id);
+            CREATE INDEX IF NOT EXISTS buckets_hash ON buckets(band, hash);
+            CREATE INDEX IF NOT EXISTS buckets_chunk ON buckets(chunk_id);
+        """)
+        self._add_labeler_column()
+        self._rebucket_if_changed()
+        self._conn.commit()
+
+    def _add_labeler_column(self):
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")]
+        if "labeler" in columns:
+            return
+        # Indexes from before labels were keyed by labeler cannot tell whose labels they hold
+        self._conn.execute("ALTER TABLE chunks ADD COLUMN labeler TEXT")
+        self._conn.execute("DELETE FROM buckets")
+        self._conn.execute("DELETE FROM chunks")
+        print("[INFO] Cleared the dedup index, which did not record which labeler produced its labels.")
+
+    def _rebucket_if_changed(self):
+        # Buckets depend on the banding, which follows the threshold
+        params = f"{self.num_perm}:{self.bands}:{self.rows}"
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'lsh'").fetchone()
+        if row and row[0] == params:
+            return
+        if row and row[0].split(":")[0] != str(self.num_perm):
+            # Signatures of another length cannot be compared; start over
+            self._conn.execute("DELETE FROM chunks")
+        self._conn.execute("DELETE FROM buckets")
+        for chunk_id, signature in self._conn.execute("SELECT id, signature FROM chunks").fetchall():
+            self._insert_buckets(chunk_id, np.frombuffer(signature, dtype="uint32"))
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('lsh', ?)", (params,))
+        if row:
+            print(f"[INFO] Re-bucketed the dedup index for threshold {self.threshold}.")
+
+    def _band_hashes(self, signature):
+        return [int.from_bytes(hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(),
+                                               digest_size=8).digest(), "big", signed=True)
+                for band in range(self.bands)]
+
+    def _insert_buckets(self, chunk_id, signature):
+        self._conn.executemany(
+            "INSERT INTO buckets (band, hash, chunk_id) VALUES (?, ?, ?)",
+            [(band, value, chunk_id) for band, value in enumerate(self._band_hashes(signature))],
+        )
+
+    def match(self, signature, labeler, document=None):
+        """
+        The closest chunk indexed by the given labeler at or above the
+        threshold, as (id, doc_id, labels or None while pending, similarity),
+        or None. A chunk of the given document wins over closer chunks of
+        other documents.
+        """
+        pairs = list(enumerate(self._band_hashes(signature)))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT c.id, c.doc_id, c.labels, c.signature FROM buckets b JOIN chunks c ON c.id = b.chunk_id "
+                f"WHERE ({' OR '.join('(b.band = ? AND b.hash = ?)' for _ in pairs)}) AND c.labeler = ?",
+                [value for pair in pairs for value in pair] + [labeler],
+            ).fetchall()
+        best = None
+        for chunk_id, doc_id, labels, other in rows:
+            score = similarity(signature, np.frombuffer(other, dtype="uint32"))
+            if score < self.threshold:
+                continue
+            candidate = (doc_id == document, score, chunk_id, doc_id, labels)
+            if best is None or candidate[:2] > best[:2]:
+                best = candidate
+        if best is None:
+            return None
+        _, score, chunk_id, doc_id, labels = best
+        return chunk_id, doc_id, None if labels is None else json.loads(labels), score
+
+    def add(self, document, signature, labeler):
+        """Indexes the signature of a new chunk of a document, to be labeled by labeler, uncommitted. Returns its id."""
+        with self._lock:
+            cursor = self._conn.execute("INSERT INTO chunks (doc_id, signature, labeler) VALUES (?, ?, ?)",
+                                        (document, signature.tobytes(), labeler))
+            self._insert_buckets(cursor.lastrowid, signature)
+        return cursor.lastrowid
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def set_labels(self, labels):
+        """Stores the labels of chunks given as {id: list of label dicts}."""
+        with self._lock:
+            self._conn.executemany("UPDATE chunks SET labels = ? WHERE id = ?",
+                                   [(json.dumps(items), chunk_id) for chunk_id, items in labels.items()])
+            self._conn.commit()
+
+    def remove(self, ids, document=None, keep=()):
+        """Removes the given chunks, plus every chunk of document not in keep (its old version)."""
+        ids = set(ids)
+        with self._lock:
+            if document is not None:
+                ids |= {row[0] for row in self._conn.execute("SELECT id FROM chunks WHERE doc_id = ?", (document,))}
+                ids -= set(keep)
+            ids = list(ids)
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                self._conn.execute(f"DELETE FROM buckets WHERE chunk_id IN ({placeholders})", batch)
+                self._conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+            self._conn.commit()
+        return len(ids)
+
+    def count(self, **counters):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                [(name, int(value)) for name, value in counters.items() if value],
+            )
+            self._conn.commit()
+
+    def stats(self):
+        """Work saved by deduplication since the index was created."""
+        with self._lock:
+            stats = {name: 0 for name in COUNTERS}
+            stats.update(self._conn.execute("SELECT name, value FROM stats"))
+            stats["indexed_chunks"] = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        stats["threshold"] = self.threshold
+        stats["duplicate_rate"] = round(stats["duplicates"] / stats["chunks_checked"], 3) if stats["chunks_checked"] else None
+        return stats
+
+
+dedup_index = None
+
+
+def get_dedup_index():
+    global dedup_index
+    if dedup_index is None:
+        dedup_index = DedupIndex()
+    return dedup_index
+
+
+def dedup_stats():
+    return get_dedup_index().stats()
+
+
+class DocumentDedup:
+    """
+    Deduplication of one document's chunks while label_chunk labels it.
+    plan() sorts the chunks into duplicates, which get their labels from
+    labels_for(), and chunks that still need labeling. finish() stores the
+    labels of those and drops the document's chunks from an earlier ingest.
+    labeler identifies what labels the document, as "<backend>" or
+    "<backend>:<details>" (see LabelerBackend.labeler_id).
+    """
+
+    def __init__(self, document, labeler, index=None):
+        self.document = document
+        self.labeler = labeler
+        self.index = index or get_dedup_index()
+        # chunk index -> (dedup id, doc_id, labels) of the chunk it duplicates
+        self.matches = {}
+        # chunk index -> index of an earlier chunk of this document it duplicates
+        self.copies = {}
+        # chunk index -> dedup id, for the chunks that are labeled now, and back
+        self.new_ids = {}
+        self.new_chunks = {}
+        self.reused_ids = set()
+
+    def plan(self, chunks):
+        """Returns the indexes of the chunks that still need labeling, in order."""
+        signatures = [minhash(chunk, self.index.num_perm) for chunk in chunks]
+        pending = []
+        for i, signature in enumerate(signatures):
+            found = self.index.match(signature, self.labeler, self.document)
+            if found is not None:
+                chunk_id, doc_id, labels, _ = found
+                if chunk_id in self.new_chunks:
+                    self.copies[i] = self.new_chunks[chunk_id]
+                    continue
+                if labels is not None:
+                    self.matches[i] = (chunk_id, doc_id, labels)
+                    if doc_id == self.document:
+                        self.reused_ids.add(chunk_id)
+                    continue
+            self.new_ids[i] = self.index.add(self.document, signature, self.labeler)
+            self.new_chunks[self.new_ids[i]] = i
+            pending.append(i)
+        self.index.commit()
+        duplicates = len(self.copies) + sum(1 for _, doc_id, _ in self.matches.values() if doc_id != self.document)
+        print(f"[INFO] Dedup: {duplicates} near-duplicate chunks, {len(pending)} to label "
+              f"(threshold {self.index.threshold}).")
+        return pending
+
+    def duplicate_of(self, i):
+        """The dedup id a chunk duplicates, or None if it is the document's own copy."""
+        if i in self.copies:
+            return self.new_ids[self.copies[i]]
+        chunk_id, doc_id, _ = self.matches[i]
+        return None if doc_id == self.document else chunk_id
+
+    def labels_for(self, i, results):
+        """Label dicts (without text) for a chunk plan() did not send for labeling."""
+        if i in self.copies:
+            return [{k: v for k, v in item.items() if k != "text"} for item in results[self.copies[i]]]
+        return [dict(item) for item in self.matches[i][2]]
+
+    def finish(self, results):
+        """
+        Stores the labels of the newly labeled chunks and counts the work
+        saved: a labeling call per duplicate chunk, and a vector and a graph
+        node per duplicate record, which indexing and the graph skip.
+        """
+        labeled = {chunk_id: [{k: v for k, v in item.items() if k not in ("text", "page_start", "page_end")}
+                              for item in results[i] if isinstance(item, dict)]
+                   for i, chunk_id in self.new_ids.items()}
+        self.index.set_labels({chunk_id: items for chunk_id, items in labeled.items() if items})
+        failed = [chunk_id for chunk_id, items in labeled.items() if not items]
+        keep = set(self.new_ids.values()) - set(failed) | self.reused_ids
+        self.index.remove(failed, document=self.document, keep=keep)
+        duplicates = [i for i in list(self.matches) + list(self.copies) if self.duplicate_of(i) is not None]
+        records = sum(len(results[i]) for i in duplicates)
+        self.index.count(chunks_checked=len(results), duplicates=len(duplicates),
+                         llm_calls_saved=len(duplicates) if self.labeler.split(":")[0] == "llm" else 0,
+                         vectors_saved=records, graph_nodes_saved=records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the work saved by near-duplicate detection.")
+    parser.add_argument("--report", action="store_true", help="print the saved LLM calls, vectors and graph nodes")
+    parser.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD)
+    args = parser.parse_args()
+    if args.report:
+        for name, value in DedupIndex(threshold=args.threshold).stats().items():
+            print(f"{name:<20} {value}")
+    else:
+        parser.print_help()
@@ -0,0 +1,135 @@
+import atexit
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.cache import CACHE_DIR, SQLiteCache, make_key
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+BATCH_SIZE = 64
+
+# "torch" (default), "int8" (dynamically quantized Linear layers) or "onnx" (sentence-transformers ONNX backend)
+RUNTIME = "torch"
+# Encode with this many worker processes when there are enough texts; 0 disables the pool
+PROCESSES = 0
+MIN_TEXTS_FOR_POOL = 512
+
+EMBEDDING_CACHE_PATH = os.path.join(CACHE_DIR, "embeddings.sqlite")
+EMBEDDING_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+QUERY_CACHE_SIZE = 1024
+
+
+class EmbeddingService:
+    """
+    Turns texts into normalized float32 embeddings for both indexing and
+    queries. The model is loaded on first use. Document embeddings are cached
+    on disk by text hash, query embeddings in an in-memory LRU.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, runtime=RUNTIME, batch_size=BATCH_SIZE, processes=PROCESSES,
+                 cache_path=EMBEDDING_CACHE_PATH, query_cache_size=QUERY_CACHE_SIZE):
+        self.model_name = model_name
+        self.runtime = runtime
+        self.batch_size = batch_size
+        self.processes = processes
+        self.cache = SQLiteCache(cache_path, max_bytes=EMBEDDING_CACHE_MAX_BYTES) if cache_path else None
+        self.query_cache_size = query_cache_size
+        self._queries = OrderedDict()
+        self._model = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                self._model = self._load_model()
+            return self._model
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def _load_model(self):
+        from sentence_transformers import SentenceTransformer
+
+        print(f"[INFO] Loading embedding model {self.model_name} ({self.runtime})...")
+        if self.runtime == "onnx":
+            model = SentenceTransformer(self.model_name, backend="onnx")
+        else:
+            model = SentenceTransformer(self.model_name, device="cpu" if self.runtime == "int8" else None)
+            if self.runtime == "int8":
+                import torch
+
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        print("[INFO] Embedding model loaded.")
+        return model
+
+    def _encode(self, texts):
+        if not texts:
+            return np.zeros((0, EMBEDDING_DIM), dtype="float32")
+        if self.processes > 1 and len(texts) >= MIN_TEXTS_FOR_POOL:
+            if self._pool is None:
+                self._pool = self.model.start_multi_process_pool(["cpu"] * self.processes)
+                atexit.register(self.close)
+            vectors = self.model.encode_multi_process(texts, self._pool, batch_size=self.batch_size)
+        else:
+            vectors = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                        normalize_embeddings=True, show_progress_bar=False)
+        vectors = np.asarray(vectors, dtype="float32")
+        # The process pool does not normalize, and this keeps the contract explicit either way
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _key(self, text):
+        return make_key(self.model_name, self.runtime, text)
+
+    def encode_documents(self, texts):
+        """Embeds chunk texts, reusing embeddings cached on disk. Returns an (n, dim) float32 array."""
+        texts = list(texts)
+        if self.cache is None:
+            return self._encode(texts)
+
+        keys = [self._key(text) for text in texts]
+        cached = self.cache.get_many(keys)
+        missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in cached))
+        if missing:
+            vectors = self._encode(missing)
+            new_entries = {self._key(text): vector.tobytes() for text, vector in zip(missing, vectors)}
+            self.cache.put_many(new_entries)
+            cached.update(new_entries)
+        print(f"[INFO] Embedded {len(texts)} texts ({len(texts) - len(missing)} from cache).")
+        if not texts:
+            return np.zeros((0, EMBEDDING_DIM), dtype="float32")
+        return np.stack([np.frombuffer(cached[key], dtype="float32") for key in keys])
+
+    def encode_query(self, text):
+        """Embeds one query, remembering the most recent QUERY_CACHE_SIZE queries. Returns a (1, dim) array."""
+        with self._lock:
+            if text in self._queries:
+                self._queries.move_to_end(text)
+                return self._queries[text]
+        vector = self._encode([text])
+        with self._lock:
+            self._queries[text] = vector
+            if len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+        return vector
+
+    def close(self):
+        if self._pool is not None:
+            self._model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+
+embedding_service = None
+
+
+def get_embedding_service():
+    global embedding_service
+    if embedding_service is None:
+        embedding_service = EmbeddingService()
+    return embedding_service
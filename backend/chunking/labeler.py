@@ -1,17 +1,153 @@
-import torch
-from transformers import pipeline
 import re
+import inspect
 import json
+import os
+import threading
+import time
+
+from chunking.backends import LabelerBackend, get_backend, register_backend
+from chunking.dedup import DEDUP, DocumentDedup
+from chunking.splitter import pack_token_chunks, split_sentences
+from preprocessing.structure_detector import find_headers
+from utils.cache import CACHE_DIR, SQLiteCache, make_key
 
 # Initialize the model pipeline once
 generator = None
+tokenizer = None
+
+# Labeler backend used when a request or job does not pick one: "llm" or "centroid" (see chunking.backends)
+DEFAULT_BACKEND = os.environ.get("MINDMAP_LABELER", "llm")
+
+# Number of chunks sent through the pipeline per forward pass
+BATCH_SIZE = 4
+MAX_NEW_TOKENS = 500
+
+MODEL_NAME = "databricks/dolly-v2-3b"
+
+# How the model runs: "torch" (fp32, or the GPU when there is one), "int8" (dynamically
+# quantized Linear layers), "int4" (optimum-quanto int4 weights) or "onnx" (onnxruntime
+# via optimum, exported once to ONNX_DIR, with the KV cache kept between decoding steps)
+RUNTIME = os.environ.get("MINDMAP_LABELER_RUNTIME", "torch")
+RUNTIMES = ["torch", "int8", "int4", "onnx"]
+# Intra-op threads per worker; 0 leaves the library default (all cores)
+THREADS = int(os.environ.get("MINDMAP_LABELER_THREADS", "0"))
+# Prefill the static part of the prompt once per model load and reuse its keys/values for
+# every chunk (not with the onnx runtime, whose sessions manage their own cache)
+PREFIX_CACHE = True
+prefix_cache = None
+generator_runtime = None
+
+ONNX_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/models/dolly-v2-3b-onnx"))
+
+# In structured mode the labeler writes the JSON skeleton itself and the model
+# only fills in the field values, each stopped at its closing quote
+STRUCTURED_OUTPUT = True
+LABEL_FIELDS = ["subject", "topic", "subtopic", "title", "summary"]
+FIELD_MAX_TOKENS = {"subject": 12, "topic": 16, "subtopic": 16, "title": 32, "summary": 300}
+MAX_TOPICS_PER_CHUNK = 3
+
+# Tokens generated vs. labels produced, across all label_chunk calls
+generation_counters = {"labels": 0, "tokens": 0, "field_retries": 0, "failed_chunks": 0,
+                       "prefix_reuses": 0, "prefill_saved_s": 0.0}
+generation_lock = threading.Lock()
+
+# Chunks are packed so that prompt + chunk + answer fit the model's context window
+MODEL_CONTEXT_TOKENS = 2048
+CONTEXT_MARGIN_TOKENS = 16
+CHUNK_OVERLAP_TOKENS = 0
+
+# Labels are cached on disk by a hash of (model, prompt template, chunk text)
+LABEL_CACHE_PATH = os.path.join(CACHE_DIR, "labels.sqlite")
+LABEL_CACHE_MAX_BYTES = 512 * 1024 * 1024
+label_cache = None
+
+def load_model(runtime=RUNTIME, threads=THREADS):
+    """Loads the labeling model for the given runtime. Returns (model, device)."""
+    import torch
+
+    if threads:
+        torch.set_num_threads(threads)
+    if runtime == "onnx":
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForCausalLM
 
-def initialize_generator():
-    global generator
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        exported = os.path.exists(os.path.join(ONNX_DIR, "config.json"))
+        model = ORTModelForCausalLM.from_pretrained(ONNX_DIR if exported else MODEL_NAME, export=not exported,
+                                                    use_cache=True, session_options=options)
+        if not exported:
+            print(f"[INFO] Saving the ONNX export to {ONNX_DIR}...")
+            model.save_pretrained(ONNX_DIR)
+        return model, -1
+
+    from transformers import AutoModelForCausalLM
+
+    if runtime == "torch":
+        return MODEL_NAME, 0 if torch.cuda.is_available() else -1
+    model = AutoModelForCausalLM.from_pretrained(MODEL_NAME, low_cpu_mem_usage=True, trust_remote_code=True)
+    if runtime == "int8":
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif runtime == "int4":
+        from optimum.quanto import freeze, qint4, quantize
+
+        quantize(model, weights=qint4)
+        freeze(model)
+    else:
+        raise ValueError(f"Unknown labeler runtime {runtime!r}; choose from {', '.join(RUNTIMES)}.")
+    return model.eval(), -1
+
+def initialize_generator(runtime=None, threads=None):
+    global generator, generator_runtime, prefix_cache
     if generator is None:
-        print("[INFO] Initializing the text generation model...")
-        generator = pipeline("text-generation", model="databricks/dolly-v2-3b", device=0 if torch.cuda.is_available() else -1, trust_remote_code=True)
-        print("[INFO] Model initialized.")
+        # torch and transformers take seconds to import, so only pay for them once the model is needed
+        from transformers import AutoTokenizer, pipeline
+
+        runtime = runtime or RUNTIME
+        print(f"[INFO] Initializing the text generation model ({runtime})...")
+        started = time.perf_counter()
+        model, device = load_model(runtime, THREADS if threads is None else threads)
+        generator = pipeline("text-generation", model=model, tokenizer=AutoTokenizer.from_pretrained(MODEL_NAME),
+                             device=device, trust_remote_code=True)
+        # Batched generation needs a pad token; pad on the left so every prompt ends right before the new tokens
+        if generator.tokenizer.pad_token_id is None:
+            generator.tokenizer.pad_token_id = generator.tokenizer.eos_token_id
+        generator.tokenizer.padding_side = "left"
+        generator_runtime, prefix_cache = runtime, None
+        print(f"[INFO] Model initialized in {time.perf_counter() - started:.1f}s.")
+
+def get_label_cache():
+    global label_cache
+    if label_cache is None:
+        label_cache = SQLiteCache(LABEL_CACHE_PATH, max_bytes=LABEL_CACHE_MAX_BYTES)
+    return label_cache
+
+def label_cache_stats():
+    """Returns the hit/miss counters and size of the label cache."""
+    return get_label_cache().stats()
+
+def generation_stats():
+    """Generation counters, including the tokens spent per successfully produced label."""
+    with generation_lock:
+        stats = dict(generation_counters)
+    stats["tokens_per_label"] = round(stats["tokens"] / stats["labels"], 1) if stats["labels"] else None
+    stats["prefill_saved_s"] = round(stats["prefill_saved_s"], 2)
+    return stats
+
+def count_generation(labels=0, tokens=0, field_retries=0, failed_chunks=0, prefix_reuses=0, prefill_saved_s=0.0):
+    with generation_lock:
+        generation_counters["prefix_reuses"] += prefix_reuses
+        generation_counters["prefill_saved_s"] += prefill_saved_s
+        generation_counters["labels"] += labels
+        generation_counters["tokens"] += tokens
+        generation_counters["field_retries"] += field_retries
+        generation_counters["failed_chunks"] += failed_chunks
+
+def label_cache_key(chunk, runtime=None):
+    # Quantized and exported runtimes can label differently from the full-precision model
+    return make_key(MODEL_NAME, runtime or generator_runtime or RUNTIME, PROMPT_TEMPLATE, chunk)
 
 # Prompt for the LLM
 PROMPT_TEMPLATE = """
@@ -48,75 +184,577 @@ Now, analyze the following text and generate the structured summary:
 {text}
 """
 
-def chunk_text(text, max_chunk_size=500):
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), max_chunk_size):
-        chunk = " ".join(words[i:i+max_chunk_size])
-        if len(chunk.strip()) > 150:  # Skip very small fragments
-            chunks.append(chunk)
-    return chunks
-
-def label_chunk(text):
-    initialize_generator()
-    
-    chunks = chunk_text(text)
-    labeled_chunks = []
-
-    for i, chunk in enumerate(chunks):
-        print(f"[INFO] Processing chunk {i+1}/{len(chunks)}...")
-        prompt = PROMPT_TEMPLATE.format(text=chunk)
-        
+# Used when a field came back empty or never closed: ask for that field alone
+FIELD_RETRY_TEMPLATE = """
+{text}
+
+Answer in one line. {question}
+Answer: \""""
+
+FIELD_QUESTIONS = {
+    "subject": "What is the main subject category of the text above (e.g. Computer Science)?",
+    "topic": "What specific topic within its subject does the text above cover?",
+    "subtopic": "What finer-grained subtopic does the text above cover?",
+    "title": "What is a concise, descriptive title for the text above?",
+    "summary": "Summarize the key points of the text above.",
+}
+
+# Everything before the chunk text is the same for every prompt
+PROMPT_PREFIX = PROMPT_TEMPLATE.split("{text}")[0]
+
+def build_prompt(chunk):
+    # Not str.format: the JSON example in the template is full of braces
+    return PROMPT_TEMPLATE.replace("{text}", chunk)
+
+def get_prefix_cache():
+    """
+    Keys/values of PROMPT_PREFIX, computed on first use after the model is
+    loaded. Returns (prefix token ids, (key, value) per layer, prefill
+    seconds) or None when prefix caching is off for this runtime.
+    """
+    global prefix_cache
+    if prefix_cache is None and PREFIX_CACHE and generator_runtime != "onnx":
+        import torch
+
+        tok, model = generator.tokenizer, generator.model
+        prefix_ids = tok(PROMPT_PREFIX)["input_ids"]
+        started = time.perf_counter()
+        with torch.no_grad():
+            past = model(input_ids=torch.tensor([prefix_ids], device=model.device), use_cache=True).past_key_values
+        seconds = time.perf_counter() - started
+        prefix_cache = (prefix_ids, cache_layers(past), seconds)
+        print(f"[INFO] Cached the prompt prefix ({len(prefix_ids)} tokens, {seconds:.2f}s to prefill).")
+    return prefix_cache
+
+def cache_layers(past):
+    """The (key, value) tensors of every layer of a model's cache, from transformers 4 or 5 (or onnx tuples)."""
+    if hasattr(past, "layers"):
+        return [(layer.keys, layer.values) for layer in past.layers]
+    if hasattr(past, "to_legacy_cache"):
+        return list(past.to_legacy_cache())
+    return list(past)
+
+def make_cache(layers):
+    """A cache the model can append to, holding the given (key, value) tensors."""
+    try:
+        from transformers import DynamicCache
+    except ImportError:
+        return tuple(layers)
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(tuple(layers))
+    return DynamicCache(tuple(layers))
+
+def crop_cache(past, length, total):
+    """Cuts a cache of total slots back to its first length slots."""
+    if length == 0:
+        return None
+    if hasattr(past, "crop"):
+        past.crop(length - total)
+        return past
+    return tuple((key[..., :length, :], value[..., :length, :]) for key, value in past)
+
+def select_cache(past, index):
+    if hasattr(past, "batch_select_indices"):
+        past.batch_select_indices(index)
+        return past
+    return tuple((key[index], value[index]) for key, value in past)
+
+def common_prefix_length(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+class DecodingSession:
+    """
+    Greedy decoding of a batch of texts that keeps the model's keys/values
+    between calls: a structured answer is prefilled once, and every later
+    step only feeds the text the labeler appends and the generated tokens.
+
+    Appended text is tokenized together with everything before it and the
+    cache is cut back to the first token that differs, so the model always
+    sees exactly the tokenization of the whole text (generated tokens that
+    match it are kept). Each feed is left-padded within its own segment;
+    the attention mask and position ids skip the padded slots.
+    """
+
+    def __init__(self, texts):
+        import torch
+
+        self.tok, self.model = generator.tokenizer, generator.model
+        self.device = self.model.device
+        self.texts = list(texts)
+        self.ids = [[] for _ in self.texts]  # tokens in the cache, per row
+        self.mask = torch.zeros((len(self.texts), 0), dtype=torch.long, device=self.device)
+        self.past = None
+        self.logits = None  # next-token logits per row
+        self.synced = False
+        self.prefix_seconds = 0.0
+        parameters = inspect.signature(self.model.forward).parameters
+        # Only the last position's logits are used, not a vocabulary-sized row per prompt token
+        self.forward_args = next(({name: 1} for name in ("logits_to_keep", "num_logits_to_keep") if name in parameters), {})
+
+        cached = get_prefix_cache() if self.texts and all(text.startswith(PROMPT_PREFIX) for text in self.texts) else None
+        if cached is not None:
+            prefix_ids, layers, seconds = cached
+            rows = len(self.texts)
+            # A copy per session, since the model appends to the cache it is given
+            self.past = make_cache([(key.expand(rows, -1, -1, -1).contiguous(),
+                                     value.expand(rows, -1, -1, -1).contiguous()) for key, value in layers])
+            self.ids = [list(prefix_ids) for _ in self.texts]
+            self.mask = torch.ones((rows, len(prefix_ids)), dtype=torch.long, device=self.device)
+            self.prefix_seconds = seconds
+
+    def extend(self, suffixes):
+        """Appends text to every row: one string for all rows, or one per row."""
+        if isinstance(suffixes, str):
+            suffixes = [suffixes] * len(self.texts)
+        self.texts = [text + suffix for text, suffix in zip(self.texts, suffixes)]
+        self.synced = False
+
+    def sync(self):
+        """Feeds the tokens the cache is missing, so self.logits predicts what follows each text."""
+        if self.synced:
+            return
+        targets = self.tok(self.texts)["input_ids"]
+        # The last token of every row is always fed again, for its next-token logits
+        keep = [min(common_prefix_length(ids, target), len(target) - 1) for ids, target in zip(self.ids, targets)]
+        # The cache is cut for all rows at once, at the earliest slot a row has to rewrite
+        filled = self.mask.cumsum(1)
+        cut = min(int((row < k).sum()) + 1 if k else 0 for row, k in zip(filled, keep))
+        if cut < self.mask.shape[1]:
+            self.past = crop_cache(self.past, cut, self.mask.shape[1])
+            self.mask = self.mask[:, :cut]
+        if self.prefix_seconds:
+            prefix_length = len(get_prefix_cache()[0])
+            count_generation(prefix_reuses=len(self.texts),
+                             prefill_saved_s=len(self.texts) * self.prefix_seconds * min(cut, prefix_length) / prefix_length)
+            self.prefix_seconds = 0.0
+        kept = self.mask.sum(1).tolist()
+        self.ids = [ids[:n] for ids, n in zip(self.ids, kept)]
+        self.feed([target[n:] for target, n in zip(targets, kept)])
+        self.synced = True
+
+    def feed(self, tokens):
+        """Runs the model on new tokens for every row (a row may get none) and appends them to the cache."""
+        import torch
+
+        width = max(len(row) for row in tokens)
+        starts = self.mask.sum(1).tolist()
+        input_ids = [[self.tok.pad_token_id] * (width - len(row)) + row for row in tokens]
+        segment = [[0] * (width - len(row)) + [1] * len(row) for row in tokens]
+        positions = [[0] * (width - len(row)) + list(range(start, start + len(row))) for row, start in zip(tokens, starts)]
+        mask = torch.cat([self.mask, torch.tensor(segment, dtype=torch.long, device=self.device)], dim=1)
+        with torch.no_grad():
+            output = self.model(input_ids=torch.tensor(input_ids, device=self.device), attention_mask=mask,
+                                position_ids=torch.tensor(positions, device=self.device),
+                                past_key_values=self.past, use_cache=True, **self.forward_args)
+        self.past, self.mask = output.past_key_values, mask
+        logits = output.logits[:, -1, :]
+        if self.logits is not None:
+            fed = torch.tensor([bool(row) for row in tokens], device=self.device)
+            logits = torch.where(fed[:, None], logits, self.logits)
+        self.logits = logits
+        for ids, row in zip(self.ids, tokens):
+            ids.extend(row)
+
+    def generate(self, max_new_tokens, stop_at_quote=True):
+        """
+        Greedily continues every row until the end-of-text token or, with
+        stop_at_quote, the quote (or newline) closing a JSON string value;
+        only the newest token is decoded to check. Returns the new token ids
+        of every row. They stay in the cache, but not in the text.
+        """
+        self.sync()
+        eos = self.tok.eos_token_id
+        rows = range(len(self.texts))
+        new = [[] for _ in rows]
+        done = [False for _ in rows]
+        escaped = [False for _ in rows]
+        for step in range(max_new_tokens):
+            for row, token in enumerate(self.logits.argmax(-1).tolist()):
+                if done[row]:
+                    continue
+                new[row].append(token)
+                if token == eos:
+                    done[row] = True
+                elif stop_at_quote:
+                    end, escaped[row] = scan_value(self.tok.decode([token]), escaped[row])
+                    done[row] = end != -1
+            if all(done) or step + 1 == max_new_tokens:
+                break
+            self.feed([[] if done[row] else new[row][-1:] for row in rows])
+        return new
+
+    def prefers(self, token, other):
+        """Whether the next token of each row is more likely to be token than other."""
+        self.sync()
+        return (self.logits[:, token] > self.logits[:, other]).tolist()
+
+    def lengths(self):
+        self.sync()
+        return [len(ids) for ids in self.ids]
+
+    def select(self, rows):
+        """Keeps only the given rows, in that order."""
+        import torch
+
+        index = torch.tensor(rows, dtype=torch.long, device=self.device)
+        if self.past is not None:
+            self.past = select_cache(self.past, index)
+        self.mask = self.mask[index]
+        if self.logits is not None:
+            self.logits = self.logits[index]
+        self.texts = [self.texts[row] for row in rows]
+        self.ids = [self.ids[row] for row in rows]
+
+def get_tokenizer():
+    """The labeling model's tokenizer, loaded on its own so chunking does not need the model."""
+    global tokenizer
+    if generator is not None:
+        return generator.tokenizer
+    if tokenizer is None:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    return tokenizer
+
+def chunk_token_budget():
+    """Tokens left for the chunk once the prompt and the generated answer fit in the context window."""
+    prompt_tokens = len(get_tokenizer()(build_prompt(""))["input_ids"])
+    return MODEL_CONTEXT_TOKENS - prompt_tokens - MAX_NEW_TOKENS - CONTEXT_MARGIN_TOKENS
+
+def iter_segments(pages):
+    """
+    Turns (page_number, text) pairs into sentence segments for
+    pack_token_chunks, flagging the sentences that open a section detected by
+    structure_detector. Sentences are tokenized one page at a time.
+    """
+    tok = get_tokenizer()
+    for page_number, text in pages:
+        starts = [start for _, start, _ in find_headers(text, strict=True)]
+        bounds = [0] + [s for s in starts if s > 0] + [len(text)]
+        for i in range(len(bounds) - 1):
+            sentences = split_sentences(text[bounds[i]:bounds[i + 1]])
+            if not sentences:
+                continue
+            counts = [len(ids) for ids in tok(sentences, add_special_tokens=False)["input_ids"]]
+            opens_section = i > 0 or (starts and starts[0] == 0)
+            for j, (sentence, count) in enumerate(zip(sentences, counts)):
+                yield sentence, count, page_number, opens_section and j == 0
+
+def chunk_pages(pages, max_tokens=None, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Splits a stream of (page_number, text) pairs into chunks that fill the
+    model's token budget, yielding (chunk, first_page, last_page) as soon as
+    each chunk is complete. Chunks never cross a section boundary; see
+    splitter.pack_token_chunks for overlap and boundary stability.
+    """
+    max_tokens = max_tokens or chunk_token_budget()
+    yield from pack_token_chunks(iter_segments(pages), max_tokens, overlap_tokens)
+
+def chunk_text(text, max_tokens=None):
+    return [chunk for chunk, _, _ in chunk_pages([(None, text)], max_tokens)]
+
+def bucket_by_length(chunks, batch_size=BATCH_SIZE):
+    """
+    Groups chunk indices into batches of similar token length so that each
+    batch needs as little padding as possible. Returns a list of index lists.
+    """
+    lengths = [len(ids) for ids in get_tokenizer()(chunks)["input_ids"]]
+    order = sorted(range(len(chunks)), key=lambda i: lengths[i])
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+def parse_generated_text(generated_text, chunk, chunk_number):
+    """
+    Extracts the JSON array from the model output and attaches the source text
+    to every object. Returns an empty list if nothing usable was generated.
+    """
+    json_str = ""
+    try:
+        # Find the start of the JSON array
+        json_start_index = generated_text.find('[')
+        if json_start_index == -1:
+            raise ValueError("No JSON array found in the output.")
+
+        # Find the end of the JSON array
+        json_end_index = generated_text.rfind(']')
+        if json_end_index == -1:
+            raise ValueError("JSON array is not properly closed.")
+
+        # Extract the JSON string
+        json_str = generated_text[json_start_index : json_end_index + 1]
+
+        # Attempt to parse the JSON
+        chunk_data = json.loads(json_str)
+
+        if not chunk_data:
+            print(f"[WARNING] JSON output for chunk {chunk_number} is empty.")
+            return []
+
+        if isinstance(chunk_data, list):
+            # Add the original text to each object
+            for item in chunk_data:
+                if isinstance(item, dict):
+                    item['text'] = chunk
+            return chunk_data
+
+        print(f"[WARNING] JSON output for chunk {chunk_number} is not a list. Wrapping it in a list.")
+        if isinstance(chunk_data, dict):
+            chunk_data['text'] = chunk
+        return [chunk_data]
+
+    except json.JSONDecodeError as e:
+        print(f"[ERROR] Failed to decode JSON for chunk {chunk_number}: {e}")
+        print(f"       Raw JSON string: {json_str}")
+    except ValueError as e:
+        print(f"[ERROR] Failed to extract JSON for chunk {chunk_number}: {e}")
+        print(f"       Generated text: {generated_text}")
+    except Exception as e:
+        print(f"[ERROR] An unexpected error occurred while processing chunk {chunk_number}: {e}")
+    return []
+
+def scan_value(text, escaped=False):
+    """
+    Scans text inside a JSON string value, carrying whether the previous
+    character was a backslash. Returns (index of the unescaped quote or
+    newline that ends the value or -1, escaped).
+    """
+    for i, ch in enumerate(text):
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif ch in "\"\n":
+            return i, escaped
+    return -1, escaped
+
+def find_value_end(text):
+    """Index of the unescaped quote (or newline) that ends a JSON string value, or -1."""
+    return scan_value(text)[0]
+
+def generate_values(session, max_new_tokens):
+    """
+    Greedily continues every row of a DecodingSession with a JSON string
+    value, each stopped at its closing quote. Returns (value, closed,
+    tokens_generated) per row.
+    """
+    values = []
+    for new_ids in session.generate(max_new_tokens):
+        text = session.tok.decode(new_ids, skip_special_tokens=True)
+        end = find_value_end(text)
+        raw = text if end == -1 else text[:end]
         try:
-            raw_output = generator(prompt, max_new_tokens=500, num_return_sequences=1, eos_token_id=generator.tokenizer.eos_token_id)
-            generated_text = raw_output[0]['generated_text']
-            
-            # Extract JSON part from the generated text
+            value = json.loads('"' + raw + '"')
+        except ValueError:
+            value = raw
+        values.append((value.strip(), end != -1, len(new_ids)))
+    return values
+
+def retry_fields(chunks, field):
+    """Asks for a single field on its own, for values that came back empty or never closed."""
+    question = FIELD_QUESTIONS[field]
+    prompts = [FIELD_RETRY_TEMPLATE.replace("{text}", chunk).replace("{question}", question) for chunk in chunks]
+    return generate_values(DecodingSession(prompts), FIELD_MAX_TOKENS[field])
+
+def label_batch_structured(chunks):
+    """
+    Labels a batch of chunks with schema-guided decoding. The labeler writes
+    the array, the braces and the keys, and the model only generates the
+    field values, so the result always parses and nothing is generated after
+    the array closes. The whole answer is decoded in one DecodingSession, so
+    the prompt is prefilled once and each field only feeds its key and the
+    previous value. Fields that fail are retried one by one with a short
+    prompt instead of regenerating the whole answer.
+    Returns (labels per chunk, tokens generated, field retries).
+    """
+    tok = generator.tokenizer
+    session = DecodingSession([build_prompt(chunk) + "[\n  {\n" for chunk in chunks])
+    labels = [[] for _ in chunks]
+    active = list(range(len(chunks)))  # the chunk of every session row
+    object_tokens = sum(FIELD_MAX_TOKENS.values()) + 16 * len(LABEL_FIELDS)
+    more_id = tok(",", add_special_tokens=False)["input_ids"][0]
+    close_id = tok("\n", add_special_tokens=False)["input_ids"][0]
+    tokens = retries = 0
+
+    for n in range(MAX_TOPICS_PER_CHUNK):
+        current = {i: {} for i in active}
+        for field in LABEL_FIELDS:
+            session.extend(f'    "{field}": "')
+            values = dict(zip(active, generate_values(session, FIELD_MAX_TOKENS[field])))
+            failed = [i for i in active if not values[i][0] or not values[i][1]]
+            if failed:
+                retries += len(failed)
+                for i, retried in zip(failed, retry_fields([chunks[i] for i in failed], field)):
+                    tokens += retried[2]
+                    if retried[0]:
+                        values[i] = retried[:2] + (values[i][2],)
+            for i in active:
+                value, _, count = values[i]
+                tokens += count
+                current[i][field] = value
+            # Re-encode the values so the text stays valid JSON whatever the model wrote
+            session.extend([json.dumps(current[i][field])[1:] + ("\n  }" if field == LABEL_FIELDS[-1] else ",\n")
+                            for i in active])
+
+        for i in active:
+            if all(current[i].values()):
+                labels[i].append(dict(current[i], text=chunks[i]))
+
+        if n + 1 == MAX_TOPICS_PER_CHUNK:
+            break
+        # The object just closed: the next-token logits say whether the array continues or closes
+        more = session.prefers(more_id, close_id)
+        keep = [row for row, (length, row_more) in enumerate(zip(session.lengths(), more))
+                if row_more and length + object_tokens <= MODEL_CONTEXT_TOKENS]
+        if not keep:
+            break
+        session.select(keep)
+        active = [active[row] for row in keep]
+        session.extend(",\n  {\n")
+
+    return labels, tokens, retries
+
+class LLMLabeler(LabelerBackend):
+    """The generative labeler: prompts MODEL_NAME for the label JSON of each chunk."""
+
+    name = "llm"
+    batch_size = BATCH_SIZE
+    cacheable = True
+
+    @property
+    def labeler_id(self):
+        return f"{self.name}:{MODEL_NAME}:{generator_runtime or RUNTIME}"
+
+    def load(self):
+        initialize_generator()
+
+    @property
+    def loaded(self):
+        return generator is not None
+
+    def batches(self, chunks, batch_size=None):
+        return bucket_by_length(chunks, batch_size or self.batch_size)
+
+    def label_batch(self, chunks):
+        initialize_generator()
+        if STRUCTURED_OUTPUT:
+            batch_labels, tokens, retries = label_batch_structured(chunks)
+        else:
+            new_ids = DecodingSession([build_prompt(chunk) for chunk in chunks]).generate(MAX_NEW_TOKENS, stop_at_quote=False)
+            # Only the new tokens, never the prompt
+            generated = generator.tokenizer.batch_decode(new_ids, skip_special_tokens=True)
+            batch_labels = [parse_generated_text(text, chunk, n) for n, (text, chunk) in enumerate(zip(generated, chunks), start=1)]
+            tokens = sum(len(ids) for ids in new_ids)
+            retries = 0
+        count_generation(labels=sum(len(items) for items in batch_labels), tokens=tokens,
+                         field_retries=retries, failed_chunks=sum(1 for items in batch_labels if not items))
+        return batch_labels
+
+
+register_backend(LLMLabeler())
+
+def label_chunk(text, batch_size=None, progress_callback=None, backend=None, document=None):
+    """
+    Chunks and labels the text, which may also be an iterable of
+    (page_number, text) pairs; labels from paged input carry page_start and
+    page_end. backend names a registered labeler backend ("llm" or
+    "centroid"), DEFAULT_BACKEND if not given. If given,
+    progress_callback(done, total) is called after the cache lookup and after
+    every batch. With a document name, near-duplicates of chunks labeled
+    before (see chunking.dedup) take their labels and carry "duplicate_of".
+    """
+    backend = get_backend(backend or DEFAULT_BACKEND)
+    if isinstance(text, str):
+        text = [(None, text)]
+    spans = list(chunk_pages(text))
+    chunks = [chunk for chunk, _, _ in spans]
+    print(f"[INFO] Split text into {len(chunks)} chunks.")
+    results = [[] for _ in chunks]
+    if not chunks:
+        return []
+
+    # Near-duplicates of chunks labeled before are not labeled again
+    pending = list(range(len(chunks)))
+    dedup = DocumentDedup(document, backend.labeler_id) if DEDUP and document else None
+    if dedup:
+        pending = dedup.plan(chunks)
+
+    # Serve every chunk we have already labeled from the cache
+    if backend.cacheable:
+        cache = get_label_cache()
+        keys = {i: label_cache_key(chunks[i]) for i in pending}
+        cached = cache.get_many(keys.values())
+        misses = []
+        for i in pending:
+            key = keys[i]
+            if key in cached:
+                results[i] = [dict(item, text=chunks[i]) for item in json.loads(cached[key])]
+            else:
+                misses.append(i)
+        print(f"[INFO] Label cache: {len(pending) - len(misses)} hits, {len(misses)} misses.")
+        pending = misses
+    done = len(chunks) - len(pending)
+    if progress_callback:
+        progress_callback(done, len(chunks))
+
+    if pending:
+        pending_chunks = [chunks[i] for i in pending]
+        batches = [[pending[j] for j in batch] for batch in backend.batches(pending_chunks, batch_size)]
+        started = time.perf_counter()
+        saved_before = generation_stats()["prefill_saved_s"]
+
+        for b, batch in enumerate(batches):
+            print(f"[INFO] Processing batch {b+1}/{len(batches)} ({len(batch)} chunks, {backend.name})...")
+            batch_started = time.perf_counter()
+
             try:
-                # Find the start of the JSON array
-                json_start_index = generated_text.find('[')
-                if json_start_index == -1:
-                    raise ValueError("No JSON array found in the output.")
-
-                # Find the end of the JSON array
-                json_end_index = generated_text.rfind(']')
-                if json_end_index == -1:
-                    raise ValueError("JSON array is not properly closed.")
-
-                # Extract the JSON string
-                json_str = generated_text[json_start_index : json_end_index + 1]
-                
-                # Attempt to parse the JSON
-                chunk_data = json.loads(json_str)
-
-                if not chunk_data:
-                    print(f"[WARNING] JSON output for chunk {i+1} is empty.")
-                    continue
+                batch_labels = backend.label_batch([chunks[i] for i in batch])
+            except Exception as e:
+                print(f"[ERROR] Failed to process batch {b+1} with the {backend.name} labeler: {e}")
+                done += len(batch)
+                if progress_callback:
+                    progress_callback(done, len(chunks))
+                continue
+
+            elapsed = time.perf_counter() - batch_started
+            print(f"[INFO] Batch {b+1}/{len(batches)} took {elapsed:.2f}s ({len(batch) / elapsed:.2f} chunks/s).")
 
-                if isinstance(chunk_data, list):
-                    # Add the original text to each object
-                    for item in chunk_data:
-                        if isinstance(item, dict):
-                            item['text'] = chunk
-                    labeled_chunks.extend(chunk_data)
+            new_entries = {}
+            for i, items in zip(batch, batch_labels):
+                results[i] = items
+                if results[i]:
                     print(f"[SUCCESS] Chunk {i+1} processed successfully.")
-                else:
-                    print(f"[WARNING] JSON output for chunk {i+1} is not a list. Wrapping it in a list.")
-                    if isinstance(chunk_data, dict):
-                        chunk_data['text'] = chunk
-                    labeled_chunks.extend([chunk_data])
-
-            except json.JSONDecodeError as e:
-                print(f"[ERROR] Failed to decode JSON for chunk {i+1}: {e}")
-                print(f"       Raw JSON string: {json_str}")
-            except ValueError as e:
-                print(f"[ERROR] Failed to extract JSON for chunk {i+1}: {e}")
-                print(f"       Generated text: {generated_text}")
-            except Exception as e:
-                print(f"[ERROR] An unexpected error occurred while processing chunk {i+1}: {e}")
+                    if backend.cacheable:
+                        labels = [{k: v for k, v in item.items() if k != 'text'} for item in results[i] if isinstance(item, dict)]
+                        new_entries[keys[i]] = json.dumps(labels)
+            if new_entries:
+                cache.put_many(new_entries)
+            done += len(batch)
+            if progress_callback:
+                progress_callback(done, len(chunks))
+
+        total = time.perf_counter() - started
+        print(f"[INFO] Labeled {len(pending)} chunks in {total:.2f}s ({len(pending) / total:.2f} chunks/s).")
+        if backend.name == "llm":
+            stats = generation_stats()
+            print(f"[INFO] Prompt prefix cache saved ~{stats['prefill_saved_s'] - saved_before:.2f}s of prefill for this document.")
+            print(f"[INFO] Generation so far: {stats}")
 
-        except Exception as e:
-            print(f"[ERROR] Failed to process chunk {i+1} with the model: {e}")
-            continue
+    if dedup:
+        for i in range(len(chunks)):
+            if i in dedup.matches or i in dedup.copies:
+                duplicate_of = dedup.duplicate_of(i)
+                results[i] = [dict(item, text=chunks[i], **({"duplicate_of": duplicate_of} if duplicate_of else {}))
+                              for item in dedup.labels_for(i, results)]
+        dedup.finish(results)
 
-    return labeled_chunks
+    # Keep page provenance, then flatten in the original chunk order
+    for (_, first_page, last_page), items in zip(spans, results):
+        if first_page is not None:
+            for item in items:
+                if isinstance(item, dict):
+                    item["page_start"], item["page_end"] = first_page, last_page
+    return [item for items in results for item in items]
@@ -1,4 +1,5 @@
 import re
+import zlib
 
 def simple_split_by_heading(text):
     headings = re.split(r"\n(?=[A-Z][A-Za-z ]{3,}\n)", text)
@@ -13,3 +14,103 @@ def sliding_window_chunks(text, max_words=200, overlap=50):
         chunks.append(" ".join(chunk))
         i += max_words - overlap
     return chunks
+
+SENTENCE_PATTERN = re.compile(r"[^.!?]+(?:[.!?]+|$)")
+
+def split_sentences(text):
+    return [s.strip() for s in SENTENCE_PATTERN.findall(text) if s.strip()]
+
+def _split_long_segment(text, tokens, max_tokens):
+    # A single sentence longer than the budget is cut into word windows of roughly max_tokens each
+    words = text.split()
+    pieces = -(-tokens // max_tokens) + 1
+    size = max(1, -(-len(words) // pieces))
+    for i in range(0, len(words), size):
+        piece = words[i:i + size]
+        yield " ".join(piece), max(1, tokens * len(piece) // len(words))
+
+def pack_token_chunks(segments, max_tokens, overlap_tokens=0, min_tokens=32, resync_fill=0.75, resync_divisor=8):
+    """
+    Packs segments (usually sentences) into chunks of at most max_tokens,
+    in a single pass. segments yields (text, tokens, page_number,
+    starts_section) and chunks are yielded as (text, first_page, last_page).
+
+    - A segment that starts a section starts a new chunk, unless the chunk
+      so far holds fewer than min_tokens (a heading or a one-line section),
+      which is then packed together with what follows.
+    - The last overlap_tokens worth of segments are repeated at the start of
+      the next chunk within the same section.
+    - Once a chunk is resync_fill full it also ends after any segment whose
+      checksum matches a fixed pattern, so an edit only moves the chunk
+      boundaries next to it and the rest of a revised document still
+      produces the same chunks.
+    - A final chunk shorter than min_tokens is merged into the one before
+      it when that fits, instead of being dropped or labeled on its own.
+    """
+    current = []  # (text, tokens, page_number)
+    total = 0
+    carried = 0  # leading segments of current repeated from the previous chunk
+    pending = None  # the last finished chunk, held back in case the next one is a tiny tail
+    section = 0
+
+    def finish(carry):
+        nonlocal current, total, carried
+        chunk = (" ".join(text for text, _, _ in current), current[0][2], current[-1][2], total, section)
+        kept, kept_total = [], 0
+        if carry and overlap_tokens > 0:
+            for segment in reversed(current):
+                if kept_total + segment[1] > overlap_tokens:
+                    break
+                kept.insert(0, segment)
+                kept_total += segment[1]
+        current, total, carried = kept, kept_total, len(kept)
+        return chunk
+
+    def hold(chunk):
+        nonlocal pending
+        previous, pending = pending, chunk
+        return previous
+
+    for text, tokens, page_number, starts_section in segments:
+        if starts_section:
+            fresh_tokens = sum(segment[1] for segment in current[carried:])
+            if fresh_tokens >= min_tokens:
+                finished = hold(finish(carry=False))
+                if finished:
+                    yield finished[:3]
+                current, total, carried = [], 0, 0
+            elif carried:
+                del current[:carried]
+                total, carried = fresh_tokens, 0
+            section += 1
+
+        pieces = _split_long_segment(text, tokens, max_tokens) if tokens > max_tokens else [(text, tokens)]
+        for piece, piece_tokens in pieces:
+            if len(current) > carried and total + piece_tokens > max_tokens:
+                finished = hold(finish(carry=True))
+                if finished:
+                    yield finished[:3]
+            # Overlap must not push the new chunk over budget
+            while carried and total + piece_tokens > max_tokens:
+                total -= current.pop(0)[1]
+                carried -= 1
+            current.append((piece, piece_tokens, page_number))
+            total += piece_tokens
+            if total >= resync_fill * max_tokens and zlib.crc32(piece.encode("utf-8")) % resync_divisor == 0:
+                finished = hold(finish(carry=True))
+                if finished:
+                    yield finished[:3]
+
+    tail = None
+    if len(current) > carried:
+        fresh = current[carried:]
+        tail_tokens = sum(tokens for _, tokens, _ in fresh)
+        if pending and tail_tokens < min_tokens and pending[4] == section and pending[3] + tail_tokens <= max_tokens:
+            # Merge only the new segments; the carried ones already end the previous chunk
+            pending = (pending[0] + " " + " ".join(text for text, _, _ in fresh), pending[1], fresh[-1][2])
+        else:
+            tail = finish(carry=False)
+    if pending:
+        yield pending[:3]
+    if tail:
+        yield tail[:3]
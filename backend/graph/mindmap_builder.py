@@ -1,78 +1,166 @@
-import json
-import networkx as nx
 import os
+import unicodedata
 
-def build_graph(jsonl_path):
+from memory.chunk_store import LABEL_COLUMNS, document_name, iter_records
+from utils.graph import dumps, get_graph_store
+
+GRAPH_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/processed/mindmap_graph.json"))
+
+# Hierarchy levels above the chunks, with the name used when a label lacks the field
+HIERARCHY = [("subject", "General"), ("topic", "Miscellaneous"), ("subtopic", "N/A")]
+SUMMARY_CHARS = 200
+# Labeled fields a document's graph is built from; text is only a fallback for a missing summary
+GRAPH_FIELDS = LABEL_COLUMNS + ["summary", "page_start", "page_end", "duplicate_of"]
+
+
+def normalize_name(name):
+    return " ".join(unicodedata.normalize("NFKC", str(name)).casefold().split())
+
+
+def node_id(node_type, path):
     """
-    Builds a hierarchical graph from a JSONL file containing structured data.
-    Each line in the JSONL file is expected to be a JSON object with 'subject',
-    'topic', 'subtopic', 'title', and 'summary' fields.
+    Graph id of a hierarchy node: its type plus the normalized names from the
+    subject down, so the same name used as a subject and a topic, or as a
+    topic under two subjects, gives separate nodes.
     """
-    G = nx.DiGraph()
+    return f"{node_type}:" + "/".join(normalize_name(name).replace("/", "%2F") for name in path)
+
+
+def short(text):
+    text = (text or "").strip()
+    return text[:SUMMARY_CHARS] + "..." if len(text) > SUMMARY_CHARS else text
+
 
-    # Check if the file exists and is not empty
-    if not os.path.exists(jsonl_path) or os.path.getsize(jsonl_path) == 0:
-        print(f"[WARNING] The file {jsonl_path} is empty or does not exist. Returning an empty graph.")
+def document_graph(records, document):
+    """
+    Nodes and links of one labeled document's subject -> topic -> subtopic ->
+    chunk hierarchy, in one pass over its records. Chunk nodes belong to the
+    document ("doc" field) and carry a short summary; the chunk text stays in
+    the labeled file. Near-duplicates of chunks already in the graph
+    ("duplicate_of") get no node.
+    """
+    nodes, links, seen = [], [], set()
+    for line, record in enumerate(records):
+        if not isinstance(record, dict) or record.get("duplicate_of"):
+            continue
+        path, parent = [], None
+        for node_type, default in HIERARCHY:
+            name = str(record.get(node_type) or "").strip() or default
+            path.append(name)
+            current = node_id(node_type, path)
+            if current not in seen:
+                seen.add(current)
+                nodes.append({"id": current, "type": node_type, "title": name, "parent": parent})
+                if parent:
+                    links.append({"source": parent, "target": current})
+            parent = current
+
+        chunk = {
+            "id": f"chunk:{document}#{line}",
+            "type": "chunk",
+            "title": record.get("title") or "Untitled",
+            "parent": parent,
+            "doc": document,
+            "summary": short(record.get("summary") or record.get("text")),
+        }
+        for field in ("page_start", "page_end"):
+            if field in record:
+                chunk[field] = record[field]
+        nodes.append(chunk)
+        links.append({"source": parent, "target": chunk["id"]})
+    return nodes, links
+
+
+def read_labeled(labeled_path):
+    """
+    The records of a labeled file with the fields the graph needs (None for
+    invalid JSONL lines, to keep line numbers). The chunk text column is read
+    only if some record has no summary.
+    """
+    records = list(iter_records(labeled_path, GRAPH_FIELDS))
+    texts = None
+    for line, record in enumerate(records):
+        if record is None:
+            print(f"[ERROR] Skipping invalid JSON line {line} of {os.path.basename(labeled_path)}")
+        elif not record.get("summary"):
+            if texts is None:
+                texts = list(iter_records(labeled_path, ["text"]))
+            record["text"] = (texts[line] or {}).get("text")
+    return records
+
+
+class GraphEngine:
+    """
+    The global mind map, kept in memory for the life of the process and
+    persisted through utils.graph.GraphStore. Merging a document only touches
+    that document's nodes: hierarchy nodes are looked up by id, new ones are
+    appended as a delta, and a re-ingested document replaces its old chunks.
+    """
+
+    def __init__(self, graph_path=GRAPH_PATH):
+        self.store = get_graph_store(graph_path)
+
+    def merge(self, records, document):
+        """Merges a document's labeled records. Returns (nodes in the document, nodes in the graph)."""
+        nodes, links = document_graph(records, document)
+        return len(nodes), self.store.append(nodes, links, document=document)
+
+    def merge_file(self, labeled_path):
+        count, total = self.merge(read_labeled(labeled_path), document_name(labeled_path))
+        print(f"[✓] Merged {count} nodes from {os.path.basename(labeled_path)} (graph has {total} nodes)")
+        return total
+
+    def to_json_bytes(self):
+        return self.store.to_json_bytes()
+
+
+engines = {}
+
+
+def get_engine(graph_path=GRAPH_PATH):
+    graph_path = os.path.abspath(graph_path)
+    if graph_path not in engines:
+        engines[graph_path] = GraphEngine(graph_path)
+    return engines[graph_path]
+
+
+def merge_labeled_file(labeled_path, graph_path=GRAPH_PATH):
+    return get_engine(graph_path).merge_file(labeled_path)
+
+
+def build_graph(labeled_path):
+    """
+    Builds a networkx DiGraph of a single labeled file, with the same
+    node ids and attributes as the global graph. For analysis; the
+    application merges documents with GraphEngine instead.
+    """
+    import networkx as nx
+
+    G = nx.DiGraph()
+    if not os.path.exists(labeled_path) or os.path.getsize(labeled_path) == 0:
+        print(f"[WARNING] The file {labeled_path} is empty or does not exist. Returning an empty graph.")
         return G
 
-    with open(jsonl_path, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                chunk = json.loads(line.strip())
-                
-                # Extract data with default values for safety
-                subject = chunk.get("subject", "General")
-                topic = chunk.get("topic", "Miscellaneous")
-                subtopic = chunk.get("subtopic", "N/A")
-                title = chunk.get("title", "Untitled")
-                summary = chunk.get("summary", "")
-                text = chunk.get("text", "") # Keep the original text
-
-                # Create nodes with specific types for better identification
-                G.add_node(subject, type='subject')
-                G.add_node(topic, type='topic', parent=subject)
-                G.add_node(subtopic, type='subtopic', parent=topic)
-                G.add_node(title, type='chunk', parent=subtopic, summary=summary, text=text)
-
-                # Add edges to form the hierarchy
-                G.add_edge(subject, topic)
-                G.add_edge(topic, subtopic)
-                G.add_edge(subtopic, title)
-
-            except json.JSONDecodeError:
-                print(f"[ERROR] Skipping invalid JSON line: {line.strip()}")
-                continue
-            except KeyError as e:
-                print(f"[ERROR] Missing expected key in JSON object: {e}. Line: {line.strip()}")
-                continue
-
-    node_count = G.number_of_nodes()
-    edge_count = G.number_of_edges()
-
-    if node_count > 0:
-        print(f"[SUCCESS] Built graph with {node_count} nodes and {edge_count} edges.")
-    else:
-        print("[INFO] The graph is empty, possibly due to no valid data in the input file.")
-        
+    nodes, links = document_graph(read_labeled(labeled_path), document_name(labeled_path))
+    G.add_nodes_from((node["id"], node) for node in nodes)
+    G.add_edges_from((link["source"], link["target"]) for link in links)
+    print(f"[SUCCESS] Built graph with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges.")
     return G
 
+
 def export_graph_to_json(G, filename="mindmap_graph.json"):
     """
-    Exports the graph to a JSON file in node-link format.
+    Exports the graph to a compact JSON file in node-link format.
     """
     from networkx.readwrite import json_graph
-    
-    # Ensure the output directory exists
-    output_dir = os.path.join("data", "processed")
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
 
+    output_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/processed"))
+    os.makedirs(output_dir, exist_ok=True)
     out_path = os.path.join(output_dir, filename)
-    
+
     try:
-        data = json_graph.node_link_data(G)
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4)
+        with open(out_path, "wb") as f:
+            f.write(dumps(json_graph.node_link_data(G)))
         print(f"[SUCCESS] Exported graph JSON to {out_path}")
     except Exception as e:
         print(f"[ERROR] Failed to export graph to JSON: {e}")
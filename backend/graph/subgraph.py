@@ -0,0 +1,195 @@
+"""
+Level-of-detail views of the subject -> topic -> subtopic -> chunk hierarchy,
+answered from the topic index one level at a time instead of shipping the
+whole mind map.
+
+Node ids are the graph's (graph/mindmap_builder.py): the node type plus the
+normalized names from the subject down ("subject:computer science",
+"topic:computer science/vision"), and "chunk:<doc>#<line>" for chunks; ""
+is the root. Names that differ only in case or Unicode form are one node, as
+in /api/graph. Listings carry only names and counts. Chunk summaries come
+with the node itself, and the chunk text only when asked for.
+"""
+from graph.mindmap_builder import node_id
+from memory.topic_index import HIERARCHY_FIELDS, HIERARCHY_KEYS
+
+NODE_TYPES = ["root"] + HIERARCHY_FIELDS
+CHILDREN_LIMIT = 200
+MAX_CHILDREN_LIMIT = 1000
+MAX_SUBTREE_DEPTH = 4
+MAX_SUBTREE_NODES = 2000
+# Heavy chunk fields, read back from the labeled file only when asked for
+LAZY_FIELDS = ["text"]
+
+
+def path_id(keys):
+    """Id of the hierarchy node at a path of normalized names ("" for the root)."""
+    return node_id(NODE_TYPES[len(keys)], keys) if keys else ""
+
+
+def chunk_id(document, line):
+    return f"chunk:{document}#{line}"
+
+
+def parse_node_id(value):
+    """
+    Returns ("chunk", (document, line)) or ("path", tuple of normalized
+    names); raises ValueError for a malformed id.
+    """
+    if value.startswith("chunk:"):
+        document, _, line = value[len("chunk:"):].rpartition("#")
+        if not document or not (line.isascii() and line.isdigit()):
+            raise ValueError(f"Invalid node id {value!r}: chunk ids look like chunk:<doc>#<line>")
+        return "chunk", (document, int(line))
+    if not value:
+        return "path", ()
+    node_type, _, names = value.partition(":")
+    path = tuple(name.replace("%2F", "/") for name in names.split("/"))
+    if node_type not in HIERARCHY_FIELDS or len(path) != NODE_TYPES.index(node_type) or not all(path):
+        raise ValueError(f"Invalid node id {value!r}: hierarchy ids look like subject:<subject>, "
+                         f"topic:<subject>/<topic> or subtopic:<subject>/<topic>/<subtopic>")
+    return "path", path
+
+
+class Hierarchy:
+    """Queries over the labeled-record hierarchy kept in a TopicIndex."""
+
+    def __init__(self, topic_index):
+        self.index = topic_index
+
+    def _path_node(self, keys, name, child_count=None, record_count=None):
+        node = {"id": path_id(keys), "type": NODE_TYPES[len(keys)], "name": name}
+        if child_count is not None:
+            node["children"] = child_count
+            node["records"] = record_count
+        return node
+
+    def _named_node(self, keys):
+        return self._path_node(keys, self.index.names(keys)[-1] if keys else "")
+
+    def _chunk_node(self, document, line, title, parent):
+        return {"id": chunk_id(document, line), "type": "chunk", "name": title or "Untitled",
+                "parent": path_id(parent), "children": 0}
+
+    def _resolve(self, value):
+        """Returns (kind, key, parent path) for an existing node, or None."""
+        kind, key = parse_node_id(value)
+        if kind == "chunk":
+            record = self.index.chunk(*key)
+            # Near-duplicates have no node in the graph either
+            if record is None or record["duplicate"]:
+                return None
+            return kind, record, tuple(record[column] for column in HIERARCHY_KEYS)
+        if key and self.index.names(key) is None:
+            return None
+        return kind, key, key[:-1]
+
+    def _children(self, keys, limit=None, offset=0):
+        if len(keys) > len(HIERARCHY_FIELDS):
+            return [], 0
+        rows, total = self.index.children(keys, limit, offset)
+        if len(keys) == len(HIERARCHY_FIELDS):
+            return [self._chunk_node(document, line, title, keys) for document, line, title in rows], total
+        return [self._path_node(keys + (key,), name, children, records)
+                for key, name, children, records in rows], total
+
+    def node(self, value, fields=()):
+        """
+        One node with its detail: counts for hierarchy nodes; title, summary,
+        labels and pages for chunks, plus any of the extra fields asked for
+        (e.g. "text"). Returns None if the node does not exist.
+        """
+        resolved = self._resolve(value)
+        if resolved is None:
+            return None
+        kind, key, parent = resolved
+        if kind == "path":
+            node = self._named_node(key)
+            node["records"] = self.index.count(key)
+            node["children"] = self.index.children(key, limit=0)[1]
+            if key:
+                node["parent"] = path_id(parent)
+            return node
+
+        node = self._chunk_node(key["document"], key["line"], key["title"], parent)
+        for field in ("summary", "subject", "topic", "subtopic", "label"):
+            node[field] = key.get(field)
+        wanted = [field for field in fields if field in LAZY_FIELDS]
+        # Pages and text only live in the labeled file
+        obj = self.index.record_object(key) or {}
+        for field in ["page_start", "page_end"] + wanted:
+            if field in obj:
+                node[field] = obj[field]
+        return node
+
+    def children(self, value, limit=CHILDREN_LIMIT, offset=0):
+        """The node and one page of its children, linked to it."""
+        resolved = self._resolve(value)
+        if resolved is None:
+            return None
+        kind, key, parent = resolved
+        if kind == "chunk":
+            nodes, total = [], 0
+        else:
+            nodes, total = self._children(key, min(limit, MAX_CHILDREN_LIMIT), offset)
+        return {
+            "id": value,
+            "nodes": nodes,
+            "links": [{"source": value, "target": child["id"]} for child in nodes],
+            "total": total,
+            "has_more": offset + len(nodes) < total,
+        }
+
+    def subtree(self, value, depth=1, max_nodes=MAX_SUBTREE_NODES):
+        """
+        The node and its descendants down to depth levels, breadth first.
+        Stops at max_nodes and reports truncated=True if anything was left out.
+        """
+        resolved = self._resolve(value)
+        if resolved is None:
+            return None
+        kind, key, _ = resolved
+        if kind == "chunk":
+            root = self._chunk_node(key["document"], key["line"], key["title"], resolved[2])
+        else:
+            root = self._named_node(key)
+        nodes, links, truncated = [root], [], False
+        frontier = [] if kind == "chunk" else [key]
+        for _ in range(min(depth, MAX_SUBTREE_DEPTH)):
+            next_frontier = []
+            for path in frontier:
+                room = max_nodes - len(nodes)
+                if room <= 0:
+                    truncated = True
+                    break
+                children, total = self._children(path, room)
+                truncated = truncated or total > len(children)
+                nodes.extend(children)
+                links.extend({"source": path_id(path), "target": child["id"]} for child in children)
+                next_frontier.extend(parse_node_id(child["id"])[1] for child in children if child["type"] != "chunk")
+            frontier = next_frontier
+        return {"id": value, "nodes": nodes, "links": links, "truncated": truncated}
+
+    def neighbors(self, value, limit=CHILDREN_LIMIT):
+        """The node's parent, its siblings and one page of its children."""
+        resolved = self._resolve(value)
+        if resolved is None:
+            return None
+        kind, key, parent = resolved
+        nodes, links = [], []
+        if kind == "chunk" or key:
+            parent_id = path_id(parent)
+            nodes.append(self._named_node(parent))
+            siblings, _ = self._children(parent, min(limit, MAX_CHILDREN_LIMIT))
+            nodes.extend(siblings)
+            links.extend({"source": parent_id, "target": sibling["id"]} for sibling in siblings)
+            if not any(sibling["id"] == value for sibling in siblings):
+                nodes.append(self.node(value))
+                links.append({"source": parent_id, "target": value})
+        if kind == "path":
+            if not key:
+                nodes.append(self._named_node(key))
+            children, _ = self._children(key, min(limit, MAX_CHILDREN_LIMIT))
+            nodes.extend(children)
+            links.extend({"source": value, "target": child["id"]} for child in children)
+        return {"id": value, "nodes": nodes, "links": links}
@@ -1,8 +1,36 @@
 import fitz  # PyMuPDF
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_text_from_pdf(pdf_path):
-    text = ""
+# Pages handed to one worker process at a time in parallel mode
+PAGES_PER_TASK = 50
+
+def _extract_page_range(pdf_path, start, stop):
+    with fitz.open(pdf_path) as doc:
+        return [(number + 1, doc.load_page(number).get_text()) for number in range(start, stop)]
+
+def iter_pdf_pages(pdf_path, workers=0):
+    """
+    Yields (page_number, text) for every page, numbered from 1, without
+    holding the whole document in memory. With workers > 1 the page ranges
+    are extracted by a process pool; pages are still yielded in order and at
+    most 2 * workers ranges are in flight at any time.
+    """
     with fitz.open(pdf_path) as doc:
-        for page in doc:
-            text += page.get_text()
-    return text.strip()
+        page_count = doc.page_count
+        if workers <= 1 or page_count <= PAGES_PER_TASK:
+            for number in range(page_count):
+                yield number + 1, doc.load_page(number).get_text()
+            return
+
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for start, stop in ranges:
+            pending.append(pool.submit(_extract_page_range, pdf_path, start, stop))
+            if len(pending) >= 2 * workers:
+                yield from pending.pop(0).result()
+        for future in pending:
+            yield from future.result()
+
+def extract_text_from_pdf(pdf_path, workers=0):
+    return "".join(text for _, text in iter_pdf_pages(pdf_path, workers)).strip()
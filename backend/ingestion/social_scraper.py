@@ -1,8 +1,134 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def extract_text_from_link(url):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
+from ingestion.youtube_transcriber import extract_transcript, is_youtube_link
+from utils.cache import CACHE_DIR, SQLiteCache
+
+# (connect, read) timeout in seconds
+REQUEST_TIMEOUT = (5, 30)
+FETCH_WORKERS = 8
+# Minimum seconds between two requests to the same host
+HOST_MIN_INTERVAL = 1.0
+
+HTTP_CACHE_PATH = os.path.join(CACHE_DIR, "http.sqlite")
+HTTP_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+_session = None
+_http_cache = None
+_setup_lock = threading.Lock()
+
+
+def get_session():
+    """A shared session so connections to the same host are pooled and reused."""
+    global _session
+    with _setup_lock:
+        if _session is None:
+            _session = requests.Session()
+            retries = Retry(total=2, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504])
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=FETCH_WORKERS, max_retries=retries)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers["User-Agent"] = "MindMap/1.0"
+        return _session
+
+
+def get_http_cache():
+    global _http_cache
+    with _setup_lock:
+        if _http_cache is None:
+            _http_cache = SQLiteCache(HTTP_CACHE_PATH, max_bytes=HTTP_CACHE_MAX_BYTES)
+        return _http_cache
+
+
+class HostRateLimiter:
+    """Spaces out requests to each host by at least min_interval seconds."""
+
+    def __init__(self, min_interval=HOST_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+rate_limiter = HostRateLimiter()
+
+
+def fetch_url(url):
+    """
+    GETs a page through the shared session. Responses with an ETag or
+    Last-Modified header are cached on disk and revalidated with a
+    conditional request, so unchanged pages come back as a 304.
+    """
+    cache = get_http_cache()
+    cached = cache.get(url)
+    entry = json.loads(cached) if cached else None
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    rate_limiter.wait(url)
+    response = get_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304 and entry:
+        return entry["body"]
+    response.raise_for_status()
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if etag or last_modified:
+        cache.put(url, json.dumps({"etag": etag, "last_modified": last_modified, "body": response.text}))
+    return response.text
+
+
+def html_to_text(html):
+    soup = BeautifulSoup(html, 'html.parser')
     paragraphs = soup.find_all('p')
     return "\n".join([p.text for p in paragraphs])
+
+
+def extract_text_from_link(url):
+    return html_to_text(fetch_url(url))
+
+
+def _fetch_link_text(url):
+    try:
+        if is_youtube_link(url):
+            rate_limiter.wait(url)
+            return extract_transcript(url)
+        return extract_text_from_link(url)
+    except Exception as e:
+        print(f"[ERROR] Failed to fetch {url}: {e}")
+        return ""
+
+
+def extract_texts_from_links(urls, workers=FETCH_WORKERS):
+    """
+    Fetches many links (web pages or YouTube videos) concurrently. Returns
+    the texts in the order of urls; links that fail come back empty.
+    """
+    urls = list(urls)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(urls)))) as pool:
+        texts = list(pool.map(_fetch_link_text, urls))
+    elapsed = time.perf_counter() - started
+    print(f"[INFO] Fetched {sum(1 for t in texts if t)}/{len(urls)} links in {elapsed:.1f}s.")
+    return texts
@@ -1,16 +1,53 @@
-import yt_dlp
 import json
 import os
+import re
+import shutil
+import tempfile
+
+from utils.cache import CACHE_DIR, SQLiteCache
+
+TRANSCRIPT_CACHE_PATH = os.path.join(CACHE_DIR, "transcripts.sqlite")
+TRANSCRIPT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+transcript_cache = None
+
+VIDEO_ID_PATTERN = re.compile(r"(?:v=|youtu\.be/|shorts/|embed/)([A-Za-z0-9_-]{11})")
+
+def get_transcript_cache():
+    global transcript_cache
+    if transcript_cache is None:
+        transcript_cache = SQLiteCache(TRANSCRIPT_CACHE_PATH, max_bytes=TRANSCRIPT_CACHE_MAX_BYTES)
+    return transcript_cache
+
+def is_youtube_link(url):
+    return "youtube.com" in url or "youtu.be" in url
 
 def extract_transcript(video_url):
+    """
+    Returns the transcript of a YouTube video, from the transcript cache if
+    this video was fetched before. Captions do not change once published, so
+    cached transcripts are keyed by video id and never revalidated.
+    """
+    match = VIDEO_ID_PATTERN.search(video_url)
+    if match:
+        cached = get_transcript_cache().get(match.group(1))
+        if cached is not None:
+            return cached
+
+    transcript = download_transcript(video_url)
+    if transcript and match:
+        get_transcript_cache().put(match.group(1), transcript)
+    return transcript
+
+def download_transcript(video_url):
     """
     Extracts the transcript from a YouTube video using yt-dlp.
     It fetches the best available auto-generated transcript, saves it as a JSON file, 
     parses it, and then cleans up the file.
     """
-    # Ensure the temporary directory exists
-    temp_dir = "data/temp"
-    os.makedirs(temp_dir, exist_ok=True)
+    import yt_dlp
+
+    # A private temporary directory, so concurrent downloads cannot pick up each other's files
+    temp_dir = tempfile.mkdtemp(prefix="yt_")
 
     ydl_opts = {
         'writeautomaticsub': True,
@@ -58,3 +95,5 @@ def extract_transcript(video_url):
     except Exception as e:
         print(f"[ERROR] An unexpected error occurred in transcript extraction: {e}")
         return ""
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
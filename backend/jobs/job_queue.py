@@ -0,0 +1,131 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class JobQueue:
+    """
+    A persistent job queue backed by SQLite with a bounded worker pool.
+    Each job is handed to handler(payload, report), where report(stage=None,
+    progress=None, total=None) records how far the job has come. Jobs that
+    were queued or running when the process stopped are resumed by start().
+    """
+
+    def __init__(self, path, handler, max_workers=2, max_pending=16):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.handler = handler
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._executor = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, payload TEXT NOT NULL, status TEXT NOT NULL, stage TEXT, "
+            "progress INTEGER DEFAULT 0, total INTEGER DEFAULT 0, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status)")
+        self._conn.commit()
+
+    def start(self):
+        """Starts the worker pool and re-submits unfinished jobs from a previous run."""
+        if self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            ).fetchall()
+            self._conn.execute("UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING))
+            self._conn.commit()
+        for row in rows:
+            self._executor.submit(self._run, row["id"])
+        if rows:
+            print(f"[INFO] Resumed {len(rows)} unfinished jobs.")
+
+    def submit(self, payload):
+        """Queues a job and returns its id. Raises QueueFullError when too many jobs are waiting."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchone()[0]
+            if pending >= self.max_pending:
+                raise QueueFullError(f"{pending} jobs are already waiting, try again later")
+            self._conn.execute(
+                "INSERT INTO jobs (id, payload, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, json.dumps(payload), QUEUED, now, now),
+            )
+            self._conn.commit()
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, limit=50):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def _run(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return
+        self._update(job_id, status=RUNNING, error=None)
+
+        def report(stage=None, progress=None, total=None):
+            fields = {}
+            if stage is not None:
+                fields["stage"] = stage
+            if progress is not None:
+                fields["progress"] = progress
+            if total is not None:
+                fields["total"] = total
+            self._update(job_id, **fields)
+
+        try:
+            result = self.handler(json.loads(row["payload"]), report)
+            self._update(job_id, status=DONE, result=json.dumps(result))
+            print(f"[✓] Job {job_id} finished.")
+        except Exception as e:
+            traceback.print_exc()
+            self._update(job_id, status=FAILED, error=str(e))
+            print(f"[✗] Job {job_id} failed: {e}")
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
@@ -1,21 +1,27 @@
-from ingestion.pdf_loader import extract_text_from_pdf
-from ingestion.image_ocr import extract_text_from_image
+from ingestion.pdf_loader import iter_pdf_pages
+from ingestion.image_ocr import extract_text_from_image, iter_ocr_pdf_pages
 from ingestion.youtube_transcriber import extract_transcript
 from ingestion.social_scraper import extract_text_from_link
-from preprocessing.cleaner import clean_text
+from preprocessing.cleaner import clean_pages
 from chunking.labeler import label_chunk
-from graph.mindmap_builder import build_graph, export_graph_to_json
+from graph.mindmap_builder import merge_labeled_file
 from memory.embedding_store import build_index_from_chunks, search_similar
+from memory.topic_index import TopicIndex
+from memory.chunk_store import labeled_path, write_records
 import os
-import json
 import uuid
 
-def ingest_resource(source_type, path_or_url):
-    """Ingest resource from a given source type and path/url."""
-    print(f"[INFO] Ingesting {source_type} from {path_or_url}...")
+LABELED_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data/labeled"))
+
+def ingest_pages(source_type, path_or_url):
+    """Ingest resource page by page. Returns the cleaned (page_number, text) pairs."""
     if source_type == "pdf":
-        raw_text = extract_text_from_pdf(path_or_url)
-    elif source_type == "image":
+        pages = list(clean_pages(iter_pdf_pages(path_or_url)))
+        if not pages:
+            # No text layer, so this is a scanned PDF
+            pages = list(clean_pages(iter_ocr_pdf_pages(path_or_url)))
+        return pages
+    if source_type == "image":
         raw_text = extract_text_from_image(path_or_url)
     elif source_type == "youtube":
         raw_text = extract_transcript(path_or_url)
@@ -23,20 +29,19 @@ def ingest_resource(source_type, path_or_url):
         raw_text = extract_text_from_link(path_or_url)
     else:
         raise ValueError(f"Unsupported source type: {source_type}")
-    
-    cleaned_text = clean_text(raw_text)
+    return list(clean_pages([(None, raw_text or "")]))
+
+def ingest_resource(source_type, path_or_url):
+    """Ingest resource from a given source type and path/url."""
+    print(f"[INFO] Ingesting {source_type} from {path_or_url}...")
+    cleaned_text = " ".join(text for _, text in ingest_pages(source_type, path_or_url))
     print(f"[SUCCESS] Ingestion complete. Extracted and cleaned {len(cleaned_text)} characters.")
     return cleaned_text
 
 def save_labeled_data(labeled_chunks, filename):
-    """Saves the labeled data to a JSONL file."""
-    out_dir = os.path.join("data", "labeled")
-    os.makedirs(out_dir, exist_ok=True)
-    out_path = os.path.join(out_dir, f"{filename}_labeled.jsonl")
-    
-    with open(out_path, "w", encoding="utf-8") as f:
-        for entry in labeled_chunks:
-            f.write(json.dumps(entry) + "\n")
+    """Saves the labeled data to the document's labeled file (Arrow, or JSONL without pyarrow)."""
+    os.makedirs(LABELED_DIR, exist_ok=True)
+    out_path = write_records(labeled_path(filename, LABELED_DIR), labeled_chunks)
     print(f"[SUCCESS] Saved labeled data to {out_path}")
     return out_path
 
@@ -46,16 +51,20 @@ def process_and_build_mindmap(source_type, path_or_url):
     # Generate a unique filename
     filename = f"{source_type}_{str(uuid.uuid4())[:8]}"
 
-    # Step 1: Ingest and clean the text
-    text = ingest_resource(source_type, path_or_url)
-    if not text or len(text.strip()) < 100:
+    # Step 1: Ingest and clean the text, keeping its pages
+    print(f"[INFO] Ingesting {source_type} from {path_or_url}...")
+    pages = ingest_pages(source_type, path_or_url)
+    characters = sum(len(text.strip()) for _, text in pages)
+    print(f"[SUCCESS] Ingestion complete. Extracted and cleaned {characters} characters from {len(pages)} pages.")
+    if characters < 100:
         print("[ERROR] Ingested text is too short or empty. Aborting.")
         return
 
     # Step 2: Label and chunk the text using the new generative model
     # This now handles chunking, summarization, and hierarchical labeling
     print("\n[INFO] Starting chunking and labeling process...")
-    labeled_data = label_chunk(text)
+    # Labels from (page, text) pairs carry page_start/page_end, as in the app
+    labeled_data = label_chunk(pages, document=filename)
     if not labeled_data:
         print("[ERROR] No data was labeled. Cannot proceed.")
         return
@@ -63,14 +72,11 @@ def process_and_build_mindmap(source_type, path_or_url):
     # Step 3: Save the structured data
     jsonl_path = save_labeled_data(labeled_data, filename)
     print(f"[INFO] Labeled data saved to {jsonl_path}")
+    TopicIndex().index_file(jsonl_path)
 
-    # Step 4: Build and export the knowledge graph
-    print("\n[INFO] Building knowledge graph...")
-    G = build_graph(jsonl_path)
-    if G.number_of_nodes() > 0:
-        export_graph_to_json(G, f"{filename}_mindmap.json")
-    else:
-        print("[WARNING] Graph is empty. Skipping export.")
+    # Step 4: Merge the document into the knowledge graph
+    print("\n[INFO] Updating knowledge graph...")
+    merge_labeled_file(jsonl_path)
 
     # Step 5: (Optional) Build semantic memory for search
     print("\n[INFO] Building semantic memory index...")
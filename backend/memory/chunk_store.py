@@ -0,0 +1,242 @@
+"""
+Labeled chunks on disk, one file per document in data/labeled.
+
+Documents are written as Arrow IPC streams (<doc>_labeled.arrows): one column
+per label field, in record batches. Readers memory-map the file, so reading
+is zero-copy and a projection such as the label columns never touches the
+pages holding text and summaries. New chunks are appended to a document as
+extra record batches without rewriting it.
+
+Older documents stay readable as JSONL (<doc>_labeled.jsonl) and can be
+converted with `python -m memory.chunk_store --migrate`. Without pyarrow
+installed, documents are written as JSONL.
+"""
+import argparse
+import json
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # optional: columnar storage; JSONL is used without it
+    pa = None
+
+LABELED_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/labeled"))
+
+STRING_COLUMNS = ["subject", "topic", "subtopic", "title", "label", "summary", "text"]
+INT_COLUMNS = ["page_start", "page_end"]
+# Any other fields of a record, as a JSON object
+EXTRA_COLUMN = "extra"
+COLUMNS = STRING_COLUMNS + INT_COLUMNS + [EXTRA_COLUMN]
+# Label columns only, for listings that do not need the text blobs
+LABEL_COLUMNS = ["subject", "topic", "subtopic", "title", "label"]
+
+FORMAT = "arrows" if pa is not None else "jsonl"
+EXTENSIONS = [".arrows", ".jsonl"]
+LABELED_SUFFIX = "_labeled"
+BATCH_ROWS = 1024
+# An IPC stream ends with a continuation marker and a zero length
+END_OF_STREAM = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+
+def labeled_path(document, labeled_dir=LABELED_DIR, fmt=None):
+    return os.path.join(labeled_dir, f"{document}{LABELED_SUFFIX}.{fmt or FORMAT}")
+
+
+def document_name(path):
+    name = os.path.basename(path)
+    for extension in EXTENSIONS:
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+            break
+    return name[:-len(LABELED_SUFFIX)] if name.endswith(LABELED_SUFFIX) else name
+
+
+def other_formats(path):
+    """Paths the same document would have in the other formats."""
+    directory = os.path.dirname(path)
+    return [labeled_path(document_name(path), directory, extension[1:])
+            for extension in EXTENSIONS if not path.endswith(extension)]
+
+
+def list_labeled(labeled_dir=LABELED_DIR):
+    """One labeled file per document, sorted; a document's Arrow file wins over its JSONL."""
+    chosen = {}
+    for filename in sorted(os.listdir(labeled_dir)):
+        extension = os.path.splitext(filename)[1]
+        if extension not in EXTENSIONS:
+            continue
+        document = document_name(filename)
+        if document not in chosen or EXTENSIONS.index(extension) < EXTENSIONS.index(os.path.splitext(chosen[document])[1]):
+            chosen[document] = filename
+    return [os.path.join(labeled_dir, filename) for _, filename in sorted(chosen.items())]
+
+
+def schema():
+    return pa.schema([(name, pa.string()) for name in STRING_COLUMNS] +
+                     [(name, pa.int32()) for name in INT_COLUMNS] + [(EXTRA_COLUMN, pa.string())])
+
+
+def int_value(value):
+    """The value as an int32, or None if it is not a whole number in range."""
+    if isinstance(value, bool):
+        return None
+    try:
+        number = int(value)
+        whole = number == float(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return number if whole and -2 ** 31 <= number < 2 ** 31 else None
+
+
+def to_batches(records):
+    for start in range(0, len(records), BATCH_ROWS):
+        rows = records[start:start + BATCH_ROWS]
+        columns = {name: [] for name in COLUMNS}
+        for record in rows:
+            extra = {key: value for key, value in record.items() if key not in COLUMNS}
+            for name in STRING_COLUMNS + INT_COLUMNS:
+                value = record.get(name)
+                column_value = value if value is None or isinstance(value, str) else None
+                if name in INT_COLUMNS and value is not None:
+                    column_value = int_value(value)
+                # Values that do not fit the column's type are kept as they are in extra
+                if column_value is None and value is not None:
+                    extra[name] = value
+                columns[name].append(column_value)
+            columns[EXTRA_COLUMN].append(json.dumps(extra) if extra else None)
+        yield pa.RecordBatch.from_pydict(columns, schema=schema())
+
+
+def write_records(path, records):
+    """Writes a document's records, replacing the file atomically."""
+    records = [record for record in records if isinstance(record, dict)]
+    tmp_path = path + ".tmp"
+    if path.endswith(".arrows"):
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_stream(sink, schema()) as writer:
+            for batch in to_batches(records):
+                writer.write_batch(batch)
+    else:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, path)
+    return path
+
+
+def append_records(path, records):
+    """Appends records to a document, creating it if needed; existing batches are not rewritten."""
+    records = [record for record in records if isinstance(record, dict)]
+    if not os.path.exists(path):
+        return write_records(path, records)
+    if path.endswith(".arrows"):
+        with open(path, "r+b") as f:
+            f.seek(-len(END_OF_STREAM), os.SEEK_END)
+            if f.read() == END_OF_STREAM:
+                f.seek(-len(END_OF_STREAM), os.SEEK_END)
+            for batch in to_batches(records):
+                f.write(batch.serialize())
+            f.write(END_OF_STREAM)
+            f.truncate()
+    else:
+        with open(path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+    return path
+
+
+def read_table(path, columns=None):
+    """The document as a memory-mapped Arrow table, limited to the given columns."""
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_stream(source).read_all()
+    if columns is not None:
+        table = table.select([name for name in columns if name in table.column_names])
+    return table
+
+
+def row_to_record(names, values, columns=None):
+    record = {name: value for name, value in zip(names, values) if value is not None}
+    extra = record.pop(EXTRA_COLUMN, None)
+    if extra:
+        extra = json.loads(extra)
+        record.update(extra if columns is None else {key: extra[key] for key in columns if key in extra})
+    return record
+
+
+def iter_records(path, columns=None):
+    """
+    Yields the records of a labeled file in order, with only the given fields
+    (all of them by default). For JSONL, a line that does not hold a JSON
+    object yields None, so positions always match row numbers.
+    """
+    if path.endswith(".arrows"):
+        wanted = None if columns is None else list(columns) + [EXTRA_COLUMN]
+        table = read_table(path, wanted)
+        for batch in table.to_batches():
+            names = batch.schema.names
+            for values in zip(*(column.to_pylist() for column in batch.columns)):
+                yield row_to_record(names, values, columns)
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = None
+            if not isinstance(record, dict):
+                yield None
+            elif columns is None:
+                yield record
+            else:
+                yield {key: record[key] for key in columns if key in record}
+
+
+def read_records(path, columns=None):
+    """The valid records of a labeled file as a list; see iter_records."""
+    return [record for record in iter_records(path, columns) if record is not None]
+
+
+def read_record(path, index, columns=None):
+    """One record by row number, or None."""
+    if path.endswith(".arrows"):
+        wanted = None if columns is None else list(columns) + [EXTRA_COLUMN]
+        table = read_table(path, wanted)
+        if not 0 <= index < table.num_rows:
+            return None
+        row = table.slice(index, 1)
+        return row_to_record(row.column_names, [column[0].as_py() for column in row.columns], columns)
+    for i, record in enumerate(iter_records(path, columns)):
+        if i == index:
+            return record
+    return None
+
+
+def migrate(labeled_dir=LABELED_DIR, delete=False):
+    """Converts every JSONL document without an Arrow file to Arrow. Returns the number converted."""
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    converted = 0
+    for filename in sorted(os.listdir(labeled_dir)):
+        if not filename.endswith(".jsonl"):
+            continue
+        source = os.path.join(labeled_dir, filename)
+        target = labeled_path(document_name(filename), labeled_dir, "arrows")
+        if not os.path.exists(target):
+            write_records(target, read_records(source))
+            converted += 1
+            print(f"[✓] {filename} → {os.path.basename(target)}")
+        if delete:
+            os.remove(source)
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert labeled JSONL documents to Arrow.")
+    parser.add_argument("--migrate", action="store_true", help="convert data/labeled/*.jsonl to .arrows files")
+    parser.add_argument("--delete", action="store_true", help="remove the JSONL files once converted")
+    parser.add_argument("--labeled-dir", default=LABELED_DIR)
+    args = parser.parse_args()
+    if args.migrate:
+        print(f"[✓] Converted {migrate(args.labeled_dir, args.delete)} documents.")
+    else:
+        parser.print_help()
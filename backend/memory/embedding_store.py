@@ -1,31 +1,493 @@
 import faiss
+import numpy as np
 import os
 import json
-from sentence_transformers import SentenceTransformer
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
-model = SentenceTransformer("all-MiniLM-L6-v2")  # small & fast
+from chunking.embedder import EMBEDDING_DIM, get_embedding_service
+from memory.chunk_store import document_name, read_records
+from memory import lexical_index
+from utils.file_utils import file_lock
 
-# Index and metadata store
-index = faiss.IndexFlatL2(384)
-metadata = []
+INDEX_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/index"))
 
-def build_index_from_chunks(jsonl_path):
-    with open(jsonl_path, "r", encoding="utf-8") as f:
-        chunks = [json.loads(line) for line in f]
+# "flat" (exact), "hnsw", "ivf_flat" or "ivf_pq". The IVF types are trained on the stored vectors.
+INDEX_TYPE = "flat"
+INDEX_PARAMS = {
+    "hnsw_m": 32,            # graph degree; more = better recall, more memory
+    "ef_construction": 200,
+    "ef_search": 64,         # HNSW search breadth; more = better recall, slower queries
+    "nlist": 1024,           # IVF cells (capped by the amount of training data)
+    "nprobe": 16,            # IVF cells visited per query; more = better recall, slower queries
+    "pq_m": 48,              # PQ sub-quantizers; must divide the embedding dimension
+    "pq_bits": 8,
+}
+INDEX_TYPES = ["flat", "hnsw", "ivf_flat", "ivf_pq"]
+# "hybrid" fuses BM25 keyword results with vector results; "vector" and "keyword" use one of them
+SEARCH_MODE = "hybrid"
+SEARCH_MODES = ["hybrid", "vector", "keyword"]
+# Reciprocal rank fusion: a chunk scores the sum of 1 / (RRF_K + rank) over the result lists it is in
+RRF_K = 60
+# Time a search may take. A keyword search still running then is cut off and left out of the fusion.
+SEARCH_BUDGET_MS = 250
+# FAISS wants roughly this many training points per IVF cell
+MIN_POINTS_PER_CELL = 39
 
-    texts = [c["summary"] + " " + c["title"] for c in chunks]
-    vectors = model.encode(texts)
 
-    global index, metadata
-    index.add(vectors)
-    metadata = chunks
-    print(f"[✓] Indexed {len(chunks)} chunks.")
+def min_training_points(index_type, **params):
+    """Vectors needed to train an index of the given type; 0 if it needs no training."""
+    params = {**INDEX_PARAMS, **params}
+    if index_type == "ivf_flat":
+        return MIN_POINTS_PER_CELL
+    if index_type == "ivf_pq":
+        # Each PQ sub-quantizer is trained with k-means into 2 ** pq_bits centroids
+        return max(MIN_POINTS_PER_CELL, 2 ** params["pq_bits"])
+    return 0
+
+
+def make_index(index_type, dim, train_vectors=None, **params):
+    """
+    Creates an empty index of the given type. IVF types are trained on
+    train_vectors; the returned index accepts add_with_ids().
+    """
+    params = {**INDEX_PARAMS, **params}
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+    if index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, params["hnsw_m"])
+        hnsw.hnsw.efConstruction = params["ef_construction"]
+        index = faiss.IndexIDMap2(hnsw)
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        needed = min_training_points(index_type, **params)
+        if train_vectors is None or len(train_vectors) < needed:
+            raise ValueError(f"{index_type} needs at least {needed} training vectors")
+        nlist = max(1, min(params["nlist"], len(train_vectors) // MIN_POINTS_PER_CELL))
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, params["pq_m"], params["pq_bits"])
+        index.train(np.ascontiguousarray(train_vectors, dtype="float32"))
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+    set_search_params(index, nprobe=params["nprobe"], ef_search=params["ef_search"])
+    return index
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Applies the recall/latency knobs that make sense for the given index."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if nprobe is not None:
+        try:
+            faiss.extract_index_ivf(inner).nprobe = nprobe
+        except RuntimeError:
+            pass  # not an IVF index
+    if ef_search is not None and isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search
+
+
+class VectorStore:
+    """
+    A FAISS index persisted in a directory together with the raw vectors and
+    a metadata table whose row ids are the vector ids. Vectors are grouped by
+    document so a document can be re-indexed or deleted on its own.
+
+      vectors.f32      every vector ever added, as raw float32 rows (row = id)
+      index.faiss      the FAISS index over the live vectors
+      index.json       the index type and its parameters
+      metadata.sqlite  id -> (doc_id, record, deleted)  (deleted: 1 removed, 2 still in the index),
+                       plus the BM25 keyword index over the live records (memory.lexical_index)
+
+    A new store starts with an exact flat index; rebuild_index() switches it
+    to an approximate type once there are vectors to train on.
+    """
+
+    def __init__(self, directory=INDEX_DIR, dim=EMBEDDING_DIM):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dim = dim
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.index_path = os.path.join(directory, "index.faiss")
+        self.config_path = os.path.join(directory, "index.json")
+        self.config = {"type": "flat", "params": {}}
+        if os.path.exists(self.config_path):
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                self.config = json.load(f)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "metadata.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            "id INTEGER PRIMARY KEY, doc_id TEXT NOT NULL, record TEXT NOT NULL, deleted INTEGER DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS metadata_doc ON metadata(doc_id)")
+        if lexical_index.create_schema(self._conn):
+            # Stores created before the keyword index get it built once
+            for doc_id in self.documents():
+                lexical_index.index_document(self._conn, doc_id)
+        self._conn.commit()
+        self.lexical = lexical_index.LexicalIndex(os.path.join(directory, "metadata.sqlite"))
+        # Vectors deleted from the metadata but still in an index that cannot remove them (HNSW),
+        # marked deleted = 2 until the next rebuild
+        self._tombstones = self._conn.execute("SELECT COUNT(*) FROM metadata WHERE deleted = 2").fetchone()[0]
+        self._index_in_memory = False
+        self.index = self._load_index()
+
+    def _index_signature(self):
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _load_index(self):
+        self._index_sig = self._index_signature()
+        if self._index_sig is not None:
+            index = self._read_index()
+            self._apply_search_params(index)
+            return index
+        self._index_in_memory = True
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(self.dim))
+
+    def _apply_search_params(self, index):
+        params = {**INDEX_PARAMS, **self.config["params"]}
+        set_search_params(index, nprobe=params["nprobe"], ef_search=params["ef_search"])
+
+    def _reload_if_changed(self):
+        # Another process (main.py, a bulk ingest) may have written a newer index
+        if self._index_signature() == self._index_sig:
+            return
+        if os.path.exists(self.config_path):
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                self.config = json.load(f)
+        self._tombstones = self._conn.execute("SELECT COUNT(*) FROM metadata WHERE deleted = 2").fetchone()[0]
+        self._index_in_memory = False
+        self.index = self._load_index()
+
+    def _read_index(self):
+        try:
+            # Memory-map the index so startup does not read every vector into RAM
+            return faiss.read_index(self.index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            return faiss.read_index(self.index_path)
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        faiss.write_index(self.index, tmp_path)
+        os.replace(tmp_path, self.index_path)
+        self._index_sig = self._index_signature()
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        with self._lock:
+            set_search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+
+    def rebuild_index(self, index_type=INDEX_TYPE, **params):
+        """
+        Rebuilds the index from the stored vectors as the given type, training
+        IVF types on the live vectors. Also purges deleted vectors from HNSW.
+        """
+        with self._lock, file_lock(self.index_path):
+            ids = np.array([row[0] for row in self._conn.execute(
+                "SELECT id FROM metadata WHERE deleted = 0 ORDER BY id"
+            )], dtype="int64")
+            vectors = np.ascontiguousarray(self.load_vectors()[ids]) if len(ids) else np.zeros((0, self.dim), dtype="float32")
+            # Fall back to the closest type that can be trained on what there is
+            for fallback in ("ivf_flat", "flat"):
+                needed = min_training_points(index_type, **params)
+                if len(vectors) >= needed:
+                    break
+                print(f"[WARNING] Only {len(vectors)} vectors, {index_type} needs {needed} to train. "
+                      f"Trying {fallback} instead.")
+                index_type = fallback
+            self.index = make_index(index_type, self.dim, vectors, **params)
+            if len(ids):
+                self.index.add_with_ids(vectors, ids)
+            self._index_in_memory = True
+            self._tombstones = 0
+            self._conn.execute("UPDATE metadata SET deleted = 1 WHERE deleted = 2")
+            self._conn.commit()
+            self.config = {"type": index_type, "params": params}
+            self._save_index()
+            with open(self.config_path, "w", encoding="utf-8") as f:
+                json.dump(self.config, f)
+        print(f"[✓] Rebuilt {index_type} index over {len(ids)} vectors.")
+
+    def _writable(self):
+        # A memory-mapped index is read-only; load a private copy before the first change
+        self._reload_if_changed()
+        if not self._index_in_memory:
+            self.index = faiss.read_index(self.index_path)
+            self._apply_search_params(self.index)
+            self._index_in_memory = True
+
+    def vector_count(self):
+        if not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.dim)
+
+    def load_vectors(self):
+        """Returns all stored vectors (including deleted ones) as a read-only memory map."""
+        if self.vector_count() == 0:
+            return np.zeros((0, self.dim), dtype="float32")
+        return np.memmap(self.vectors_path, dtype="float32", mode="r", shape=(self.vector_count(), self.dim))
+
+    def add_document(self, doc_id, records, vectors):
+        """Indexes the records of one document, replacing any earlier version of it."""
+        vectors = np.ascontiguousarray(vectors, dtype="float32").reshape(-1, self.dim)
+        with self._lock, file_lock(self.index_path):
+            self._writable()
+            self._delete(doc_id)
+            start = self.vector_count()
+            ids = np.arange(start, start + len(vectors), dtype="int64")
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            self._conn.executemany(
+                "INSERT INTO metadata (id, doc_id, record) VALUES (?, ?, ?)",
+                [(int(i), doc_id, json.dumps(r)) for i, r in zip(ids, records)],
+            )
+            lexical_index.index_document(self._conn, doc_id)
+            self.index.add_with_ids(vectors, ids)
+            self._save_index()
+            self._conn.commit()
+        return len(ids)
+
+    def delete_document(self, doc_id):
+        with self._lock, file_lock(self.index_path):
+            self._writable()
+            removed = self._delete(doc_id)
+            if removed:
+                self._save_index()
+            self._conn.commit()
+        return removed
+
+    def _delete(self, doc_id):
+        ids = [row[0] for row in self._conn.execute(
+            "SELECT id FROM metadata WHERE doc_id = ? AND deleted = 0", (doc_id,)
+        )]
+        if ids:
+            lexical_index.remove_document(self._conn, doc_id)
+            deleted = 1
+            try:
+                self.index.remove_ids(np.array(ids, dtype="int64"))
+            except RuntimeError:
+                # HNSW cannot remove vectors; they are filtered out of results until the next rebuild
+                self._tombstones += len(ids)
+                deleted = 2
+            self._conn.execute("UPDATE metadata SET deleted = ? WHERE doc_id = ? AND deleted = 0", (deleted, doc_id))
+        return len(ids)
+
+    def documents(self):
+        return [row[0] for row in self._conn.execute(
+            "SELECT DISTINCT doc_id FROM metadata WHERE deleted = 0 ORDER BY doc_id"
+        )]
+
+    def search_ids(self, vector, top_k=5):
+        """Returns (id, distance) pairs for the nearest live vectors."""
+        vector = np.ascontiguousarray(vector, dtype="float32").reshape(1, self.dim)
+        with self._lock:
+            self._reload_if_changed()
+            if self.index.ntotal == 0:
+                return []
+            distances, indices = self.index.search(vector, top_k + self._tombstones)
+            hits = [(int(i), float(d)) for i, d in zip(indices[0], distances[0]) if i != -1]
+            if self._tombstones and hits:
+                placeholders = ",".join("?" * len(hits))
+                live = {row[0] for row in self._conn.execute(
+                    f"SELECT id FROM metadata WHERE deleted = 0 AND id IN ({placeholders})", [i for i, _ in hits]
+                )}
+                hits = [(i, d) for i, d in hits if i in live]
+        return hits[:top_k]
+
+    def similarities(self, vector, ids):
+        """Returns {id: cosine similarity to the query vector} for stored vectors, computed exactly."""
+        ids = sorted(set(ids))
+        if not ids:
+            return {}
+        vector = np.ascontiguousarray(vector, dtype="float32").reshape(self.dim)
+        scores = np.asarray(self.load_vectors()[ids]) @ vector
+        return {i: max(-1.0, min(1.0, float(score))) for i, score in zip(ids, scores)}
+
+    def records(self, ids):
+        """Returns {id: record} for the live ids among the given ones. Records carry their doc_id."""
+        ids, rows = list(ids), []
+        with self._lock:
+            # In batches that stay under SQLite's limit on query parameters
+            for start in range(0, len(ids), 900):
+                batch = ids[start:start + 900]
+                rows += self._conn.execute(
+                    f"SELECT id, doc_id, record FROM metadata WHERE deleted = 0 AND id IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+        return {i: dict(json.loads(record), doc_id=doc_id) for i, doc_id, record in rows}
+
+    def search(self, vector, top_k=5):
+        """Returns (record, distance) pairs for the nearest live vectors. Records carry their doc_id."""
+        hits = self.search_ids(vector, top_k)
+        records = self.records([i for i, _ in hits])
+        return [(records[i], distance) for i, distance in hits if i in records]
+
+    def __len__(self):
+        return self.index.ntotal - self._tombstones
+
+
+store = None
+
+
+def get_store():
+    global store
+    if store is None:
+        store = VectorStore()
+    return store
+
+
+def build_index_from_chunks(labeled_path, doc_id=None):
+    records = read_records(labeled_path)
+    # Near-duplicates are found through the chunk they duplicate
+    chunks = [record for record in records if not record.get("duplicate_of")]
+
+    doc_id = doc_id or document_name(labeled_path)
+    texts = [c.get("summary", "") + " " + c.get("title", "") for c in chunks]
+    vectors = get_embedding_service().encode_documents(texts)
+
+    get_store().add_document(doc_id, chunks, vectors)
+    print(f"[✓] Indexed {len(chunks)} chunks for {doc_id}.")
+
+def delete_document(doc_id):
+    removed = get_store().delete_document(doc_id)
+    print(f"[✓] Removed {removed} chunks for {doc_id}.")
+    return removed
 
 def search_similar(text, top_k=5):
-    vector = model.encode([text])
-    distances, indices = index.search(vector, top_k)
+    return search_chunks(text, limit=top_k)[0]
+
+def distance_to_score(distance):
+    """Converts a squared L2 distance between normalized vectors into a cosine similarity."""
+    return max(-1.0, min(1.0, 1.0 - distance / 2.0))
+
+search_pool = None
+
+
+def get_search_pool():
+    global search_pool
+    if search_pool is None:
+        search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="keyword-search")
+    return search_pool
+
+
+def fuse(*ranked_lists, k=RRF_K):
+    """Reciprocal rank fusion of lists of (id, score) pairs, best first. Returns (id, fused score) pairs."""
+    fused = {}
+    for ranked in ranked_lists:
+        for rank, (i, _) in enumerate(ranked, 1):
+            fused[i] = fused.get(i, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def keyword_hits(store, text, top_k, deadline):
+    try:
+        return store.lexical.search(text, top_k, deadline)
+    except TimeoutError:
+        print(f"[WARNING] Keyword search for {text!r} ran over the {SEARCH_BUDGET_MS} ms budget; using vector results only.")
+        return []
+
+
+def candidate_ids(store, text, vector, top_k, mode=SEARCH_MODE, min_score=None, deadline=None):
+    """
+    The top_k best (id, rank score, similarity) triples for a query in the
+    given mode, and whether the index has no more candidates to give. Hits
+    are ranked by cosine similarity ("vector"), BM25 ("keyword") or fused
+    RRF score ("hybrid"). similarity is the cosine similarity to the query,
+    None in keyword mode; min_score drops hits below it. In hybrid mode the
+    keyword search runs on a pool thread next to the vector search, and is
+    left out if it has not finished by the deadline.
+    """
+    keyword = None
+    if mode == "hybrid":
+        keyword = get_search_pool().submit(keyword_hits, store, text, top_k, deadline)
+    elif mode == "keyword":
+        hits = keyword_hits(store, text, top_k, deadline)
+        return [(i, score, None) for i, score in hits], len(hits) < top_k
+
+    dense = [(i, distance_to_score(distance)) for i, distance in store.search_ids(vector, top_k)]
+    exhausted = len(dense) < top_k
+    if min_score is not None and dense and dense[-1][1] < min_score:
+        dense = [(i, score) for i, score in dense if score >= min_score]
+        exhausted = True
+    if keyword is None:
+        return [(i, score, score) for i, score in dense], exhausted
+
+    try:
+        timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+        lexical = keyword.result(timeout=timeout)
+    except FutureTimeoutError:
+        lexical = []
+    # Keyword-only hits get their similarity from the stored vectors
+    similarity = dict(dense)
+    similarity.update(store.similarities(vector, [i for i, _ in lexical if i not in similarity]))
+    hits = [(i, score, similarity[i]) for i, score in fuse(dense, lexical)[:top_k]]
+    if min_score is not None:
+        hits = [hit for hit in hits if hit[2] >= min_score]
+    return hits, exhausted and len(lexical) < top_k
+
+
+def search_chunks(text, limit=10, offset=0, subject=None, topic=None, doc_id=None, min_score=None,
+                  mode=SEARCH_MODE, budget_ms=SEARCH_BUDGET_MS, vector=None):
+    """
+    Hybrid (or vector-only / keyword-only) search with filters and offset
+    pagination. Returns (results, has_more); every result is the chunk
+    record with its doc_id and score: the cosine similarity to the query,
+    or the BM25 score in keyword mode. Hybrid results also carry the
+    rrf_score they are ranked by. min_score is a minimum similarity and
+    cannot be used in keyword mode. Filtered searches over-fetch from the
+    indexes until enough matches are found or the time budget runs out.
+    vector is the query embedding, if the caller already has it.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode!r}; choose from {', '.join(SEARCH_MODES)}.")
+    if min_score is not None and mode == "keyword":
+        raise ValueError("min_score is a cosine similarity and does not apply to keyword search.")
+    deadline = time.perf_counter() + budget_ms / 1000
+    if vector is None and mode != "keyword":
+        vector = get_embedding_service().encode_query(text)
+    store = get_store()
+    wanted = offset + limit + 1  # one extra tells us whether there is a next page
+    fetch = wanted * (4 if subject or topic or doc_id else 1)
+
+    while True:
+        hits, exhausted = candidate_ids(store, text, vector, fetch, mode, min_score, deadline)
+        records = store.records([i for i, _, _ in hits])
+        matches = []
+        for i, score, similarity in hits:
+            record = records.get(i)
+            if record is None:
+                continue
+            if subject and record.get("subject") != subject:
+                continue
+            if topic and record.get("topic") != topic:
+                continue
+            if doc_id and record.get("doc_id") != doc_id:
+                continue
+            if mode == "hybrid":
+                matches.append(dict(record, score=round(similarity, 4), rrf_score=round(score, 4)))
+            else:
+                matches.append(dict(record, score=round(score, 4)))
+
+        if len(matches) >= wanted or exhausted or fetch >= len(store) or time.perf_counter() > deadline:
+            break
+        fetch *= 4
+
+    return matches[offset:offset + limit], len(matches) > offset + limit
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild the semantic search index.")
+    parser.add_argument("--type", choices=INDEX_TYPES, default=INDEX_TYPE)
+    for name, value in INDEX_PARAMS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=value)
+    args = parser.parse_args()
 
-    results = []
-    for i in indices[0]:
-        results.append(metadata[i])
-    return results
+    get_store().rebuild_index(args.type, **{name: getattr(args, name) for name in INDEX_PARAMS})
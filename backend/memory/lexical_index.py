@@ -0,0 +1,139 @@
+"""
+BM25 keyword search over chunk titles, summaries and text, for queries that
+dense vectors handle poorly: course codes, formulas, names.
+
+The index is an SQLite FTS5 table kept in the vector store's metadata
+database. It is an external-content index over the stored records, so the
+text is not stored twice, and its rowids are the vector ids. The vector
+store adds and removes a document's rows in the same transaction as its
+metadata.
+"""
+import re
+import sqlite3
+import threading
+import time
+
+FTS_TABLE = "chunks_fts"
+# bm25() weights of the indexed fields, in column order
+FIELD_WEIGHTS = {"title": 3.0, "summary": 2.0, "text": 1.0}
+TOKENIZER = "unicode61 remove_diacritics 2"
+MAX_QUERY_TERMS = 32
+# Terms found in more than this fraction of the chunks are dropped from a query: their
+# BM25 weight is close to zero and scoring every chunk that contains them is what makes
+# keyword queries slow on a large index
+MAX_TERM_FRACTION = 0.1
+# Below this many chunks every term is scored
+PRUNE_MIN_CHUNKS = 50000
+# SQLite virtual machine steps between deadline checks
+PROGRESS_STEPS = 10000
+
+SCHEMA = f"""
+    CREATE VIEW IF NOT EXISTS chunk_fields AS
+        SELECT id, doc_id, json_extract(record, '$.title') AS title,
+               json_extract(record, '$.summary') AS summary, json_extract(record, '$.text') AS text
+        FROM metadata;
+    CREATE TABLE IF NOT EXISTS lexical_rows (id INTEGER PRIMARY KEY);
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {", ".join(FIELD_WEIGHTS)}, content='chunk_fields', content_rowid='id', tokenize='{TOKENIZER}');
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}_vocab USING fts5vocab({FTS_TABLE}, 'row');
+"""
+
+
+def create_schema(conn):
+    """Creates the index in a vector store database. Returns True if it did not exist yet."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,)).fetchone()
+    conn.executescript(SCHEMA)
+    return exists is None
+
+
+def index_document(conn, doc_id):
+    """Adds a document's live records to the index. The caller commits."""
+    conn.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FIELD_WEIGHTS)}) "
+        f"SELECT f.id, f.{', f.'.join(FIELD_WEIGHTS)} FROM chunk_fields f JOIN metadata m ON m.id = f.id "
+        f"WHERE f.doc_id = ? AND m.deleted = 0", (doc_id,)
+    )
+    conn.execute(
+        "INSERT OR IGNORE INTO lexical_rows (id) SELECT id FROM metadata WHERE doc_id = ? AND deleted = 0", (doc_id,)
+    )
+
+
+def remove_document(conn, doc_id):
+    """Removes a document's records from the index. The caller commits."""
+    # An external-content row is removed by restating the values it was indexed with
+    conn.execute(
+        f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {', '.join(FIELD_WEIGHTS)}) "
+        f"SELECT 'delete', f.id, f.{', f.'.join(FIELD_WEIGHTS)} FROM chunk_fields f JOIN lexical_rows r ON r.id = f.id "
+        f"WHERE f.doc_id = ?", (doc_id,)
+    )
+    conn.execute("DELETE FROM lexical_rows WHERE id IN (SELECT id FROM metadata WHERE doc_id = ?)", (doc_id,))
+
+
+def query_terms(text):
+    """The distinct words of a query, lowercased, at most MAX_QUERY_TERMS."""
+    terms = []
+    for term in re.findall(r"\w+", text.casefold()):
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_QUERY_TERMS]
+
+
+class LexicalIndex:
+    """Read side of the index, on its own connection so keyword and vector searches can run side by side."""
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Number of indexed chunks, recounted when the database changes
+        self._total = None
+        self._data_version = None
+
+    def _indexed_count(self):
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._total is None or data_version != self._data_version:
+            self._total = self._conn.execute("SELECT COUNT(*) FROM lexical_rows").fetchone()[0]
+            self._data_version = data_version
+        return self._total
+
+    def _selective_terms(self, terms):
+        if len(terms) < 2:
+            return terms
+        total = self._indexed_count()
+        if total < PRUNE_MIN_CHUNKS:
+            return terms
+        placeholders = ",".join("?" * len(terms))
+        frequency = dict(self._conn.execute(
+            f"SELECT term, doc FROM {FTS_TABLE}_vocab WHERE term IN ({placeholders})", terms
+        ))
+        selective = [term for term in terms if frequency.get(term, 0) <= MAX_TERM_FRACTION * total]
+        # A query made only of common words keeps its rarest one
+        return selective or [min(terms, key=lambda term: frequency.get(term, 0))]
+
+    def search(self, text, top_k=10, deadline=None):
+        """
+        Returns (vector id, BM25 score) pairs for the best matching chunks,
+        best first; a chunk matches if it contains any of the query terms.
+        Raises TimeoutError if the query is still running at the deadline
+        (a time.perf_counter() value).
+        """
+        terms = query_terms(text)
+        if not terms:
+            return []
+        with self._lock:
+            if deadline is not None:
+                self._conn.set_progress_handler(lambda: time.perf_counter() > deadline, PROGRESS_STEPS)
+            try:
+                match = " OR ".join(f'"{term}"' for term in self._selective_terms(terms))
+                rows = self._conn.execute(
+                    f"SELECT rowid, bm25({FTS_TABLE}, {', '.join(map(str, FIELD_WEIGHTS.values()))}) AS rank "
+                    f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ? ORDER BY rank LIMIT ?", (match, int(top_k))
+                ).fetchall()
+            except sqlite3.OperationalError as e:
+                if "interrupted" in str(e):
+                    raise TimeoutError("Keyword search ran over its time budget") from e
+                raise
+            finally:
+                self._conn.set_progress_handler(None, 0)
+        # bm25() is negative, lower is better
+        return [(row[0], -row[1]) for row in rows]
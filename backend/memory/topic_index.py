@@ -0,0 +1,257 @@
+import argparse
+import os
+import sqlite3
+import threading
+
+from graph.mindmap_builder import HIERARCHY, normalize_name
+from memory.chunk_store import document_name, iter_records, list_labeled, other_formats, read_record
+
+LABELED_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/labeled"))
+TOPIC_INDEX_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/topic_index.sqlite"))
+
+# Record fields that are indexed as topic names
+NAME_FIELDS = ["label", "subject", "topic", "subtopic"]
+# Record fields that form the subject -> topic -> subtopic hierarchy, top down
+HIERARCHY_FIELDS = ["subject", "topic", "subtopic"]
+RECORD_COLUMNS = ["id", "source", "line", "subject", "topic", "subtopic", "title", "summary", "label"]
+# Labeled fields the index keeps; the chunk text is never read
+INDEXED_FIELDS = RECORD_COLUMNS[3:] + ["duplicate_of"]
+# Hierarchy nodes are grouped by normalized name, like the graph's node ids, and shown by the first name seen
+HIERARCHY_KEYS = [f"{field}_key" for field in HIERARCHY_FIELDS]
+HIERARCHY_NAMES = [f"{field}_name" for field in HIERARCHY_FIELDS]
+
+
+def hierarchy_names(obj):
+    """A record's subject/topic/subtopic as in the graph: stripped, with the graph's default for a missing one."""
+    return [str(obj.get(field) or "").strip() or default for field, default in HIERARCHY]
+
+
+class TopicIndex:
+    """
+    A persistent index from labels, subjects, topics and subtopics to the
+    labeled chunk records they appear in. Labeled files are added with
+    index_file() as they are written, so lookups never rescan data/labeled.
+    """
+
+    def __init__(self, path=TOPIC_INDEX_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(records)")}
+        if columns and "subject_key" not in columns:
+            # Indexed before hierarchy keys: start over, and the next sync reindexes every file
+            print("[INFO] Rebuilding the topic index with normalized hierarchy keys.")
+            self._conn.executescript("DROP TABLE IF EXISTS records; DROP TABLE IF EXISTS names; DROP TABLE IF EXISTS files;")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL, size INTEGER);
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY, source TEXT NOT NULL, line INTEGER NOT NULL,
+                subject TEXT, topic TEXT, subtopic TEXT, title TEXT, summary TEXT, label TEXT,
+                document TEXT, duplicate INTEGER NOT NULL DEFAULT 0,
+                subject_key TEXT, topic_key TEXT, subtopic_key TEXT,
+                subject_name TEXT, topic_name TEXT, subtopic_name TEXT);
+            CREATE TABLE IF NOT EXISTS names (name TEXT NOT NULL, kind TEXT NOT NULL, record_id INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+            CREATE INDEX IF NOT EXISTS records_source ON records(source);
+            CREATE INDEX IF NOT EXISTS names_name ON names(name);
+            CREATE INDEX IF NOT EXISTS names_record ON names(record_id);
+            CREATE INDEX IF NOT EXISTS records_keys ON records(subject_key, topic_key, subtopic_key);
+            CREATE INDEX IF NOT EXISTS records_document ON records(document, line);
+        """)
+        self._conn.commit()
+        # Sorted name list, recomputed only when the index version changes
+        self._topics = None
+        self._topics_version = None
+
+    def _version(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else 0
+
+    def _bump_version(self):
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('version', 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+        )
+
+    def _remove_source(self, source):
+        self._conn.execute(
+            "DELETE FROM names WHERE record_id IN (SELECT id FROM records WHERE source = ?)", (source,)
+        )
+        self._conn.execute("DELETE FROM records WHERE source = ?", (source,))
+        self._conn.execute("DELETE FROM files WHERE path = ?", (source,))
+
+    def index_file(self, labeled_path):
+        """(Re)indexes one labeled file. Returns the number of records indexed."""
+        source = os.path.abspath(labeled_path)
+        document = document_name(source)
+        stat = os.stat(source)
+        count = 0
+        with self._lock:
+            self._remove_source(source)
+            # A document rewritten in another format replaces its old file
+            for path in other_formats(source):
+                self._remove_source(path)
+            for line_number, obj in enumerate(iter_records(source, INDEXED_FIELDS)):
+                if obj is None:
+                    continue
+                hierarchy = hierarchy_names(obj)
+                cursor = self._conn.execute(
+                    "INSERT INTO records (source, line, subject, topic, subtopic, title, summary, label, document, "
+                    f"duplicate, {', '.join(HIERARCHY_KEYS + HIERARCHY_NAMES)}) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (source, line_number, obj.get("subject"), obj.get("topic"), obj.get("subtopic"),
+                     obj.get("title"), obj.get("summary"), obj.get("label"), document,
+                     1 if obj.get("duplicate_of") else 0, *[normalize_name(name) for name in hierarchy], *hierarchy),
+                )
+                names = {(str(obj[field]).strip(), field) for field in NAME_FIELDS if obj.get(field)}
+                self._conn.executemany(
+                    "INSERT INTO names (name, kind, record_id) VALUES (?, ?, ?)",
+                    [(name, kind, cursor.lastrowid) for name, kind in names if name],
+                )
+                count += 1
+            self._conn.execute(
+                "INSERT INTO files (path, mtime, size) VALUES (?, ?, ?)", (source, stat.st_mtime, stat.st_size)
+            )
+            self._bump_version()
+            self._conn.commit()
+        return count
+
+    def sync(self, labeled_dir=LABELED_DIR):
+        """
+        Indexes new or modified labeled files and drops files that were
+        deleted. A document migrated to Arrow replaces its JSONL file.
+        """
+        labeled_dir = os.path.abspath(labeled_dir)
+        with self._lock:
+            known = {path: (mtime, size) for path, mtime, size in self._conn.execute("SELECT * FROM files")}
+        present = set()
+        updated = 0
+        for path in list_labeled(labeled_dir):
+            present.add(path)
+            stat = os.stat(path)
+            if known.get(path) != (stat.st_mtime, stat.st_size):
+                self.index_file(path)
+                updated += 1
+        with self._lock:
+            for path in known.keys() - present:
+                if os.path.dirname(path) == labeled_dir:
+                    self._remove_source(path)
+                    updated += 1
+            if updated:
+                self._bump_version()
+            self._conn.commit()
+        return updated
+
+    def rebuild(self, labeled_dir=LABELED_DIR):
+        """Drops the whole index and regenerates it from the labeled files."""
+        with self._lock:
+            self._conn.executescript("DELETE FROM names; DELETE FROM records; DELETE FROM files;")
+            self._bump_version()
+            self._conn.commit()
+        return self.sync(labeled_dir)
+
+    def topics(self):
+        """Returns every indexed name, sorted."""
+        with self._lock:
+            version = self._version()
+            if self._topics is None or version != self._topics_version:
+                rows = self._conn.execute("SELECT DISTINCT name FROM names ORDER BY name").fetchall()
+                self._topics = [row[0] for row in rows]
+                self._topics_version = version
+            return self._topics
+
+    def records(self, name):
+        """Returns the records filed under the given name, in ingestion order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT r.id, r.source, r.line, r.subject, r.topic, r.subtopic, r.title, r.summary, r.label "
+                "FROM names n JOIN records r ON r.id = n.record_id WHERE n.name = ? ORDER BY r.id",
+                (name,),
+            ).fetchall()
+        return [dict(zip(RECORD_COLUMNS, row)) for row in rows]
+
+    def version(self):
+        """Changes whenever indexed records change; suitable as a cache validator."""
+        with self._lock:
+            return self._version()
+
+    def _hierarchy_where(self, keys):
+        """WHERE clause for the records under a prefix of normalized (subject, topic, subtopic) names."""
+        return " AND ".join(["duplicate = 0"] + [f"{column} = ?" for column in HIERARCHY_KEYS[:len(keys)]])
+
+    def children(self, keys, limit=None, offset=0):
+        """
+        Children of a hierarchy node, given as a prefix of normalized
+        (subject, topic, subtopic) names. Above the subtopic level returns
+        (key, name, child count, record count) for every distinct next-level
+        name; below a subtopic returns (document, line, title) for its
+        records. Near-duplicates are left out, as in the graph.
+        Returns (rows, total).
+        """
+        keys = tuple(keys)
+        where = self._hierarchy_where(keys)
+        if len(keys) < len(HIERARCHY_KEYS):
+            key, name = HIERARCHY_KEYS[len(keys)], HIERARCHY_NAMES[len(keys)]
+            if len(keys) + 1 < len(HIERARCHY_KEYS):
+                child_count = f"COUNT(DISTINCT {HIERARCHY_KEYS[len(keys) + 1]})"
+            else:
+                child_count = "COUNT(*)"
+            # SQLite takes the bare name column from the row with MIN(id): the first name seen
+            query = (f"SELECT {key}, {name}, {child_count}, COUNT(*), MIN(id) FROM records WHERE {where} "
+                     f"GROUP BY {key} ORDER BY {name}, {key}")
+            count_query = f"SELECT COUNT(DISTINCT {key}) FROM records WHERE {where}"
+        else:
+            query = f"SELECT document, line, title FROM records WHERE {where} ORDER BY id"
+            count_query = f"SELECT COUNT(*) FROM records WHERE {where}"
+        if limit is not None:
+            query += f" LIMIT {int(limit)} OFFSET {int(offset)}"
+        with self._lock:
+            rows = self._conn.execute(query, keys).fetchall()
+            total = self._conn.execute(count_query, keys).fetchone()[0]
+        if len(keys) < len(HIERARCHY_KEYS):
+            rows = [row[:4] for row in rows]
+        return rows, total
+
+    def count(self, keys):
+        """Number of records under a prefix of normalized (subject, topic, subtopic) names."""
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM records WHERE {self._hierarchy_where(keys)}",
+                                      tuple(keys)).fetchone()[0]
+
+    def names(self, keys):
+        """Display names along a prefix of normalized names, root first, or None if no record is under it."""
+        if not keys:
+            return ()
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT {', '.join(HIERARCHY_NAMES[:len(keys)])} FROM records "
+                f"WHERE {self._hierarchy_where(keys)} ORDER BY id LIMIT 1", tuple(keys)).fetchone()
+
+    def chunk(self, document, line):
+        """The record of a document's labeled line, with its hierarchy keys and names."""
+        columns = RECORD_COLUMNS + ["document", "duplicate"] + HIERARCHY_KEYS + HIERARCHY_NAMES
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(columns)} FROM records WHERE document = ? AND line = ? "
+                                     "ORDER BY id DESC LIMIT 1", (document, line)).fetchone()
+        return dict(zip(columns, row)) if row else None
+
+    def record_object(self, record):
+        """The full labeled object of a record, chunk text included, read back from its labeled file."""
+        try:
+            return read_record(record["source"], record["line"])
+        except (OSError, ValueError):
+            return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the topic index over data/labeled.")
+    parser.add_argument("--rebuild", action="store_true", help="drop the index and rebuild it from scratch")
+    parser.add_argument("--labeled-dir", default=LABELED_DIR)
+    args = parser.parse_args()
+
+    index = TopicIndex()
+    if args.rebuild:
+        count = index.rebuild(args.labeled_dir)
+    else:
+        count = index.sync(args.labeled_dir)
+    print(f"[✓] Indexed {count} files, {len(index.topics())} topic names.")
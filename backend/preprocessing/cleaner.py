@@ -1,6 +1,109 @@
-import re
+import unicodedata
 
-def clean_text(text):
-    text = re.sub(r'\s+', ' ', text)
-    text = re.sub(r'[^a-zA-Z0-9.,;!?()\[\]\-\'\"\n ]', '', text)
-    return text.strip()
+# Which characters survive cleaning:
+#   "letters": letters, marks and digits in any script, plus punctuation
+#   "ascii":   ASCII letters, digits and .,;!?()[]-'" only (the original behaviour)
+KEEP = "letters"
+# Unicode normalization applied before the table ("NFKC", "NFC", ... or None)
+NORMALIZE = "NFKC"
+# Strip control, format and unassigned code points
+STRIP_CONTROL = True
+KEEP_POLICIES = ["letters", "ascii"]
+
+ASCII_KEPT = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789.,;!?()[]-'\"")
+
+# Large texts are read and cleaned this many characters at a time
+SEGMENT_CHARS = 1 << 16
+
+
+class CleaningTable(dict):
+    """
+    str.translate table that decides what to do with a code point the first
+    time it is seen and remembers it: whitespace becomes a space, kept
+    characters map to themselves and everything else is deleted.
+    """
+
+    def __init__(self, keep=KEEP, strip_control=STRIP_CONTROL):
+        super().__init__()
+        if keep not in KEEP_POLICIES:
+            raise ValueError(f"Unknown keep policy {keep!r}; choose from {', '.join(KEEP_POLICIES)}.")
+        self.keep = keep
+        self.strip_control = strip_control
+
+    def __missing__(self, codepoint):
+        ch = chr(codepoint)
+        category = unicodedata.category(ch)
+        if ch.isspace():
+            value = " "
+        elif self.keep == "ascii":
+            value = ch if ch in ASCII_KEPT else None
+        elif category[0] in "LMNP":
+            value = ch
+        elif category[0] == "C":
+            value = None if self.strip_control else ch
+        else:
+            # Symbols: emoji, math, box drawing, ...
+            value = None
+        self[codepoint] = value
+        return value
+
+
+tables = {}
+
+
+def get_table(keep=KEEP, strip_control=STRIP_CONTROL):
+    key = (keep, strip_control)
+    if key not in tables:
+        tables[key] = CleaningTable(keep, strip_control)
+    return tables[key]
+
+
+def clean_text(text, keep=KEEP, normalize=NORMALIZE, strip_control=STRIP_CONTROL):
+    """Normalizes the text, drops unwanted characters and collapses whitespace, in one translate pass."""
+    if normalize and not text.isascii():
+        text = unicodedata.normalize(normalize, text)
+    return " ".join(text.translate(get_table(keep, strip_control)).split())
+
+
+def clean_pages(pages, **policy):
+    """Cleans a stream of (page_number, text) pairs, dropping pages left empty."""
+    for page_number, text in pages:
+        cleaned = clean_text(text, **policy)
+        if cleaned:
+            yield page_number, cleaned
+
+
+def clean_segments(segments, **policy):
+    """
+    Cleans a stream of text pieces of a single document (e.g. blocks of a
+    large transcript), yielding cleaned pieces that join with "" into the
+    same text clean_text would give for the whole document. Only one piece
+    is held in memory at a time. Pieces should be cut at whitespace so that
+    normalization never sees half a character sequence.
+    """
+    need_space = False
+    for segment in segments:
+        cleaned = clean_text(segment, **policy)
+        if not cleaned:
+            continue
+        yield (" " if need_space else "") + cleaned
+        need_space = True
+
+
+def iter_file_segments(path, segment_chars=SEGMENT_CHARS):
+    """Reads a text file in pieces of about segment_chars characters, cut at whitespace."""
+    carry = ""
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        while True:
+            block = f.read(segment_chars)
+            if not block:
+                break
+            block = carry + block
+            cut = max(block.rfind(" "), block.rfind("\n"))
+            if cut <= 0:
+                carry = block
+                continue
+            carry = block[cut:]
+            yield block[:cut]
+    if carry:
+        yield carry
@@ -1,24 +1,44 @@
 import re
 
-def extract_sections(text):
-    headers = ["Abstract", "Introduction", "Background", "Related Work", "Method", "Methodology",
-               "Results", "Evaluation", "Discussion", "Conclusion", "References"]
+SECTION_HEADERS = ["Abstract", "Introduction", "Background", "Related Work", "Method", "Methodology",
+                   "Results", "Evaluation", "Discussion", "Conclusion", "References"]
+
+# Section numbering that may precede a header, e.g. "2", "3.1.", "IV."
+NUMBERING = re.compile(r"(?:\d+(?:\.\d+)*\.?|[IVX]+\.)$")
+
+def find_headers(text, strict=False):
+    """
+    Returns (name, start, end) for every section header in the text, in order.
+    By default any occurrence of a header word counts. With strict=True the
+    word must also look like a heading: capitalized, at the start of a line,
+    after a sentence or after section numbering, and followed by a new line
+    or a capitalized word. Running prose like "the results show" is skipped.
+    """
+    pattern = '|'.join([fr"(?P<{h.lower().replace(' ', '_')}>{h})" for h in SECTION_HEADERS])
+    regex = re.compile(fr"\b({pattern})\b", 0 if strict else re.IGNORECASE)
 
+    headers = []
+    for match in regex.finditer(text):
+        if strict:
+            before = text[max(0, match.start() - 12):match.start()].rstrip(" \t")
+            after = text[match.end():match.end() + 2].lstrip(" \t")
+            starts_line = before == "" or before.endswith(("\n", ".", "!", "?", ":")) or NUMBERING.search((before.split() or [""])[-1])
+            ends_heading = after == "" or after[0] in ":\n" or after[0].isupper() or after[0].isdigit()
+            if not (starts_line and ends_heading):
+                continue
+        headers.append((match.group(1).strip(), match.start(), match.end()))
+    return headers
+
+def extract_sections(text):
     # Normalize and clean text
     clean = re.sub(r'\n+', '\n', text)
     clean = clean.replace('\r', '')
     section_map = {}
 
-    # Build combined regex pattern
-    pattern = '|'.join([fr"(?P<{h.lower().replace(' ', '_')}>{h})" for h in headers])
-    regex = re.compile(fr"\b({pattern})\b", re.IGNORECASE)
-
     # Find all section headers
-    matches = list(regex.finditer(clean))
-    for i, match in enumerate(matches):
-        start = match.end()
-        end = matches[i + 1].start() if i + 1 < len(matches) else len(clean)
-        section_name = match.group(1).strip().lower()
-        section_map[section_name] = clean[start:end].strip()
+    matches = find_headers(clean)
+    for i, (name, _, end) in enumerate(matches):
+        section_end = matches[i + 1][1] if i + 1 < len(matches) else len(clean)
+        section_map[name.lower()] = clean[end:section_end].strip()
 
     return section_map
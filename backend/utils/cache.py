@@ -0,0 +1,122 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/cache"))
+
+
+def make_key(*parts):
+    """Builds a content address from the given string parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SQLiteCache:
+    """
+    A persistent key/value cache stored in a single SQLite file.
+    Values are strings or bytes; once the stored values exceed max_bytes the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """Looks up several keys at once. Returns a dict with the keys that were found."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE entries SET last_access = ? WHERE key = ?", [(now, k) for k in found]
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, key, value):
+        self.put_many({key: value})
+
+    def put_many(self, items):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            for key, value in items.items():
+                size = len(value) if isinstance(value, bytes) else len(value.encode("utf-8"))
+                old = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+                if old:
+                    self._size -= old[0]
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, value, size, now),
+                )
+                self._size += size
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self._size <= self.max_bytes:
+            return
+        evicted = 0
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY last_access")
+        doomed = []
+        for key, size in rows:
+            if self._size <= self.max_bytes:
+                break
+            doomed.append((key,))
+            self._size -= size
+            evicted += 1
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+        print(f"[INFO] Evicted {evicted} entries from {os.path.basename(self.path)}.")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
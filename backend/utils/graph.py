@@ -1,60 +1,234 @@
 import json
 import os
+import threading
 
-print("[DEBUG] ✅ using UPDATED graph.py")
+try:
+    import orjson
+except ImportError:  # optional: faster, compact (de)serialization
+    orjson = None
+
+from utils.file_utils import atomic_write, file_lock
+
+# Fold the delta log into the snapshot once it holds this many entries
+COMPACT_EVERY = 50
+
+
+def dumps(obj):
+    """Compact JSON bytes, via orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class GraphStore:
+    """
+    The mind-map graph stored as a snapshot (graph_path) plus an append-only
+    delta log (graph_path + ".log"). Every update appends one delta line under
+    a cross-process file lock; the log is periodically compacted into a new
+    snapshot that atomically replaces the old one.
+
+    Deltas carry a sequence number and the snapshot records the last sequence
+    it contains, so a reader that catches a compaction half-way never applies
+    a delta twice. A delta adds nodes and links and may remove nodes (with
+    their links) first; nodes and links are kept in dicts by id, so applying
+    a delta costs O(delta), not O(graph).
+
+    Nodes are typed and point to their "parent" (see graph.mindmap_builder).
+    A parent left without children is removed with them. Untyped nodes are
+    from graphs built before the hierarchy; they and their links are dropped
+    on load, and the next append writes the graph back without them.
+    """
+
+    def __init__(self, graph_path):
+        self.graph_path = graph_path
+        self.log_path = graph_path + ".log"
+        self._lock = threading.Lock()
+        self._nodes = {}  # id -> node
+        self._links = {}  # (source, target) -> link
+        self._node_links = {}  # id -> keys of the links touching it
+        self._doc_nodes = {}  # document -> ids of the nodes it owns (nodes with a "doc" field)
+        self._children = {}  # id -> ids of the nodes whose "parent" it is
+        self._untyped = 0  # untyped nodes dropped since the last snapshot was written
+        self._seq = 0
+        self._snapshot_sig = None
+        self._log_offset = 0
+        self._serialized = None
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.graph_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _apply(self, delta):
+        for node_id in delta.get("remove", []):
+            node = self._nodes.pop(node_id, None)
+            if node is not None:
+                self._doc_nodes.get(node.get("doc"), set()).discard(node_id)
+                self._children.get(node.get("parent"), set()).discard(node_id)
+                for key in self._node_links.pop(node_id, ()):
+                    self._links.pop(key, None)
+                    other = key[1] if key[0] == node_id else key[0]
+                    self._node_links.get(other, set()).discard(key)
+        for node in delta.get("nodes", []):
+            if "type" not in node:
+                self._untyped += 1
+                continue
+            if node["id"] not in self._nodes:
+                self._nodes[node["id"]] = node
+                if "doc" in node:
+                    self._doc_nodes.setdefault(node["doc"], set()).add(node["id"])
+                if node.get("parent") is not None:
+                    self._children.setdefault(node["parent"], set()).add(node["id"])
+        for link in delta.get("links", []):
+            key = (link["source"], link["target"])
+            if key[0] not in self._nodes or key[1] not in self._nodes:
+                continue  # a link of a dropped untyped node
+            if key not in self._links:
+                self._links[key] = link
+                self._node_links.setdefault(key[0], set()).add(key)
+                self._node_links.setdefault(key[1], set()).add(key)
+        self._seq = delta.get("seq", self._seq)
+        self._serialized = None
+
+    def _refresh(self):
+        """Brings the in-memory graph up to date with the snapshot and the log."""
+        sig = self._signature()
+        if sig != self._snapshot_sig:
+            self._nodes, self._links, self._node_links, self._doc_nodes, self._seq = {}, {}, {}, {}, 0
+            self._children, self._untyped = {}, 0
+            if sig is not None:
+                with open(self.graph_path, "rb") as f:
+                    graph = loads(f.read())
+                self._apply({"nodes": graph.get("nodes", []), "links": graph.get("links", []),
+                             "seq": graph.get("seq", 0)})
+            self._snapshot_sig = sig
+            self._log_offset = 0
+            self._serialized = None
+
+        if not os.path.exists(self.log_path):
+            return
+        if os.path.getsize(self.log_path) < self._log_offset:
+            # The log was truncated by a compaction we have not seen yet
+            self._snapshot_sig = None
+            return self._refresh()
+        with open(self.log_path, "rb") as f:
+            f.seek(self._log_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # a writer is still appending this line
+                self._log_offset += len(line)
+                delta = loads(line)
+                if delta.get("seq", 0) > self._seq:
+                    self._apply(delta)
+
+    def _orphaned(self, remove, nodes):
+        """Parents that have no children left once remove is applied and nodes are added, bottom up."""
+        removed = set(remove)
+        parents = {node.get("parent") for node in nodes}
+        orphaned, candidates = [], [self._nodes[node_id].get("parent") for node_id in remove]
+        while candidates:
+            parent = candidates.pop()
+            if parent is None or parent in removed or parent in parents or parent not in self._nodes:
+                continue
+            if self._children.get(parent, set()) <= removed:
+                removed.add(parent)
+                orphaned.append(parent)
+                candidates.append(self._nodes[parent].get("parent"))
+        return orphaned
+
+    def _log_entries(self):
+        if not os.path.exists(self.log_path):
+            return 0
+        with open(self.log_path, "rb") as f:
+            return sum(1 for _ in f)
+
+    def append(self, nodes, links, document=None):
+        """
+        Appends a delta and returns the total node count. Nodes and links
+        already in the graph are left out of the delta. With document, the
+        nodes that document owned before and no longer has (or has changed)
+        are removed, so re-ingesting a document replaces its nodes, and so are
+        parents left without children.
+        """
+        with self._lock, file_lock(self.graph_path):
+            self._refresh()
+            remove = []
+            if document is not None:
+                new_nodes = {node["id"]: node for node in nodes}
+                remove = [node_id for node_id in self._doc_nodes.get(document, ())
+                          if new_nodes.get(node_id) != self._nodes[node_id]]
+                remove += self._orphaned(remove, nodes)
+            removed = set(remove)
+            nodes = [node for node in nodes if node["id"] not in self._nodes or node["id"] in removed]
+            links = [link for link in links if (link["source"], link["target"]) not in self._links
+                     or link["source"] in removed or link["target"] in removed]
+            if not (nodes or links or remove):
+                if self._untyped:
+                    self._compact()
+                return len(self._nodes)
+            delta = {"seq": self._seq + 1, "nodes": nodes, "links": links}
+            if remove:
+                delta["remove"] = remove
+            line = dumps(delta) + b"\n"
+            with open(self.log_path, "ab") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._refresh()
+            if self._log_entries() >= COMPACT_EVERY or self._untyped:
+                self._compact()
+            return len(self._nodes)
+
+    def compact(self):
+        with self._lock, file_lock(self.graph_path):
+            self._refresh()
+            self._compact()
+
+    def _compact(self):
+        # Called with both locks held and the in-memory graph up to date
+        graph = {"nodes": list(self._nodes.values()), "links": list(self._links.values()), "seq": self._seq}
+        atomic_write(self.graph_path, dumps(graph))
+        with open(self.log_path, "wb"):
+            pass
+        if self._untyped:
+            print(f"[INFO] Dropped {self._untyped} untyped nodes left by an older graph format.")
+            self._untyped = 0
+        self._snapshot_sig = self._signature()
+        self._log_offset = 0
+        print(f"[✓] Compacted graph log into {self.graph_path}")
+
+    def node_count(self):
+        with self._lock, file_lock(self.graph_path):
+            self._refresh()
+            return len(self._nodes)
+
+    def to_json_bytes(self):
+        """Returns the materialized graph as compact JSON, re-serialized only after it changes."""
+        with self._lock, file_lock(self.graph_path):
+            self._refresh()
+            if self._serialized is None:
+                self._serialized = dumps({"nodes": list(self._nodes.values()), "links": list(self._links.values())})
+            return self._serialized
+
+
+_stores = {}
+
+
+def get_graph_store(graph_path):
+    graph_path = os.path.abspath(graph_path)
+    if graph_path not in _stores:
+        _stores[graph_path] = GraphStore(graph_path)
+    return _stores[graph_path]
 
 
 def update_graph(labeled_path, graph_path):
-    nodes = []
-    links = []
-
-    # Load existing graph if it exists
-    if os.path.exists(graph_path):
-        with open(graph_path, "r", encoding="utf-8") as f:
-            graph = json.load(f)
-            nodes = graph.get("nodes", [])
-            links = graph.get("links", [])
-
-    existing_labels = {node["id"] for node in nodes}
-    new_nodes = []
-
-    # Read labeled .jsonl file
-    with open(labeled_path, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                obj = json.loads(line)
-                label = obj.get("label", "").strip()
-                text = obj.get("text", "").strip()
-
-                if not label or not text:
-                    continue
-
-                if label not in existing_labels:
-                    node = {
-                        "id": label,
-                        "title": label,
-                        "summary": text[:200] + "..." if len(text) > 200 else text
-                    }
-                    nodes.append(node)
-                    new_nodes.append(node)
-                    existing_labels.add(label)
-
-            except Exception as e:
-                print(f"[✗] Failed to parse line: {e}")
-
-    # Link only newly added nodes linearly
-    for i in range(1, len(new_nodes)):
-        links.append({
-            "source": new_nodes[i - 1]["id"],
-            "target": new_nodes[i]["id"]
-        })
-
-    # Save updated graph
-    graph = {
-        "nodes": nodes,
-        "links": links
-    }
-    with open(graph_path, "w", encoding="utf-8") as f:
-        json.dump(graph, f, indent=2)
-
-    print(f"[✓] Saved graph with {len(nodes)} nodes and {len(links)} links → {graph_path}")
+    """Merges one labeled document into the global mind-map graph; see graph.mindmap_builder."""
+    from graph.mindmap_builder import merge_labeled_file
+
+    return merge_labeled_file(labeled_path, graph_path)
@@ -406,12 +406,15 @@ function addResource() {
   })
     .then((res) => res.json())
     .then((data) => {
-      alert("✅ Resource added: " + (data.filename || data.link));
-
+      if (!data.job_id) throw new Error(data.message || "Ingest failed");
+      alert("✅ Resource queued: " + (data.filename || data.link));
+      return waitForJob(data.job_id);
+    })
+    .then((job) => {
       // Display the summary (if returned)
-      if (data.summary) {
+      if (job.result && job.result.summary) {
         const summaryBox = document.getElementById("topicSummary");
-        summaryBox.innerText = data.summary;
+        summaryBox.innerText = job.result.summary;
         summaryBox.scrollIntoView({ behavior: "smooth" });
       } else {
         alert("No summary available for this resource.");
@@ -422,3 +425,16 @@ function addResource() {
       alert("❌ Failed to add resource");
     });
 }
+
+// Polls an ingestion job until it has finished or failed
+async function waitForJob(jobId, intervalMs = 2000) {
+  while (true) {
+    const res = await fetch(`http://localhost:5000/api/jobs/${jobId}`);
+    const job = await res.json();
+    if (job.status === "done") return job;
+    if (job.status === "failed" || !res.ok)
+      throw new Error(job.error || job.message || "Job failed");
+    console.log(`[⏳] Job ${jobId}: ${job.stage || job.status} ${job.progress}/${job.total}`);
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+}